@@ -0,0 +1,122 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+# --------------------------------------------------
+# MICRO-BATCHING FOR N-ATLaS
+# --------------------------------------------------
+# Shipped into the Modal image next to modal_atlas.py. Kept free of torch and
+# modal imports so it can be exercised on a laptop with a stand-in model.
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and hands them to `run_batch`
+    together.
+
+    A batch is closed as soon as it holds `max_batch_size` items or
+    `max_wait` seconds have passed since its first item arrived, whichever
+    comes first. `run_batch` gets a list of items and must return a list of
+    results in the same order; each submitter gets back its own result (or
+    the exception the batch raised).
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8, max_wait: float = 0.02):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Queue `item` and block until its batch has run."""
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout)
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect(self, first) -> tuple:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _loop(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect(first)
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+            futures = [future for _, future in batch]
+            try:
+                results = self.run_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "mean_batch": self.items / self.batches if self.batches else 0.0,
+        }
+
+
+def generate_batch(tokenizer, model, prompts: List[str], **generate_kwargs) -> List[Tuple[str, int]]:
+    """
+    Left-pads `prompts` into one tensor batch, decodes them together and
+    returns only the newly generated text for each prompt, with the number
+    of tokens generated for it (padding and EOS excluded).
+    """
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # Decoder-only models need the padding on the left so every row's
+    # continuation starts at the same position
+    tokenizer.padding_side = "left"
+
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    outputs = model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **generate_kwargs)
+
+    prompt_len = inputs["input_ids"].shape[1]
+    skip = {tokenizer.pad_token_id, tokenizer.eos_token_id}
+    results = []
+    for row in outputs:
+        new_tokens = row[prompt_len:]
+        generated = sum(1 for t in new_tokens if int(t) not in skip)
+        results.append((tokenizer.decode(new_tokens, skip_special_tokens=True), generated))
+    return results
@@ -0,0 +1,141 @@
+import copy
+import time
+from typing import List, Sequence, Tuple
+
+# --------------------------------------------------
+# PREFIX KV-CACHE FOR THE N-ATLaS SYSTEM PROMPT
+# --------------------------------------------------
+# Shipped into the Modal image next to modal_atlas.py. torch is imported
+# lazily so the module can be imported without it.
+
+# Placeholder user turn used to find where the fixed part of the prompt ends
+_SENTINEL = "DARA_USER_TURN"
+
+
+def split_chat_prompt(tokenizer, system_prompt: str) -> Tuple[str, str]:
+    """
+    Renders the chat template around a placeholder user turn and splits it,
+    giving (prefix, tail) such that the full prompt for a transcript is
+    prefix + transcript + tail.
+    """
+    rendered = tokenizer.apply_chat_template(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": _SENTINEL},
+        ],
+        tokenize=False,
+        add_generation_prompt=True,
+    )
+    prefix, tail = rendered.split(_SENTINEL)
+    return prefix, tail
+
+
+class PrefixCache:
+    """
+    Token ids and past-key-values of a fixed prompt prefix, computed once.
+    Each request gets its own copy of the cache, since generate() appends to it.
+    """
+
+    def __init__(self, tokenizer, model, prefix_text: str):
+        import torch
+
+        # The chat template already contains BOS, don't add another
+        self.ids = tokenizer(prefix_text, return_tensors="pt", add_special_tokens=False)["input_ids"].to(model.device)
+
+        started = time.perf_counter()
+        with torch.no_grad():
+            self.past_key_values = model(input_ids=self.ids, use_cache=True).past_key_values
+        self.build_seconds = time.perf_counter() - started
+
+    def __len__(self) -> int:
+        return self.ids.shape[1]
+
+    def for_batch(self, batch_size: int):
+        cache = copy.deepcopy(self.past_key_values)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+
+class _FirstStepTimer:
+    """
+    Logits processor that only notes when it is first called. generate()
+    calls it right after the prefill forward pass, so this marks the end of
+    prefill and the start of decoding.
+    """
+
+    def __init__(self):
+        self.first_call = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_call is None:
+            self.first_call = time.perf_counter()
+        return scores
+
+
+def count_new_tokens(tokenizer, new_tokens) -> int:
+    """Generated tokens in one output row, not counting padding and EOS."""
+    skip = {tokenizer.pad_token_id, tokenizer.eos_token_id}
+    return sum(1 for t in new_tokens.tolist() if t not in skip)
+
+
+def generate_with_prefix(tokenizer, model, prefix: PrefixCache, suffixes: List[str], logits_processors: Sequence = (), **generate_kwargs) -> List[Tuple[str, dict]]:
+    """
+    Decodes `prefix + suffix` for every suffix in one batch, prefilling only
+    the suffix tokens. Rows are laid out as [prefix][padding][suffix] so the
+    shared prefix stays at the same positions; padding is masked out.
+    `logits_processors` run after the prefill timer on every step.
+
+    Returns (generated_text, stats) per suffix.
+    """
+    import torch
+    from transformers import LogitsProcessorList
+
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    suffix_ids = [tokenizer(s, add_special_tokens=False)["input_ids"] for s in suffixes]
+    width = max(len(ids) for ids in suffix_ids)
+    batch_size = len(suffixes)
+    prefix_len = len(prefix)
+
+    rows, masks = [], []
+    for ids in suffix_ids:
+        pad = width - len(ids)
+        rows.append([pad_id] * pad + ids)
+        masks.append([0] * pad + [1] * len(ids))
+
+    device = model.device
+    input_ids = torch.cat([prefix.ids.expand(batch_size, -1), torch.tensor(rows, device=device)], dim=1)
+    attention_mask = torch.cat(
+        [torch.ones(batch_size, prefix_len, dtype=torch.long, device=device), torch.tensor(masks, device=device)],
+        dim=1,
+    )
+
+    timer = _FirstStepTimer()
+    started = time.perf_counter()
+    outputs = model.generate(
+        input_ids=input_ids,
+        attention_mask=attention_mask,
+        past_key_values=prefix.for_batch(batch_size),
+        pad_token_id=pad_id,
+        logits_processor=LogitsProcessorList([timer, *logits_processors]),
+        **generate_kwargs,
+    )
+    finished = time.perf_counter()
+    prefill = (timer.first_call or finished) - started
+
+    prompt_len = input_ids.shape[1]
+    results = []
+    for row, ids in zip(outputs, suffix_ids):
+        new_tokens = row[prompt_len:]
+        results.append((
+            tokenizer.decode(new_tokens, skip_special_tokens=True),
+            {
+                "prefill_ms": round(prefill * 1000, 1),
+                "decode_ms": round((finished - started - prefill) * 1000, 1),
+                "prompt_tokens": prefix_len + len(ids),
+                "tokens_generated": count_new_tokens(tokenizer, new_tokens),
+                "prefix_tokens_reused": prefix_len,
+                "batch_size": batch_size,
+            },
+        ))
+    return results
@@ -1,43 +1,419 @@
-import subprocess
+import os
+import time
+import struct
 import asyncio
-import io
+import logging
+from collections import namedtuple
+from functools import lru_cache
+from math import gcd
+from typing import Optional, Set
 
-async def convert_to_wav(audio_bytes: bytes) -> bytes:
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import executors
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# FFMPEG_POOL_SIZE     max ffmpeg processes running at once (default: CPU count)
+# FFMPEG_MAX_PENDING   conversions allowed to wait for a slot before we reject (default: 4 x pool)
+# FFMPEG_WARM          pre-spawned idle ffmpeg processes kept ready, per worker process
+#                      (default: 2; most uploads are WAV and never reach ffmpeg)
+# FFMPEG_TIMEOUT       seconds before a conversion is killed
+POOL_SIZE = int(os.getenv("FFMPEG_POOL_SIZE", os.cpu_count() or 2))
+MAX_PENDING = int(os.getenv("FFMPEG_MAX_PENDING", POOL_SIZE * 4))
+WARM_PROCESSES = int(os.getenv("FFMPEG_WARM", min(2, POOL_SIZE)))
+TIMEOUT_SECONDS = float(os.getenv("FFMPEG_TIMEOUT", 30))
+
+TARGET_RATE = 16000
+TARGET_CHANNELS = 1
+TARGET_BITS = 16
+
+FFMPEG_ARGS = ['ffmpeg', '-y', '-i', 'pipe:0', '-ar', '16000', '-ac', '1', '-f', 'wav', 'pipe:1']
+
+_convert_seconds = metrics.summary("audio_convert_seconds", "convert_to_wav wall time")
+_queue_seconds = metrics.summary("audio_convert_queue_seconds", "time spent waiting for an ffmpeg slot")
+_passthrough = metrics.counter("audio_convert_passthrough_total", "inputs already 16 kHz mono PCM")
+_native_runs = metrics.counter("audio_convert_native_total", "WAV inputs converted in-process with NumPy")
+_ffmpeg_runs = metrics.counter("audio_convert_ffmpeg_total", "inputs converted with ffmpeg")
+_rejected = metrics.counter("audio_convert_rejected_total", "conversions refused because the pool was full")
+
+
+class ConversionBusyError(Exception):
+    """Raised when every ffmpeg slot is busy and the wait queue is full."""
+
+
+# --------------------------------------------------
+# WAV HEADER
+# --------------------------------------------------
+WavInfo = namedtuple("WavInfo", "format_tag channels sample_rate bits_per_sample data_offset data_size")
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav_header(data: bytes) -> Optional[WavInfo]:
+    """
+    Reads the RIFF/WAVE `fmt ` and `data` chunk headers.
+    Returns None if `data` isn't a well-formed WAV file.
+    For WAVE_FORMAT_EXTENSIBLE the sub-format tag is reported instead.
+    """
+    if len(data) < 12 or data[0:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        (chunk_size,) = struct.unpack_from("<I", data, pos + 4)
+        body = pos + 8
+
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body + 16 > len(data):
+                return None
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40 and body + 26 <= len(data):
+                (format_tag,) = struct.unpack_from("<H", data, body + 24)
+            fmt = (format_tag, channels, sample_rate, bits)
+
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            # Streaming recorders leave the size as 0 or 0xFFFFFFFF; trust the payload instead
+            size = min(chunk_size, len(data) - body)
+            return WavInfo(*fmt, body, size)
+
+        # Chunks are word aligned
+        pos = body + chunk_size + (chunk_size & 1)
+
+    return None
+
+
+def is_target_pcm(info: Optional[WavInfo]) -> bool:
+    """True if the WAV is already what the STT engines expect (16 kHz, mono, 16-bit PCM)."""
+    return (
+        info is not None
+        and info.format_tag == WAVE_FORMAT_PCM
+        and info.channels == TARGET_CHANNELS
+        and info.sample_rate == TARGET_RATE
+        and info.bits_per_sample == TARGET_BITS
+    )
+
+
+def wav_header(data_size: int, sample_rate: int = TARGET_RATE, channels: int = TARGET_CHANNELS, bits: int = TARGET_BITS) -> bytes:
+    """Canonical 44-byte PCM WAV header."""
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_PCM, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", data_size,
+    )
+
+
+# --------------------------------------------------
+# NATIVE PCM PATH (NUMPY)
+# --------------------------------------------------
+# Resampling filter quality: zero crossings of the windowed sinc on each side
+# of the centre tap, and the Kaiser window shape.
+RESAMPLE_HALF_WIDTH = 12
+RESAMPLE_ROLLOFF = 0.94
+RESAMPLE_KAISER_BETA = 8.0
+
+_PCM_DTYPES = {
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+
+
+def can_decode_natively(info: Optional[WavInfo]) -> bool:
+    return (
+        info is not None
+        and info.channels >= 1
+        and info.sample_rate > 0
+        and ((info.format_tag, info.bits_per_sample) in _PCM_DTYPES
+             or (info.format_tag == WAVE_FORMAT_PCM and info.bits_per_sample in (8, 24)))
+    )
+
+
+def decode_pcm(data, info: WavInfo) -> np.ndarray:
+    """
+    Samples of a PCM/float WAV as float32 in [-1, 1], shape (frames, channels).
+    `data` may be bytes or a memoryview; 16/32-bit and float payloads are
+    read in place with np.frombuffer before the float conversion.
+    """
+    frame_bytes = info.channels * info.bits_per_sample // 8
+    frames = info.data_size // frame_bytes
+    count = frames * info.channels
+    key = (info.format_tag, info.bits_per_sample)
+
+    if key in _PCM_DTYPES:
+        dtype = _PCM_DTYPES[key]
+        raw = np.frombuffer(data, dtype=dtype, count=count, offset=info.data_offset)
+        if dtype.kind == "f":
+            samples = raw.astype(np.float32, copy=False)
+        else:
+            samples = raw.astype(np.float32) * np.float32(1.0 / (1 << (info.bits_per_sample - 1)))
+
+    elif info.bits_per_sample == 8:
+        # 8-bit WAV is unsigned with a 128 offset
+        raw = np.frombuffer(data, dtype=np.uint8, count=count, offset=info.data_offset)
+        samples = (raw.astype(np.float32) - 128.0) * np.float32(1.0 / 128)
+
+    else:
+        # 24-bit: assemble little-endian triplets into the top of an int32
+        raw = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=info.data_offset).reshape(-1, 3)
+        wide = (raw[:, 0].astype(np.int32) << 8) | (raw[:, 1].astype(np.int32) << 16) | (raw[:, 2].astype(np.int32) << 24)
+        samples = wide.astype(np.float32) * np.float32(1.0 / (1 << 31))
+
+    return samples.reshape(frames, info.channels)
+
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    """(frames, channels) -> (frames,) by averaging channels."""
+    channels = samples.shape[1]
+    if channels == 1:
+        return samples[:, 0]
+    # Matrix-vector product is much faster than mean(axis=1) on interleaved frames
+    return samples @ np.full(channels, 1.0 / channels, dtype=np.float32)
+
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int) -> tuple:
+    """
+    Kaiser-windowed sinc low-pass for resampling by up/down, split into `up`
+    phases of `taps` coefficients each. Returns (phases, taps, centre).
+    """
+    span = max(up, down)
+    half = RESAMPLE_HALF_WIDTH * span
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    h = RESAMPLE_ROLLOFF * up / span * np.sinc(RESAMPLE_ROLLOFF * n / span)
+    h *= np.kaiser(len(n), RESAMPLE_KAISER_BETA)
+
+    taps = -(-len(h) // up)
+    padded = np.zeros(taps * up)
+    padded[:len(h)] = h
+    # Row p holds phase p's coefficients in input order: column k multiplies
+    # input sample (base - taps + 1 + k)
+    phases = padded.reshape(taps, up).T[:, ::-1].astype(np.float32)
+    return np.ascontiguousarray(phases), taps, half
+
+
+def resample(x: np.ndarray, src_rate: int, dst_rate: int = TARGET_RATE) -> np.ndarray:
     """
-    Converts input audio bytes (mp3, mp4, wav, m4a) to 16kHz mono WAV using ffmpeg.
-    
-    Async wrapper for non-blocking execution.
+    Rational polyphase resampling of a mono float32 signal.
+
+    Equivalent to zero-stuffing by `up`, low-pass filtering and keeping every
+    `down`-th sample, but each output sample only touches the `taps` input
+    samples that can contribute to it. Outputs m, m+up, m+2*up... share a
+    filter phase and read input windows `down` samples apart, so each phase
+    is one matrix-vector product over a strided (zero-copy) window view.
     """
-    def _sync_convert(data: bytes) -> bytes:
+    if src_rate == dst_rate or len(x) == 0:
+        return x
+
+    g = gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    phases, taps, centre = _polyphase_filter(up, down)
+
+    n_out = -(-len(x) * up // down)
+    # Pad so every window is in range
+    xpad = np.concatenate((np.zeros(taps, np.float32), x.astype(np.float32, copy=False), np.zeros(taps, np.float32)))
+    windows = sliding_window_view(xpad, taps)
+    out = np.empty(n_out, dtype=np.float32)
+
+    for r in range(min(up, n_out)):
+        t = r * down + centre
+        base = t // up
+        phase = t - base * up
+        count = len(range(r, n_out, up))
+        out[r::up] = windows[base + 1::down][:count] @ phases[phase]
+
+    return out
+
+
+def encode_pcm16(x: np.ndarray, sample_rate: int = TARGET_RATE) -> bytes:
+    """Mono float32 samples -> 16-bit PCM WAV bytes."""
+    pcm = np.clip(x * 32768.0, -32768, 32767).astype("<i2")
+    return wav_header(pcm.nbytes, sample_rate) + pcm.tobytes()
+
+
+def convert_pcm_native(audio_bytes: bytes, info: WavInfo) -> bytes:
+    """Decode, downmix and resample a PCM/float WAV to 16kHz mono 16-bit WAV."""
+    samples = downmix(decode_pcm(memoryview(audio_bytes), info))
+    return encode_pcm16(resample(samples, info.sample_rate))
+
+
+# --------------------------------------------------
+# FFMPEG POOL
+# --------------------------------------------------
+class FFmpegPool:
+    """
+    Bounded ffmpeg runner.
+
+    At most `size` conversions run at once and at most `max_pending` wait for
+    a slot; beyond that ConversionBusyError is raised so callers can shed load.
+    `warm` ffmpeg processes are spawned ahead of time and sit blocked on
+    stdin, so a request only pays for the decode, not for process start-up.
+    """
+
+    def __init__(self, size: int, max_pending: int, warm: int, timeout: float):
+        self.size = max(1, size)
+        self.max_pending = max(0, max_pending)
+        self.warm = max(0, warm)
+        self.timeout = timeout
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._spares: list = []
+        self._loop = None
+        self._active = 0
+        self._waiting = 0
+        self._replenishing = False
+        # Strong references, so a running replenish isn't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+        metrics.gauge("audio_convert_active", "ffmpeg conversions running", fn=lambda: self._active)
+        metrics.gauge("audio_convert_waiting", "conversions queued for an ffmpeg slot", fn=lambda: self._waiting)
+
+    def _bind_loop(self):
+        # asyncio primitives and subprocess transports belong to one event loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            for proc in self._spares:
+                if proc.returncode is None:
+                    proc.kill()
+            self._spares = []
+            self._slots = asyncio.Semaphore(self.size)
+            self._loop = loop
+
+    async def _spawn(self):
+        return await asyncio.create_subprocess_exec(
+            *FFMPEG_ARGS,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+    async def _replenish(self):
+        if self._replenishing:
+            return
+        self._replenishing = True
         try:
-            # Run ffmpeg command
-            # -i pipe:0  : Read from stdin
-            # -ar 16000  : Sample rate 16kHz
-            # -ac 1      : Mono channel
-            # -f wav     : Output format WAV
-            # pipe:1     : Write to stdout
-            
-            args = ['ffmpeg', '-y', '-i', 'pipe:0', '-ar', '16000', '-ac', '1', '-f', 'wav', 'pipe:1']
-            
-            process = subprocess.Popen(
-                args,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            out, err = process.communicate(input=data)
-            
-            if process.returncode != 0:
-                error_msg = err.decode('utf-8')
+            while len(self._spares) < self.warm:
+                self._spares.append(await self._spawn())
+        except Exception as e:
+            logger.warning(f"Could not pre-spawn ffmpeg: {e}")
+        finally:
+            self._replenishing = False
+
+    async def _take_process(self):
+        while self._spares:
+            proc = self._spares.pop()
+            if proc.returncode is None:
+                break
+        else:
+            proc = await self._spawn()
+
+        if self.warm:
+            task = asyncio.create_task(self._replenish())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return proc
+
+    async def convert(self, data: bytes) -> bytes:
+        self._bind_loop()
+
+        if self._active >= self.size and self._waiting >= self.max_pending:
+            _rejected.inc()
+            raise ConversionBusyError("Audio conversion queue is full, try again shortly.")
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        _queue_seconds.observe(time.perf_counter() - queued_at)
+
+        self._active += 1
+        try:
+            try:
+                proc = await self._take_process()
+            except FileNotFoundError:
+                raise ValueError("ffmpeg is not installed or not in PATH.")
+
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(input=data), self.timeout)
+            except asyncio.TimeoutError:
+                raise ValueError(f"FFmpeg conversion timed out after {self.timeout:.0f}s")
+            finally:
+                # Timed out, or the request was cancelled: don't leave the child behind
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+
+            if proc.returncode != 0:
+                error_msg = err.decode('utf-8', errors='replace')
                 raise ValueError(f"FFmpeg conversion failed: {error_msg}")
-                
+
+            _ffmpeg_runs.inc()
             return out
+        finally:
+            self._active -= 1
+            self._slots.release()
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for proc in self._spares:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        self._spares = []
 
+
+ffmpeg_pool = FFmpegPool(POOL_SIZE, MAX_PENDING, WARM_PROCESSES, TIMEOUT_SECONDS)
+
+
+async def convert_to_wav(audio_bytes: bytes) -> bytes:
+    """
+    Converts input audio bytes (mp3, mp4, wav, m4a) to 16kHz mono WAV.
+
+    WAV input that is already 16kHz mono 16-bit PCM is returned untouched,
+    other PCM/float WAV is converted in-process with NumPy, and compressed
+    formats go through the bounded ffmpeg pool.
+    Raises ConversionBusyError when the pool is saturated.
+    """
+    started = time.perf_counter()
+    try:
+        info = parse_wav_header(audio_bytes)
+        if is_target_pcm(info):
+            _passthrough.inc()
+            return audio_bytes
+
+        if can_decode_natively(info):
+            try:
+                out = await executors.audio.run(convert_pcm_native, audio_bytes, info)
+                _native_runs.inc()
+                return out
+            except Exception as e:
+                # Truncated or odd files: let ffmpeg have a go
+                logger.warning(f"Native WAV conversion failed, using ffmpeg: {e}")
+
+        try:
+            return await ffmpeg_pool.convert(audio_bytes)
+        except (ValueError, ConversionBusyError):
+            raise
         except Exception as e:
-            if isinstance(e, FileNotFoundError):
-                 raise ValueError("ffmpeg is not installed or not in PATH.")
             raise ValueError(f"Error converting audio: {str(e)}")
-
-    # Run blocking sync function in a thread
-    return await asyncio.to_thread(_sync_convert, audio_bytes)
+    finally:
+        elapsed = time.perf_counter() - started
+        _convert_seconds.observe(elapsed)
+        logger.info(f"convert_to_wav: {len(audio_bytes)} bytes in {elapsed * 1000:.1f}ms")
@@ -0,0 +1,70 @@
+"""
+Compares the in-process NumPy WAV path against ffmpeg for typical uploads.
+
+    python bench_audio.py [repeats]
+
+Clips are synthetic speech-band noise at the sample rates our clients send.
+"""
+import sys
+import time
+import shutil
+import asyncio
+import statistics
+
+import numpy as np
+
+import audio_utils
+
+DURATIONS = [1, 5, 15, 30, 60]  # seconds
+SOURCES = [
+    ("44.1k stereo", 44100, 2),
+    ("48k mono", 48000, 1),
+    ("16k stereo", 16000, 2),
+]
+
+
+def make_wav(seconds: int, rate: int, channels: int) -> bytes:
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(seconds * rate * channels) * 4000).clip(-32768, 32767).astype("<i2")
+    return audio_utils.wav_header(samples.nbytes, rate, channels) + samples.tobytes()
+
+
+def time_native(data: bytes, repeats: int) -> float:
+    info = audio_utils.parse_wav_header(data)
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        audio_utils.convert_pcm_native(data, info)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def time_ffmpeg(data: bytes, repeats: int) -> float:
+    async def run():
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            await audio_utils.ffmpeg_pool.convert(data)
+            runs.append(time.perf_counter() - start)
+        await audio_utils.ffmpeg_pool.close()
+        return statistics.median(runs)
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    have_ffmpeg = shutil.which("ffmpeg") is not None
+    if not have_ffmpeg:
+        print("ffmpeg not found in PATH, only timing the native path\n")
+
+    print(f"{'source':<14}{'clip':>6}{'native ms':>12}{'ffmpeg ms':>12}{'speedup':>10}")
+    for label, rate, channels in SOURCES:
+        for seconds in DURATIONS:
+            data = make_wav(seconds, rate, channels)
+            native = time_native(data, repeats) * 1000
+            if have_ffmpeg:
+                ffmpeg = time_ffmpeg(data, repeats) * 1000
+                print(f"{label:<14}{seconds:>5}s{native:>12.2f}{ffmpeg:>12.2f}{ffmpeg / native:>9.1f}x")
+            else:
+                print(f"{label:<14}{seconds:>5}s{native:>12.2f}{'-':>12}{'-':>10}")
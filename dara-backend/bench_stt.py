@@ -0,0 +1,92 @@
+"""
+Compares the real-time factor (processing time / audio duration) of the
+local faster-whisper engine against the OpenAI Whisper API.
+
+    python bench_stt.py clip.wav [clip2.wav ...] [--repeats N]
+
+Clips go through convert_to_wav first, like in the backend, and each is also
+tiled to 15 s and 30 s to show how both paths scale with length. The API
+column needs OPENAI_API_KEY; the local one needs faster-whisper installed.
+"""
+import sys
+import time
+import asyncio
+import statistics
+
+import numpy as np
+
+import audio_utils
+import executors
+import http_clients
+import stt_local
+import stt_whisper
+
+LENGTHS = [None, 15, 30]  # None = the clip as recorded
+
+
+def tile(wav: bytes, seconds: int) -> bytes:
+    info = audio_utils.parse_wav_header(wav)
+    pcm = np.frombuffer(wav, dtype="<i2", count=info.data_size // 2, offset=info.data_offset)
+    reps = -(-seconds * audio_utils.TARGET_RATE // len(pcm))
+    out = np.tile(pcm, reps)[:seconds * audio_utils.TARGET_RATE]
+    return audio_utils.wav_header(out.nbytes) + out.tobytes()
+
+
+def duration(wav: bytes) -> float:
+    return audio_utils.parse_wav_header(wav).data_size / 2 / audio_utils.TARGET_RATE
+
+
+async def median_seconds(transcribe, wav: bytes, repeats: int):
+    runs, text = [], ""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text, _ = await transcribe(wav)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), text
+
+
+async def main(paths, repeats: int):
+    engines = []
+    if stt_local.AVAILABLE:
+        print(f"Loading local model '{stt_local.MODEL}' ({stt_local.COMPUTE_TYPE})...")
+        await executors.io.run(stt_local.load)
+        engines.append(("local", stt_local.transcribe))
+    else:
+        print("faster-whisper not installed, skipping the local engine")
+    if stt_whisper.OPENAI_API_KEY:
+        engines.append(("api", stt_whisper.transcribe))
+    else:
+        print("OPENAI_API_KEY not set, skipping the API engine")
+    if not engines:
+        return
+
+    header = f"{'clip':<28}{'audio s':>8}" + "".join(f"{name + ' s':>10}{name + ' RTF':>10}" for name, _ in engines)
+    print(header)
+    for path in paths:
+        with open(path, "rb") as f:
+            wav = await audio_utils.convert_to_wav(f.read())
+        for length in LENGTHS:
+            clip = wav if length is None else tile(wav, length)
+            seconds = duration(clip)
+            row = f"{path[-28:]:<28}{seconds:>8.1f}"
+            for name, transcribe in engines:
+                elapsed, _ = await median_seconds(transcribe, clip, repeats)
+                row += f"{elapsed:>10.2f}{elapsed / seconds:>10.2f}"
+            print(row)
+
+    await http_clients.shutdown()
+    await audio_utils.ffmpeg_pool.close()
+    executors.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    repeats = 3
+    if "--repeats" in args:
+        i = args.index("--repeats")
+        repeats = int(args[i + 1])
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(args, repeats))
@@ -0,0 +1,172 @@
+"""
+Measures /voice throughput as the number of worker processes grows.
+
+    python bench_workers.py [workers ...] [--seconds S] [--concurrency C]
+
+For each worker count (default 1 2 4) the server is started with
+`python main.py --workers N` on a spare port and loaded with C concurrent
+clients for S seconds. The upload is a short synthetic clip, recognized by
+the fake STT engine as "turn on the light" and answered by the fast-path,
+and the reply audio is seeded into the shared TTS cache. So no external
+service is called, and what is measured is the backend's own work: upload
+parsing, WAV conversion, VAD, the pipeline bookkeeping and the base64
+response. The load comes from several client processes, so the client
+isn't the bottleneck.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+
+import httpx
+import numpy as np
+
+import audio_utils
+
+CLIENT_PROCESSES = max(2, (os.cpu_count() or 2) // 2)
+FAKE_REPLY_BYTES = 40_000  # about 5 s of 64 kbps MP3
+
+
+def make_clip(seconds: float = 2.0) -> bytes:
+    """Speech-band noise with silence either side, 16 kHz mono."""
+    rate = audio_utils.TARGET_RATE
+    rng = np.random.default_rng(0)
+    pcm = np.zeros(int(seconds * rate), dtype="<i2")
+    speech = slice(int(0.4 * rate), int((seconds - 0.4) * rate))
+    pcm[speech] = (rng.standard_normal(speech.stop - speech.start) * 4000).clip(-32768, 32767)
+    return audio_utils.wav_header(pcm.nbytes) + pcm.tobytes()
+
+
+def seed_shared_cache(path: str) -> None:
+    """Puts the fast-path reply's audio in the shared TTS cache, as if Spitch had made it."""
+    os.environ["SHARED_CACHE_PATH"] = path
+    import fast_path
+    import tts
+    from schemas import Action, Device
+    from shared_store import SharedStore
+
+    text = fast_path.response_for(Action.TURN_ON, Device.LIGHT, "en")
+    config = tts._voice_config("en")
+    key = tts.cache_key(text, config["language"], config["voice"], tts.AUDIO_FORMAT)
+    SharedStore(path, "tts", 1 << 24, None).set(key, b"ID3" + os.urandom(FAKE_REPLY_BYTES))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, cache_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "STT_ENGINES": "fake",
+        "STT_FAKE_TEXT": "turn on the light",
+        "SHARED_CACHE_PATH": cache_path,
+        # Every request is the same clip; don't replay it
+        "IDEMPOTENCY_ENABLED": "0",
+        "ATLAS_ACTIVE_HOURS": "off",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1).status_code == 200:
+                # Let every worker finish its lifespan, not just the first
+                time.sleep(1 + workers * 0.5)
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"server with {workers} workers didn't start")
+
+
+async def load(url: str, clip: bytes, concurrency: int, seconds: float):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+
+    async def client(http: httpx.AsyncClient):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = await http.post(url, files={"audio": ("clip.wav", clip, "audio/wav")})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(url: str, concurrency: int, seconds: float, results) -> None:
+    results.put(asyncio.run(load(url, make_clip(), concurrency, seconds)))
+
+
+def run(workers: int, seconds: float, concurrency: int, cache_path: str):
+    port = free_port()
+    server = start_server(workers, port, cache_path)
+    try:
+        url = f"http://127.0.0.1:{port}/voice"
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        per_process = max(1, concurrency // CLIENT_PROCESSES)
+        clients = [ctx.Process(target=client_process, args=(url, per_process, seconds, results)) for _ in range(CLIENT_PROCESSES)]
+        for p in clients:
+            p.start()
+        latencies, errors = [], 0
+        for _ in clients:
+            lat, err = results.get()
+            latencies += lat
+            errors += err
+        for p in clients:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait(60)
+    return len(latencies) / seconds, latencies, errors
+
+
+def main(counts, seconds: float, concurrency: int):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "bench_cache.sqlite3")
+        seed_shared_cache(cache_path)
+
+        print(f"{seconds:.0f} s per run, {concurrency} concurrent clients in {CLIENT_PROCESSES} processes, {os.cpu_count()} CPUs\n")
+        print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'speedup':>8}")
+        baseline = None
+        for workers in counts:
+            rps, latencies, errors = run(workers, seconds, concurrency, cache_path)
+            baseline = baseline or rps
+            p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else float("nan")
+            print(f"{workers:>7} {rps:>8.1f} {p50:>8.1f} {p95:>8.1f} {errors:>7} {rps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    seconds, concurrency = 10.0, 32
+    if "--seconds" in args:
+        i = args.index("--seconds")
+        seconds = float(args[i + 1])
+        del args[i:i + 2]
+    if "--concurrency" in args:
+        i = args.index("--concurrency")
+        concurrency = int(args[i + 1])
+        del args[i:i + 2]
+    main([int(a) for a in args] or [1, 2, 4], seconds, concurrency)
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import metrics
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping bounded by total size and/or entry count,
+    with an optional time-to-live per entry.
+
+    Hits, misses and evictions are published as `<name>_hits_total`,
+    `<name>_misses_total` and `<name>_evictions_total`.
+
+    Args:
+        name: Metric prefix, e.g. 'tts_cache_memory'
+        max_bytes: Upper bound on the summed `sizeof` of all values (None = unbounded)
+        max_items: Upper bound on the number of entries (None = unbounded)
+        ttl: Seconds an entry stays valid after it is stored (None or 0 = forever)
+        sizeof: Size function used for `max_bytes` accounting
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: Optional[int] = None,
+        max_items: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = len,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.ttl = ttl or None
+        self._sizeof = sizeof
+        # key -> (expires_at, size, value)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter(f"{name}_hits_total", f"{name} lookups served from cache")
+        self.misses = metrics.counter(f"{name}_misses_total", f"{name} lookups not in cache")
+        self.evictions = metrics.counter(f"{name}_evictions_total", f"{name} entries dropped for size or age")
+        metrics.gauge(f"{name}_bytes", f"{name} bytes currently held", fn=lambda: self._bytes)
+        metrics.gauge(f"{name}_entries", f"{name} entries currently held", fn=lambda: len(self._data))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses.inc()
+                return default
+
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key, size)
+                self.evictions.inc()
+                self.misses.inc()
+                return default
+
+            self._data.move_to_end(key)
+            self.hits.inc()
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Would evict everything else and still not fit
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._remove(key, entry[1])
+            return entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def _remove(self, key: Hashable, size: int) -> None:
+        del self._data[key]
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        # Oldest entries live at the front of the OrderedDict
+        while self._data and (
+            (self.max_bytes is not None and self._bytes > self.max_bytes)
+            or (self.max_items is not None and len(self._data) > self.max_items)
+        ):
+            _, (_, size, _) = self._data.popitem(last=False)
+            self._bytes -= size
+            self.evictions.inc()
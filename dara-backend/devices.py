@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+import httpx
+
+import executors
+import http_clients
+import metrics
+import shared_store
+from schemas import Action, Device, Intent, IntentType
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# The backend can switch devices itself as soon as the intent is known,
+# instead of leaving it to the app's second round trip over the LAN. The
+# command runs in the background while the spoken reply is synthesized.
+#
+# ESP32_CONTROLLERS   controller base URL for every device ("http://192.168.1.40"),
+#                     or device=url pairs ("light=http://192.168.1.40,fan=http://192.168.1.41",
+#                     "temperature=..." for the sensor, see sensors.py).
+#                     Unset = off, the app switches devices as before
+# DEVICE_STATE_TTL    seconds a device's last known state is trusted to skip a
+#                     repeated command. Keep it short: the app can switch
+#                     devices directly too, and the controller resets to OFF
+#                     when it reboots
+# DEVICE_QUEUE_TTL    with several workers only the leader (leader.py) talks to
+#                     the controllers; the others queue commands for it in the
+#                     shared store. A command still queued after this many
+#                     seconds is dropped rather than switching the device late
+CONTROLLERS = os.getenv("ESP32_CONTROLLERS", "")
+STATE_TTL_SECONDS = float(os.getenv("DEVICE_STATE_TTL", 30))
+QUEUE_TTL_SECONDS = float(os.getenv("DEVICE_QUEUE_TTL", 10))
+
+# How often the leader picks up queued commands
+QUEUE_POLL_SECONDS = 0.05
+
+# Firmware routes (dara-firmware/dara_esp32.ino), all POST
+ROUTES: Dict[Tuple[Action, Device], str] = {
+    (Action.TURN_ON, Device.LIGHT): "/light/turn/on",
+    (Action.TURN_OFF, Device.LIGHT): "/light/turn/off",
+    (Action.TURN_ON, Device.FAN): "/fan/turn/on",
+    (Action.TURN_OFF, Device.FAN): "/fan/turn/off",
+}
+
+# Sent to take back a command fired early that the full sentence didn't confirm
+INVERSE = {Action.TURN_ON: Action.TURN_OFF, Action.TURN_OFF: Action.TURN_ON}
+
+_commands = metrics.counter("device_commands_total", "device commands by outcome (sent, skipped, failed, queued)", labels=("device", "result"))
+_command_seconds = metrics.histogram("device_command_seconds", "time for the controller to acknowledge a command", labels=("device",))
+
+
+def parse_controllers(spec: str) -> Dict[Device, str]:
+    """ESP32_CONTROLLERS -> {Device: base URL}."""
+    controllers: Dict[Device, str] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, url = entry.partition("=")
+        if not sep:
+            # A bare URL is one controller for everything (the firmware's default)
+            for device in Device:
+                if device != Device.NONE:
+                    controllers[device] = entry.rstrip("/")
+            continue
+        try:
+            controllers[Device(name.strip().upper())] = url.strip().rstrip("/")
+        except ValueError:
+            logger.warning(f"ESP32_CONTROLLERS: unknown device '{name}', ignored")
+    return controllers
+
+
+# --------------------------------------------------
+# DISPATCHER
+# --------------------------------------------------
+class DeviceDispatcher:
+    """
+    Sends device commands to the ESP32 controllers over the shared "esp32"
+    client (pooled keep-alive connections). Commands to one controller go
+    one at a time and in order, since its WebServer handles one client at
+    a time. A command for the state a device is already known to be in is
+    skipped.
+
+    With a shared `queue`, only the leading worker sends; until lead() is
+    called, commands are queued for whichever worker leads.
+    """
+
+    def __init__(
+        self,
+        controllers: Dict[Device, str],
+        state_ttl: float = STATE_TTL_SECONDS,
+        client: Optional[httpx.AsyncClient] = None,
+        queue: Optional["shared_store.SharedStore"] = None,
+    ):
+        self.controllers = controllers
+        self.state_ttl = state_ttl
+        self._client = client
+        self.queue = queue
+        self.leading = queue is None
+        # device -> (last action sent or in flight, when)
+        self._state: Dict[Device, Tuple[Action, float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._serving: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.controllers)
+
+    def known_state(self, device: Device) -> Optional[Action]:
+        entry = self._state.get(device)
+        if entry is None or time.monotonic() - entry[1] > self.state_ttl:
+            return None
+        return entry[0]
+
+    def lock(self, base: str) -> asyncio.Lock:
+        """Held while talking to the controller at `base` (sensors.py reads take it too)."""
+        return self._locks.setdefault(base, asyncio.Lock())
+
+    def dispatch(self, intent: Intent) -> Optional[asyncio.Task]:
+        """
+        Starts the command for `intent` in the background, or returns None
+        if there is nothing to send (not a device command, no controller, or
+        the device is already in that state).
+        """
+        if intent.type != IntentType.INSTRUCTION:
+            return None
+        route = ROUTES.get((intent.action, intent.device))
+        base = self.controllers.get(intent.device)
+        if route is None or base is None:
+            return None
+
+        device = intent.device.value.lower()
+        if not self.leading:
+            # The leader knows the device state and sends it
+            _commands.labels(device, "queued").inc()
+            return self._track(asyncio.create_task(self._enqueue(intent)))
+
+        if self.known_state(intent.device) == intent.action:
+            logger.info(f"Device {device} already {intent.action.value}, command skipped")
+            _commands.labels(device, "skipped").inc()
+            return None
+
+        # Recorded now, so a repeat arriving while this one is in flight is skipped too
+        entry = self._state[intent.device] = (intent.action, time.monotonic())
+        return self._track(asyncio.create_task(self._send(intent.device, entry, base, route)))
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _enqueue(self, intent: Intent) -> None:
+        key = f"{time.time_ns()}-{os.getpid()}"
+        await executors.io.run(self.queue.set, key, intent.model_dump_json().encode("utf-8"))
+
+    def lead(self) -> None:
+        """This worker now sends every command, including those other workers queue."""
+        self.leading = True
+        if self.queue is not None and self._serving is None:
+            self._serving = asyncio.create_task(self._serve_queue())
+
+    async def _serve_queue(self) -> None:
+        while True:
+            try:
+                for data in await executors.io.run(self.queue.take):
+                    self.dispatch(Intent.model_validate_json(data))
+            except Exception as e:
+                logger.warning(f"Device command queue failed: {e}")
+            await asyncio.sleep(QUEUE_POLL_SECONDS)
+
+    async def _send(self, device: Device, entry: Tuple[Action, float], base: str, route: str) -> bool:
+        action, label = entry[0], device.value.lower()
+        client = self._client or http_clients.get("esp32")
+        try:
+            async with self.lock(base):
+                started = time.perf_counter()
+                response = await client.post(base + route)
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            # State unknown again (unless a newer command replaced it), so the next command is sent
+            if self._state.get(device) is entry:
+                del self._state[device]
+            _commands.labels(label, "failed").inc()
+            logger.warning(f"Device command {action.value} {label} failed ({type(e).__name__}): {e}")
+            return False
+
+        _command_seconds.labels(label).observe(time.perf_counter() - started)
+        _commands.labels(label, "sent").inc()
+        logger.info(f"Device command {action.value} {label}: {response.text.strip()}")
+        return True
+
+    async def drain(self, timeout: float = 5.0) -> None:
+        """Stops taking queued commands and waits for those in flight. Called from the lifespan."""
+        if self._serving is not None:
+            self._serving.cancel()
+            await asyncio.gather(self._serving, return_exceptions=True)
+            self._serving = None
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+
+def _build_default() -> DeviceDispatcher:
+    controllers = parse_controllers(CONTROLLERS)
+    queue = shared_store.open_store("device_commands", 1024 * 1024, QUEUE_TTL_SECONDS, name="device_queue_shared") if controllers else None
+    return DeviceDispatcher(controllers, queue=queue)
+
+
+dispatcher = _build_default()
+
+
+def dispatch(intent: Intent) -> Optional[asyncio.Task]:
+    return dispatcher.dispatch(intent) if dispatcher.enabled else None
+
+
+def revert(early: Intent, final: Intent) -> Optional[asyncio.Task]:
+    """
+    Undoes `early`, a command already sent from a partial transcript, when
+    the final intent doesn't switch that device itself ("turn on the light...
+    no, the fan", or no command at all).
+    """
+    if final.type == IntentType.INSTRUCTION and (final.action, final.device) in ROUTES and final.device == early.device:
+        return None
+    action = INVERSE.get(early.action)
+    if early.type != IntentType.INSTRUCTION or action is None:
+        return None
+    logger.info(f"Early {early.action.value} {early.device.value} not confirmed, sending {action.value}")
+    return dispatch(early.model_copy(update={"action": action}))
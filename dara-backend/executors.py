@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# Blocking work runs on one named pool per subsystem instead of the shared
+# asyncio.to_thread executor, so a slow Spitch call can't hold up audio
+# decoding (or the other way round).
+#
+# EXECUTOR_AUDIO_WORKERS   native WAV decode/resample (CPU bound; NumPy releases the GIL)
+# EXECUTOR_TTS_WORKERS     Spitch SDK calls (each holds a thread for the whole request)
+# EXECUTOR_IO_WORKERS      other blocking I/O: TTS disk cache writes, model loading
+AUDIO_WORKERS = int(os.getenv("EXECUTOR_AUDIO_WORKERS", min(4, os.cpu_count() or 1)))
+TTS_WORKERS = int(os.getenv("EXECUTOR_TTS_WORKERS", 8))
+IO_WORKERS = int(os.getenv("EXECUTOR_IO_WORKERS", 4))
+
+_executors: Dict[str, "Executor"] = {}
+
+
+class Executor:
+    """
+    A sized ThreadPoolExecutor with metrics:
+      executor_<name>_busy / _utilization    workers running a task now
+      executor_<name>_queue_depth            tasks waiting for a worker
+      executor_<name>_queue_wait_seconds     submit -> start, histogram
+      executor_<name>_busy_seconds_total     rate() of this / workers = utilization over time
+      executor_<name>_saturated_total        submissions that found every worker busy
+    Context variables (e.g. the current trace span) are carried into the worker.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.busy = 0
+        self.queued = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-executor")
+        _executors[name] = self
+
+        prefix = f"executor_{name}"
+        self.tasks = metrics.counter(f"{prefix}_tasks_total", f"tasks run on the {name} executor")
+        self.saturated = metrics.counter(f"{prefix}_saturated_total", f"{name} tasks submitted while every worker was busy")
+        self.busy_seconds = metrics.counter(f"{prefix}_busy_seconds_total", f"worker time spent running {name} tasks")
+        self.queue_wait = metrics.histogram(f"{prefix}_queue_wait_seconds", f"time {name} tasks waited for a worker")
+        metrics.gauge(f"{prefix}_workers", f"size of the {name} executor", fn=lambda: self.workers)
+        metrics.gauge(f"{prefix}_busy", f"{name} workers running a task", fn=lambda: self.busy)
+        metrics.gauge(f"{prefix}_utilization", f"share of {name} workers busy", fn=lambda: self.busy / self.workers)
+        metrics.gauge(f"{prefix}_queue_depth", f"{name} tasks waiting for a worker", fn=lambda: self.queued)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Runs fn(*args) on this executor, like asyncio.to_thread."""
+        with self._lock:
+            if self.busy + self.queued >= self.workers:
+                self.saturated.inc()
+            self.queued += 1
+        future = self._pool.submit(self._call, time.perf_counter(), time.time_ns(), contextvars.copy_context(), fn, args)
+        # Cancelled before a worker picked it up: it never runs, so leave the queue here
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future) -> None:
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def _call(self, submitted: float, submitted_ns: int, context: contextvars.Context, fn, args):
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.busy += 1
+        self.queue_wait.observe(started - submitted)
+        context.run(tracing.record_span, f"queue {self.name}", submitted_ns, time.time_ns())
+        try:
+            return context.run(fn, *args)
+        finally:
+            with self._lock:
+                self.busy -= 1
+            self.tasks.inc()
+            self.busy_seconds.inc(time.perf_counter() - started)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+audio = Executor("audio", AUDIO_WORKERS)
+tts = Executor("tts", TTS_WORKERS)
+io = Executor("io", IO_WORKERS)
+
+
+def shutdown() -> None:
+    """Stops every executor; queued tasks are dropped. Called from the lifespan."""
+    for executor in _executors.values():
+        executor.shutdown()
@@ -0,0 +1,393 @@
+import os
+import logging
+from collections import Counter as _Tally, deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from schemas import Intent, IntentType, Action, Device
+from text_utils import normalize_language, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# FAST_PATH_ENABLED          set to 0 to send everything to N-ATLaS
+# FAST_PATH_MIN_CONFIDENCE   share of words that must be explained by the phrase table
+# FAST_PATH_MAX_WORDS        longer transcripts are left to the LLM
+ENABLED = os.getenv("FAST_PATH_ENABLED", "1") != "0"
+MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", 0.75))
+MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", 12))
+
+# --------------------------------------------------
+# PHRASE TABLE
+# --------------------------------------------------
+# Per language:
+#   commands: phrase -> (action or None, device or None)
+#   filler:   words that may surround a command without changing it
+#   block:    negations, question words and times ("tomorrow", "at", "until"); any of
+#             these sends the transcript to the LLM, unless it is part of a command
+#             phrase ("what is the temperature"). A command for later must not run now.
+# Phrases are written naturally and run through normalize_text when compiled,
+# so tone marks and punctuation don't matter here.
+PHRASES = {
+    "en": {
+        "commands": {
+            "turn on": (Action.TURN_ON, None),
+            "switch on": (Action.TURN_ON, None),
+            "put on": (Action.TURN_ON, None),
+            "power on": (Action.TURN_ON, None),
+            "on": (Action.TURN_ON, None),
+            "turn off": (Action.TURN_OFF, None),
+            "switch off": (Action.TURN_OFF, None),
+            "shut off": (Action.TURN_OFF, None),
+            "put off": (Action.TURN_OFF, None),
+            "power off": (Action.TURN_OFF, None),
+            "off": (Action.TURN_OFF, None),
+            "light": (None, Device.LIGHT),
+            "lights": (None, Device.LIGHT),
+            "lamp": (None, Device.LIGHT),
+            "bulb": (None, Device.LIGHT),
+            "fan": (None, Device.FAN),
+            "fans": (None, Device.FAN),
+            # Answered from the latest sensor reading (sensors.py)
+            "temperature": (Action.CHECK, Device.TEMPERATURE),
+            "what is the temperature": (Action.CHECK, Device.TEMPERATURE),
+            "what's the temperature": (Action.CHECK, Device.TEMPERATURE),
+            "how hot is it": (Action.CHECK, Device.TEMPERATURE),
+            "how warm is it": (Action.CHECK, Device.TEMPERATURE),
+            "how cold is it": (Action.CHECK, Device.TEMPERATURE),
+            "check": (Action.CHECK, None),
+        },
+        "filler": [
+            "the", "a", "an", "my", "our", "please", "pls", "kindly", "dara",
+            "can", "could", "would", "will", "you", "for", "me", "us", "in",
+            "room", "bedroom", "kitchen", "living", "parlour", "parlor", "now",
+            "turn", "switch", "hey", "ok", "okay",
+        ],
+        "block": [
+            "don't", "dont", "do not", "not", "never", "won't", "wont", "no", "stop",
+            "is", "are", "was", "what",
+            "why", "when", "how", "did", "if", "after", "later",
+            "at", "until", "till", "before", "by", "tomorrow", "tonight", "today",
+            "morning", "afternoon", "evening", "night", "o'clock", "am", "pm",
+            "second", "seconds", "minute", "minutes", "hour", "hours", "every",
+            "schedule", "timer",
+        ],
+    },
+    "yo": {
+        "commands": {
+            "tan": (Action.TURN_ON, None),
+            "ṣí": (Action.TURN_ON, None),
+            "pa": (Action.TURN_OFF, None),
+            "iná": (None, Device.LIGHT),
+            "ìmọ́lẹ̀": (None, Device.LIGHT),
+            "gílóòbù": (None, Device.LIGHT),
+            "tanná": (Action.TURN_ON, Device.LIGHT),
+            "paná": (Action.TURN_OFF, Device.LIGHT),
+            "fáànù": (None, Device.FAN),
+            "fan": (None, Device.FAN),
+            "afẹ́fẹ́": (None, Device.FAN),
+            "ìgbóná": (Action.CHECK, Device.TEMPERATURE),
+            "ooru": (Action.CHECK, Device.TEMPERATURE),
+            "báwo ni ìgbóná": (Action.CHECK, Device.TEMPERATURE),
+            "kí ni ìgbóná": (Action.CHECK, Device.TEMPERATURE),
+            "báwo ni ooru ṣe pọ̀ tó": (Action.CHECK, Device.TEMPERATURE),
+        },
+        "filler": [
+            "ẹ jọ̀wọ́", "jọ̀wọ́", "dára", "mo", "fẹ́", "kí", "o", "ẹ", "mi", "wa",
+            "yàrá", "nínú", "inú", "ilé", "náà", "báyìí",
+        ],
+        "block": [
+            "má", "ṣé", "ǹjẹ́", "kí ló", "ṣe",
+            "ọ̀la", "àárọ̀", "òwúrọ̀", "ọ̀sán", "ìrọ̀lẹ́", "alẹ́", "títí", "agogo", "ìṣẹ́jú", "wákàtí",
+        ],
+    },
+    "ha": {
+        "commands": {
+            "kunna": (Action.TURN_ON, None),
+            "kashe": (Action.TURN_OFF, None),
+            "fitila": (None, Device.LIGHT),
+            "wuta": (None, Device.LIGHT),
+            "haske": (None, Device.LIGHT),
+            "kwan fitila": (None, Device.LIGHT),
+            "fanka": (None, Device.FAN),
+            "fan": (None, Device.FAN),
+            "zafi": (Action.CHECK, Device.TEMPERATURE),
+            "zafin": (Action.CHECK, Device.TEMPERATURE),
+            "yaya zafi": (Action.CHECK, Device.TEMPERATURE),
+            "yaya zafin": (Action.CHECK, Device.TEMPERATURE),
+            "nawa ne zafin": (Action.CHECK, Device.TEMPERATURE),
+        },
+        "filler": [
+            "don allah", "dara", "ka", "ki", "ku", "a", "mini", "min", "mana",
+            "da", "daki", "dakin", "na", "ta", "yanzu", "cikin", "yake",
+        ],
+        "block": [
+            "kar", "kada", "ko", "shin", "me", "yaya",
+            "gobe", "safe", "rana", "yamma", "dare", "har", "karfe", "minti", "awa", "bayan",
+        ],
+    },
+    "ig": {
+        "commands": {
+            "gbanye": (Action.TURN_ON, None),
+            "mụnye": (Action.TURN_ON, None),
+            "gbanyụọ": (Action.TURN_OFF, None),
+            "menyụọ": (Action.TURN_OFF, None),
+            "gbanyụ": (Action.TURN_OFF, None),
+            "ọkụ": (None, Device.LIGHT),
+            "bulb": (None, Device.LIGHT),
+            "fan": (None, Device.FAN),
+            "fanụ": (None, Device.FAN),
+            "okpomọkụ": (Action.CHECK, Device.TEMPERATURE),
+            "kedu okpomọkụ": (Action.CHECK, Device.TEMPERATURE),
+            "kedu ka okpomọkụ dị": (Action.CHECK, Device.TEMPERATURE),
+        },
+        "filler": [
+            "biko", "dara", "n'ime", "ime", "ụlọ", "ọnụ ụlọ", "m", "anyị",
+            "ugbu a", "na",
+        ],
+        "block": [
+            "emela", "ebula", "ọ bụ", "kedu", "gịnị",
+            "echi", "ụtụtụ", "ehihie", "mgbede", "abalị", "ruo", "elekere", "nkeji", "awa", "mgbe",
+        ],
+    },
+}
+
+# Canned spoken confirmations, one per (action, device) per language
+RESPONSES = {
+    "en": {
+        (Action.TURN_ON, Device.LIGHT): "Sure, I've turned on the light for you.",
+        (Action.TURN_OFF, Device.LIGHT): "Sure, I've turned off the light for you.",
+        (Action.TURN_ON, Device.FAN): "Sure, I've turned on the fan for you.",
+        (Action.TURN_OFF, Device.FAN): "Sure, I've turned off the fan for you.",
+        # Placeholder; sensors.answer puts the reading in
+        (Action.CHECK, Device.TEMPERATURE): "Let me check the temperature.",
+    },
+    "yo": {
+        (Action.TURN_ON, Device.LIGHT): "Ó dáa, mo ti tan iná.",
+        (Action.TURN_OFF, Device.LIGHT): "Ó dáa, mo ti pa iná.",
+        (Action.TURN_ON, Device.FAN): "Ó dáa, mo ti tan fáànù.",
+        (Action.TURN_OFF, Device.FAN): "Ó dáa, mo ti pa fáànù.",
+        (Action.CHECK, Device.TEMPERATURE): "Ẹ jẹ́ kí n wo ìgbóná.",
+    },
+    "ha": {
+        (Action.TURN_ON, Device.LIGHT): "To, na kunna fitila.",
+        (Action.TURN_OFF, Device.LIGHT): "To, na kashe fitila.",
+        (Action.TURN_ON, Device.FAN): "To, na kunna fanka.",
+        (Action.TURN_OFF, Device.FAN): "To, na kashe fanka.",
+        (Action.CHECK, Device.TEMPERATURE): "Bari in duba zafin.",
+    },
+    "ig": {
+        (Action.TURN_ON, Device.LIGHT): "Emere m, agbanyela m ọkụ.",
+        (Action.TURN_OFF, Device.LIGHT): "Emere m, agbanyụọla m ọkụ.",
+        (Action.TURN_ON, Device.FAN): "Emere m, agbanyela m fan.",
+        (Action.TURN_OFF, Device.FAN): "Emere m, agbanyụọla m fan.",
+        (Action.CHECK, Device.TEMPERATURE): "Ka m lee okpomọkụ.",
+    },
+}
+
+# Pattern kinds stored in the index
+_COMMAND = "command"
+_FILLER = "filler"
+_BLOCK = "block"
+
+
+# --------------------------------------------------
+# AHO-CORASICK INDEX
+# --------------------------------------------------
+class PhraseIndex:
+    """
+    Aho-Corasick automaton over whole-word phrases. Phrases and text are both
+    padded with spaces so matches can only start and end on word boundaries;
+    one pass over the transcript finds every phrase, overlapping or not.
+    """
+
+    def __init__(self, patterns: List[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]
+
+        for phrase, payload in patterns:
+            key = f" {phrase} "
+            node = 0
+            for ch in key:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(key), payload))
+
+        # Breadth-first pass to fill failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def find(self, text: str) -> List[Tuple[int, int, object]]:
+        """
+        All matches in an already normalized, single-spaced `text` as
+        (first_word, last_word, payload), word indices inclusive.
+        """
+        padded = f" {text} "
+        matches = []
+        node = 0
+        word = -1  # index of the word the cursor is in (after the leading space)
+        for i, ch in enumerate(padded):
+            if ch == " ":
+                word += 1
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                # The match spans padded[i-length+1 : i+1], both ends on spaces
+                inner_spaces = padded.count(" ", i - length + 2, i)
+                matches.append((word - 1 - inner_spaces, word - 1, payload))
+        return matches
+
+
+def _compile() -> PhraseIndex:
+    patterns = []
+    for lang, table in PHRASES.items():
+        for phrase, slots in table["commands"].items():
+            patterns.append((normalize_text(phrase), (_COMMAND, lang, slots)))
+        for phrase in table["filler"]:
+            patterns.append((normalize_text(phrase), (_FILLER, lang, None)))
+        for phrase in table["block"]:
+            patterns.append((normalize_text(phrase), (_BLOCK, lang, None)))
+    return PhraseIndex(patterns)
+
+
+_INDEX = _compile()
+logger.info(f"Fast-path phrase index compiled ({len(_INDEX)} states)")
+
+# --------------------------------------------------
+# METRICS
+# --------------------------------------------------
+_hits = metrics.counter("fast_path_hits_total", "transcripts answered without N-ATLaS")
+_misses = metrics.counter("fast_path_misses_total", "transcripts passed on to N-ATLaS")
+metrics.gauge("fast_path_hit_ratio", "fast_path hits / lookups", fn=lambda: metrics.ratio(_hits, [_hits, _misses]))
+
+
+# --------------------------------------------------
+# MATCHING
+# --------------------------------------------------
+@dataclass
+class FastPathMatch:
+    action: Action
+    device: Device
+    language: str
+    confidence: float
+
+
+def lookup(transcript: str, language: str) -> Optional[FastPathMatch]:
+    """
+    Best device command found in `transcript`, or None if there is no single
+    unambiguous (action, device) pair. `confidence` is the share of words
+    explained by commands and filler; negations and questions outside a
+    command phrase force it to 0.
+    """
+    text = normalize_text(transcript)
+    if not text:
+        return None
+
+    n_words = text.count(" ") + 1
+    covered = [False] * n_words
+    actions, devices = set(), set()
+    phrase_langs = _Tally()
+    blocks, commands = [], []
+
+    for first, last, (kind, lang, slots) in _INDEX.find(text):
+        if kind == _BLOCK:
+            blocks.append((first, last))
+            continue
+        for w in range(first, last + 1):
+            covered[w] = True
+        if kind == _COMMAND:
+            commands.append((first, last))
+            action, device = slots
+            if action is not None:
+                actions.add(action)
+            if device is not None:
+                devices.add(device)
+            phrase_langs[lang] += 1
+
+    if len(actions) != 1 or len(devices) != 1:
+        return None
+
+    lang = normalize_language(language)
+    if lang not in RESPONSES:
+        # Fall back to whichever language the matched phrases came from
+        lang = phrase_langs.most_common(1)[0][0]
+
+    # "what" in "what is the temperature" is the command, not a question about one
+    blocked = any(not any(f <= first and last <= l for f, l in commands) for first, last in blocks)
+    confidence = 0.0
+    if not blocked and n_words <= MAX_WORDS:
+        confidence = sum(covered) / n_words
+
+    return FastPathMatch(actions.pop(), devices.pop(), lang, confidence)
+
+
+def response_for(action: Action, device: Device, language: str) -> Optional[str]:
+    """Canned confirmation for a device command, None if there isn't one."""
+    return RESPONSES.get(language, RESPONSES["en"]).get((action, device))
+
+
+def match(transcript: str, language: str) -> Optional[dict]:
+    """
+    classify() without touching the hit/miss counters. Used on partial
+    transcripts, which are checked many times per utterance.
+    """
+    if not ENABLED:
+        return None
+
+    found = lookup(transcript, language)
+    if found is None or found.confidence < MIN_CONFIDENCE:
+        return None
+    response_text = response_for(found.action, found.device, found.language)
+    if response_text is None:
+        return None
+
+    return {
+        "intent": Intent(
+            type=IntentType.INSTRUCTION,
+            language=found.language,
+            action=found.action,
+            device=found.device,
+            response_text=response_text,
+        ),
+        "response_text": response_text,
+    }
+
+
+def classify(transcript: str, language: str) -> Optional[dict]:
+    """
+    Same return shape as reasoning.classify_intent, or None when the
+    transcript should go to N-ATLaS.
+    """
+    if not ENABLED:
+        return None
+
+    result = match(transcript, language)
+    if result is None:
+        _misses.inc()
+        return None
+
+    _hits.inc()
+    return result
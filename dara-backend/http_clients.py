@@ -0,0 +1,247 @@
+import os
+import time
+import logging
+import weakref
+import importlib.util
+from dataclasses import dataclass
+from typing import Dict
+
+import httpx
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# UPSTREAM SERVICES
+# --------------------------------------------------
+# One pooled AsyncClient per upstream, created in the FastAPI lifespan and
+# shared by every request. Timeouts can be overridden per service with
+# HTTP_<NAME>_TIMEOUT (read, e.g. HTTP_ATLAS_TIMEOUT=90) and
+# HTTP_<NAME>_CONNECT_TIMEOUT (TCP+TLS setup, also the wait for a free
+# pooled connection).
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    http2: bool
+    connect_timeout: float
+    read_timeout: float
+    max_connections: int
+    max_keepalive: int
+    keepalive_expiry: float
+
+
+SERVICES: Dict[str, ServiceConfig] = {
+    # Deepgram batch /v1/listen
+    "deepgram": ServiceConfig(http2=True, connect_timeout=5.0, read_timeout=10.0,
+                              max_connections=32, max_keepalive=16, keepalive_expiry=60.0),
+    # OpenAI Whisper (used through the AsyncOpenAI SDK)
+    "openai": ServiceConfig(http2=True, connect_timeout=5.0, read_timeout=60.0,
+                            max_connections=32, max_keepalive=16, keepalive_expiry=60.0),
+    # N-ATLaS on Modal; long read timeout to ride out cold starts
+    "atlas": ServiceConfig(http2=True, connect_timeout=10.0, read_timeout=120.0,
+                           max_connections=64, max_keepalive=32, keepalive_expiry=120.0),
+    # ESP32 device controllers on the LAN (devices.py); plain HTTP/1.1
+    "esp32": ServiceConfig(http2=False, connect_timeout=2.0, read_timeout=5.0,
+                           max_connections=8, max_keepalive=4, keepalive_expiry=30.0),
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+# --------------------------------------------------
+# CONNECTION REUSE METRICS
+# --------------------------------------------------
+class _ReuseTracker:
+    """
+    Counts requests and newly opened connections for one service. httpx
+    exposes the underlying network stream on each response; a stream we
+    haven't seen before means the pool had to open a connection.
+    """
+
+    def __init__(self, name: str):
+        self._seen = weakref.WeakSet()
+        self.requests = metrics.counter(f"http_{name}_requests_total", f"requests sent to {name}")
+        self.connections = metrics.counter(f"http_{name}_connections_opened_total", f"connections opened to {name}")
+        metrics.gauge(
+            f"http_{name}_connection_reuse_ratio",
+            f"share of {name} requests served on an existing connection",
+            fn=self.reuse_ratio,
+        )
+
+    def reuse_ratio(self) -> float:
+        total = self.requests.value
+        return (total - self.connections.value) / total if total else 0.0
+
+    async def on_response(self, response: httpx.Response) -> None:
+        self.requests.inc()
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        if stream not in self._seen:
+            self._seen.add(stream)
+            self.connections.inc()
+
+
+_trackers = {name: _ReuseTracker(name) for name in SERVICES}
+
+
+# --------------------------------------------------
+# UPSTREAM ERRORS
+# --------------------------------------------------
+# One counter for every upstream call that failed, by service and kind:
+# timeout, connect, http_4xx, http_5xx or other. HTTP services are counted
+# here; SDK and WebSocket callers (Spitch, Deepgram live) use count_error.
+upstream_errors = metrics.counter(
+    "upstream_errors_total",
+    "failed calls to upstream services",
+    labels=("service", "kind"),
+)
+
+
+def error_kind(exc: BaseException) -> str:
+    status = getattr(exc, "status_code", None)
+    if status is None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    if isinstance(status, int):
+        return f"http_{status // 100}xx"
+    name = type(exc).__name__
+    if isinstance(exc, (httpx.TimeoutException, TimeoutError)) or "Timeout" in name:
+        return "timeout"
+    if isinstance(exc, (httpx.NetworkError, ConnectionError, OSError)) or "Connect" in name:
+        return "connect"
+    return "other"
+
+
+def count_error(service: str, exc: BaseException) -> None:
+    upstream_errors.labels(service, error_kind(exc)).inc()
+
+
+# Connection phases reported by httpcore's "trace" extension that become
+# child spans of the request span (pool waits, DNS+TCP, TLS, server time)
+TRACED_PHASES = {
+    "connection.connect_tcp": "connect",
+    "connection.start_tls": "tls",
+    "http11.send_request_body": "send_body",
+    "http2.send_request_body": "send_body",
+    "http11.receive_response_headers": "wait_response",
+    "http2.receive_response_headers": "wait_response",
+}
+
+
+def _phase_tracer(parent: tracing.Span):
+    started: Dict[str, int] = {}
+
+    async def trace(event: str, info: dict) -> None:
+        phase, _, state = event.rpartition(".")
+        name = TRACED_PHASES.get(phase)
+        if name is None:
+            return
+        if state == "started":
+            started[phase] = time.time_ns()
+        elif phase in started:
+            child = tracing.start_span(name, parent, start_ns=started.pop(phase))
+            if child is None:
+                return
+            if state == "failed":
+                child.fail(info.get("exception"))
+            child.end()
+
+    return trace
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Counts transport failures (timeouts, refused connections) per service,
+    and traces each request with the W3C traceparent header set.
+    """
+
+    def __init__(self, name: str, transport: httpx.AsyncBaseTransport):
+        self.name = name
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with tracing.span(f"{request.method} {self.name}", **{"http.url": str(request.url.copy_with(query=None)), "peer.service": self.name}) as span:
+            if span is not None:
+                request.headers["traceparent"] = span.traceparent
+                request.extensions = {**request.extensions, "trace": _phase_tracer(span)}
+            try:
+                response = await self._transport.handle_async_request(request)
+            except Exception as e:
+                count_error(self.name, e)
+                raise
+            if span is not None:
+                span.set(**{"http.status_code": response.status_code, "http.version": response.extensions.get("http_version", b"").decode()})
+                if response.status_code >= 500:
+                    span.error = f"HTTP {response.status_code}"
+            # Ends once headers are in; streamed bodies are read after this
+            return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _count_status(name: str):
+    async def on_response(response: httpx.Response) -> None:
+        if response.status_code >= 400:
+            upstream_errors.labels(name, f"http_{response.status_code // 100}xx").inc()
+    return on_response
+
+
+# --------------------------------------------------
+# LIFECYCLE
+# --------------------------------------------------
+def _build(name: str) -> httpx.AsyncClient:
+    config = SERVICES[name]
+    read_timeout = float(os.getenv(f"HTTP_{name.upper()}_TIMEOUT", config.read_timeout))
+    connect_timeout = float(os.getenv(f"HTTP_{name.upper()}_CONNECT_TIMEOUT", config.connect_timeout))
+    http2 = config.http2 and HTTP2_AVAILABLE
+
+    # Pool settings live on the transport once we wrap it
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=_InstrumentedTransport(name, transport),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout),
+        event_hooks={"response": [_trackers[name].on_response, _count_status(name)]},
+    )
+
+
+async def startup() -> None:
+    """Create every upstream client. Called from the FastAPI lifespan."""
+    if not HTTP2_AVAILABLE:
+        logger.warning("h2 not installed, upstream clients will use HTTP/1.1")
+    for name in SERVICES:
+        get(name)
+    logger.info(f"HTTP clients ready: {', '.join(SERVICES)}")
+
+
+async def shutdown() -> None:
+    """Close every upstream client and its pooled connections."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get(name: str) -> httpx.AsyncClient:
+    """
+    Shared client for an upstream service.
+    Created on first use if the lifespan hasn't run (scripts, tests).
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build(name)
+        _clients[name] = client
+    return client
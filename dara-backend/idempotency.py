@@ -0,0 +1,277 @@
+import os
+import json
+import base64
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+import executors
+import metrics
+import shared_store
+from cache import LRUCache
+from schemas import Intent
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# The app retries a voice command when its request times out. Each upload is
+# keyed by its Idempotency-Key header, or by a BLAKE2b hash of the audio. A
+# retry that arrives while the first attempt is still running waits for it
+# (single-flight), and one that arrives later is answered from a short-lived
+# cache. Neither runs STT, N-ATLaS or Spitch again. The key is shared by
+# /voice, /voice/audio and /voice/stream, so a retry can use any of them.
+#
+# With SHARED_CACHE_PATH set (multi-worker mode) this holds across workers:
+# the worker running a key claims it in the shared store, results are
+# written there, and a retry on another worker polls until the result (or
+# just the intent, once the device has been switched) appears.
+#
+# IDEMPOTENCY_ENABLED          set to 0 to run every upload
+# IDEMPOTENCY_TTL              seconds a finished result can be replayed
+# IDEMPOTENCY_CACHE_MAX_BYTES  budget for cached results (mostly reply audio)
+# IDEMPOTENCY_HASH_UPLOADS     1 = key uploads without the header by their audio hash
+# IDEMPOTENCY_CLAIM_TTL        seconds another worker waits on a running attempt
+#                              before running the upload itself
+ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "1") != "0"
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL", 600))
+CACHE_MAX_BYTES = int(os.getenv("IDEMPOTENCY_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+HASH_UPLOADS = os.getenv("IDEMPOTENCY_HASH_UPLOADS", "1") != "0"
+CLAIM_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_CLAIM_TTL", 60))
+
+REPLAY_CHUNK_BYTES = 8192
+# How often a retry checks the shared store for another worker's result
+SHARED_POLL_SECONDS = 0.1
+
+
+class IdempotencyConflict(Exception):
+    """The Idempotency-Key was already used for a different upload."""
+
+
+@dataclass(frozen=True)
+class VoiceResult:
+    """Everything needed to answer a voice request again, in any format."""
+    fingerprint: str   # hash of the upload, to catch a reused key
+    transcript: str
+    language: str
+    intent: Intent
+    response_text: str
+    audio: bytes
+
+
+def encode(result: VoiceResult) -> bytes:
+    return json.dumps({
+        "fingerprint": result.fingerprint,
+        "transcript": result.transcript,
+        "language": result.language,
+        "intent": result.intent.model_dump(mode="json"),
+        "response_text": result.response_text,
+        "audio": base64.b64encode(result.audio).decode("ascii"),
+    }).encode("utf-8")
+
+
+def decode(data: bytes) -> VoiceResult:
+    fields = json.loads(data)
+    return VoiceResult(
+        fields["fingerprint"],
+        fields["transcript"],
+        fields["language"],
+        Intent.model_validate(fields["intent"]),
+        fields["response_text"],
+        base64.b64decode(fields["audio"]),
+    )
+
+
+def fingerprint(audio_bytes: bytes) -> str:
+    # BLAKE2b is several times faster than SHA-256 on large uploads
+    return hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+
+
+def request_key(audio_bytes: bytes, idempotency_key: Optional[str]) -> Tuple[Optional[str], str]:
+    """(cache key or None if this request isn't deduplicated, upload fingerprint)."""
+    digest = fingerprint(audio_bytes)
+    if not ENABLED:
+        return None, digest
+    if idempotency_key:
+        return f"key:{idempotency_key.strip()}", digest
+    if HASH_UPLOADS:
+        return f"audio:{digest}", digest
+    return None, digest
+
+
+# --------------------------------------------------
+# SINGLE-FLIGHT + RESULT CACHE
+# --------------------------------------------------
+class Flight:
+    """The running request for a key. The caller must finish() or abandon() it."""
+
+    def __init__(self, store: "ResultStore", key: str):
+        self.store = store
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.decision: Optional[VoiceResult] = None
+
+    def decided(self, result: VoiceResult) -> None:
+        """
+        The transcript and intent are known, and a device may already have
+        been switched. From here on a retry replays them instead of running
+        the pipeline again, even if the reply audio never arrives.
+        """
+        self.decision = result
+        # Other workers can replay it from now on
+        self.store.publish(self.key, result)
+
+    def finish(self, result: VoiceResult) -> None:
+        if self.future.done():
+            return
+        # Without audio (TTS failed) the replay synthesizes the reply again
+        self.store.cache.set(self.key, result)
+        self.store.publish(self.key, result)
+        self.future.set_result(result)
+        self.store.inflight.pop(self.key, None)
+
+    def abandon(self) -> None:
+        """
+        The request failed or the client left. Waiters replay the decision
+        if there was one, otherwise they run the request themselves.
+        """
+        if self.future.done():
+            return
+        if self.decision is not None:
+            self.finish(self.decision)
+            return
+        # Let a retry on another worker take over
+        self.store.publish(self.key, None)
+        self.future.set_result(None)
+        self.store.inflight.pop(self.key, None)
+
+    async def record(self, chunks: AsyncIterator[bytes], result: VoiceResult) -> AsyncIterator[bytes]:
+        """Passes a streamed reply through and finishes with its full audio."""
+        self.decided(result)
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+            self.finish(replace(result, audio=b"".join(parts)))
+        finally:
+            self.abandon()
+
+
+class ResultStore:
+    """
+    Results per key, in memory and optionally in shared stores that every
+    worker reads: `shared` holds the results, `claims` marks keys a worker
+    is running.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl: float = TTL_SECONDS,
+        shared: Optional["shared_store.SharedStore"] = None,
+        claims: Optional["shared_store.SharedStore"] = None,
+    ):
+        self.cache = LRUCache(
+            name,
+            max_bytes=max_bytes,
+            ttl=ttl,
+            sizeof=lambda r: len(r.audio) + len(r.transcript) + len(r.response_text),
+        )
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.shared = shared
+        self.claims = claims
+        # Shared-store writes per key, chained so they land in order
+        self._writes: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.coalesced = metrics.counter(f"{name}_coalesced_total", "duplicate requests that waited for the one already running")
+
+    async def acquire(self, key: Optional[str], upload: str) -> Tuple[Optional[VoiceResult], Optional[Flight]]:
+        """
+        Either a result to replay (cached, or from a duplicate that was
+        already running) or a Flight that this request now owns.
+        Raises IdempotencyConflict if the key belongs to a different upload.
+        """
+        if key is None:
+            return None, None
+        waited = False
+        while True:
+            result = self.cache.get(key)
+            if result is None and self.shared is not None and key not in self.inflight:
+                result = await executors.io.run(self._get_shared, key)
+            if result is None:
+                pending = self.inflight.get(key)
+                if pending is None:
+                    if self.claims is not None and not await executors.io.run(self.claims.add, key, b""):
+                        # Running on another worker; its result shows up in the shared store
+                        waited = True
+                        await asyncio.sleep(SHARED_POLL_SECONDS)
+                        continue
+                    if key in self.inflight:
+                        # Claimed by a duplicate on this worker meanwhile
+                        continue
+                    flight = Flight(self, key)
+                    self.inflight[key] = flight.future
+                    return None, flight
+                # Shielded: a waiter giving up mustn't cancel the running request
+                result = await asyncio.shield(pending)
+                if result is None:
+                    # That attempt failed; try again, possibly as the owner
+                    continue
+                waited = True
+
+            if waited:
+                self.coalesced.inc()
+            if result.fingerprint != upload:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different recording")
+            return result, None
+
+    def _get_shared(self, key: str) -> Optional[VoiceResult]:
+        data = self.shared.get(key)
+        if data is None:
+            return None
+        result = decode(data)
+        self.cache.set(key, result)
+        return result
+
+    def publish(self, key: str, result: Optional[VoiceResult]) -> None:
+        """
+        Writes `result` to the shared store in the background, or for None
+        releases this worker's claim on the key. Nothing to do without one.
+        """
+        if self.shared is None and self.claims is None:
+            return
+        previous = self._writes.get(key)
+        task = asyncio.create_task(self._publish(key, result, previous))
+        self._writes[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda t: self._writes.pop(key, None) if self._writes.get(key) is t else None)
+
+    async def _publish(self, key: str, result: Optional[VoiceResult], previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            if result is not None:
+                if self.shared is not None:
+                    await executors.io.run(self.shared.set, key, encode(result))
+            elif self.claims is not None:
+                await executors.io.run(self.claims.delete, key)
+        except Exception as e:
+            logger.warning(f"Shared result write for {key} failed: {e}")
+
+
+voice_results = ResultStore(
+    "voice_results",
+    shared=shared_store.open_store("voice_results", CACHE_MAX_BYTES, TTL_SECONDS, name="voice_results_shared"),
+    claims=shared_store.open_store("voice_claims", 1024 * 1024, CLAIM_TTL_SECONDS, name="voice_claims_shared"),
+)
+
+
+async def replay_chunks(audio: bytes) -> AsyncIterator[bytes]:
+    for i in range(0, len(audio), REPLAY_CHUNK_BYTES):
+        yield audio[i:i + REPLAY_CHUNK_BYTES]
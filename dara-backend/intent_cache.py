@@ -0,0 +1,153 @@
+import os
+import logging
+from typing import Optional
+
+import executors
+import metrics
+import shared_store
+from cache import LRUCache
+from schemas import Intent, IntentType
+from text_utils import LANGUAGE_NAMES, normalize_language, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# Households repeat the same few phrases, so the intent N-ATLaS returns for a
+# transcript is kept and reused without another GPU round trip. Transcripts
+# are keyed by language plus normalize_text (case, punctuation, Yoruba/Igbo
+# tone marks and whitespace folded), so "Tan iná!" and "tan ina" share an entry.
+#
+# INTENT_CACHE_ENABLED        set to 0 to send every transcript to N-ATLaS
+# INTENT_CACHE_TTL            seconds an intent is reused
+# INTENT_CACHE_MAX_ITEMS      distinct transcripts kept
+# INTENT_CACHE_CONVERSATION   1 = also reuse CONVERSATION replies (the same
+#                             answer every time); device commands always are
+# With SHARED_CACHE_PATH set (multi-worker mode) entries are also kept in the
+# SQLite store every worker reads, see shared_store.py.
+ENABLED = os.getenv("INTENT_CACHE_ENABLED", "1") != "0"
+TTL_SECONDS = float(os.getenv("INTENT_CACHE_TTL", 24 * 3600))
+MAX_ITEMS = int(os.getenv("INTENT_CACHE_MAX_ITEMS", 4096))
+CACHE_CONVERSATION = os.getenv("INTENT_CACHE_CONVERSATION", "0") == "1"
+# Shared-store budget; an entry is a few hundred bytes of JSON
+SHARED_MAX_BYTES = 4 * 1024 * 1024
+
+# Unknown languages share one label so the metrics stay bounded
+_LANGUAGES = set(LANGUAGE_NAMES.values())
+
+_lookups = metrics.counter("intent_cache_lookups_total", "intent cache lookups", labels=("language", "result"))
+_hit_ratio = metrics.gauge("intent_cache_hit_ratio", "share of intent cache lookups that hit", labels=("language",))
+
+
+class IntentCache:
+    """
+    LRU+TTL map of (language, normalized transcript) -> Intent, optionally
+    backed by a SharedStore that other worker processes fill too.
+    """
+
+    def __init__(
+        self,
+        name: str = "intent_cache",
+        max_items: int = MAX_ITEMS,
+        ttl: float = TTL_SECONDS,
+        conversation: bool = CACHE_CONVERSATION,
+        shared: Optional["shared_store.SharedStore"] = None,
+    ):
+        self.cache = LRUCache(name, max_items=max_items, ttl=ttl, sizeof=lambda _: 1)
+        self.conversation = conversation
+        self.shared = shared
+
+    @staticmethod
+    def key(transcript: str, language: str) -> Optional[tuple]:
+        text = normalize_text(transcript)
+        return (normalize_language(language), text) if text else None
+
+    def get(self, transcript: str, language: str) -> Optional[dict]:
+        """
+        {"intent", "response_text"} like reasoning.classify_intent, or None.
+        Reads the shared store inline; use get_async on the event loop.
+        """
+        key = self.key(transcript, language)
+        if key is None:
+            return None
+        intent = self.cache.get(key)
+        if intent is None and self.shared is not None:
+            intent = self._get_shared(key)
+        return self._found(key, intent)
+
+    async def get_async(self, transcript: str, language: str) -> Optional[dict]:
+        """get() with the shared store read on the io executor."""
+        key = self.key(transcript, language)
+        if key is None:
+            return None
+        intent = self.cache.get(key)
+        if intent is None and self.shared is not None:
+            intent = await executors.io.run(self._get_shared, key)
+        return self._found(key, intent)
+
+    def set(self, transcript: str, language: str, intent: Intent) -> None:
+        """Writes the shared store inline; use set_async on the event loop."""
+        key = self._set_memory(transcript, language, intent)
+        if key is not None and self.shared is not None:
+            self.shared.set(self._shared_key(key), intent.model_dump_json().encode("utf-8"))
+
+    async def set_async(self, transcript: str, language: str, intent: Intent) -> None:
+        """set() with the shared store write on the io executor."""
+        key = self._set_memory(transcript, language, intent)
+        if key is not None and self.shared is not None:
+            await executors.io.run(self.shared.set, self._shared_key(key), intent.model_dump_json().encode("utf-8"))
+
+    def _set_memory(self, transcript: str, language: str, intent: Intent) -> Optional[tuple]:
+        """The key the intent was stored under, or None if it isn't cached."""
+        if intent.type != IntentType.INSTRUCTION and not self.conversation:
+            return None
+        key = self.key(transcript, language)
+        if key is None:
+            return None
+        self.cache.set(key, intent)
+        return key
+
+    def _get_shared(self, key: tuple) -> Optional[Intent]:
+        # Classified by another worker
+        data = self.shared.get(self._shared_key(key))
+        if data is None:
+            return None
+        intent = Intent.model_validate_json(data)
+        self.cache.set(key, intent)
+        return intent
+
+    def _found(self, key: tuple, intent: Optional[Intent]) -> Optional[dict]:
+        self._count(key[0], intent is not None)
+        if intent is None:
+            return None
+        # Callers may adjust the intent; keep the cached one pristine
+        intent = intent.model_copy()
+        return {"intent": intent, "response_text": intent.response_text}
+
+    @staticmethod
+    def _shared_key(key: tuple) -> str:
+        return "\x1f".join(key)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    @staticmethod
+    def _count(language: str, hit: bool) -> None:
+        label = language if language in _LANGUAGES else "other"
+        hits = _lookups.labels(label, "hit")
+        misses = _lookups.labels(label, "miss")
+        (hits if hit else misses).inc()
+        _hit_ratio.labels(label).set(metrics.ratio(hits, [hits, misses]))
+
+
+intents = IntentCache(shared=shared_store.open_store("intent", SHARED_MAX_BYTES, TTL_SECONDS, name="intent_cache_shared"))
+
+
+async def lookup(transcript: str, language: str) -> Optional[dict]:
+    return await intents.get_async(transcript, language) if ENABLED else None
+
+
+async def store(transcript: str, language: str, intent: Intent) -> None:
+    if ENABLED:
+        await intents.set_async(transcript, language, intent)
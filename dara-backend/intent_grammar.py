@@ -0,0 +1,226 @@
+from typing import List, Optional, Sequence, Tuple
+
+from schemas import IntentType, Action, Device
+
+# --------------------------------------------------
+# CONSTRAINED DECODING FOR N-ATLaS INTENT JSON
+# --------------------------------------------------
+# Shipped into the Modal image next to modal_atlas.py. The grammar itself is
+# plain Python; torch is only touched inside IntentLogitsProcessor.__call__.
+
+# Longest response_text we let the model write before forcing the closing quote
+MAX_RESPONSE_CHARS = 300
+
+WHITESPACE = " \t\n\r"
+# \uXXXX is left out: the model never needs it and it would need its own state
+ESCAPES = '"\\/bfnrt'
+
+_WS = "ws"
+_LIT = "lit"
+_CHOICE = "choice"
+_STRING = "string"
+
+
+def _field(name: str, value) -> list:
+    return [(_LIT, f'"{name}"'), (_WS,), (_LIT, ":"), (_WS,), *value, (_WS,)]
+
+
+def _enum(values: Sequence[str]) -> list:
+    # Options include the closing quote so none is a prefix of another
+    return [(_LIT, '"'), (_CHOICE, tuple(f'{v}"' for v in values))]
+
+
+class IntentGrammar:
+    """
+    Character-level automaton accepting exactly one intent object:
+
+        {"type": ..., "language": "<language>", "action": ..., "device": ...,
+         "response_text": "..."}
+
+    with `type`/`action`/`device` limited to the schemas enums, `language`
+    fixed to the requested code and any whitespace between tokens. The
+    object is complete as soon as its closing brace is read.
+
+    States are small immutable tuples so callers can keep one per sequence.
+    """
+
+    def __init__(self, language: str, max_response_chars: int = MAX_RESPONSE_CHARS):
+        self.max_response_chars = max_response_chars
+        self.elements = [
+            (_WS,), (_LIT, "{"), (_WS,),
+            *_field("type", _enum([t.value for t in IntentType])), (_LIT, ","), (_WS,),
+            *_field("language", [(_LIT, f'"{language}"')]), (_LIT, ","), (_WS,),
+            *_field("action", _enum([a.value for a in Action])), (_LIT, ","), (_WS,),
+            *_field("device", _enum([d.value for d in Device])), (_LIT, ","), (_WS,),
+            *_field("response_text", [(_LIT, '"'), (_STRING,)]),
+            (_LIT, "}"),
+        ]
+
+    def initial(self) -> tuple:
+        return (0, None)
+
+    def is_complete(self, state: Optional[tuple]) -> bool:
+        return state is not None and state[0] == len(self.elements)
+
+    def advance(self, state: Optional[tuple], text: str) -> Optional[tuple]:
+        """State after reading `text`, or None if `text` isn't allowed here."""
+        for ch in text:
+            if state is None:
+                return None
+            state = self._step(state, ch)
+        return state
+
+    def allowed_first_chars(self, state: tuple) -> Optional[str]:
+        """
+        Characters that may come next, or None if almost anything may
+        (inside response_text).
+        """
+        idx, sub = state
+        chars = ""
+        while idx < len(self.elements):
+            element = self.elements[idx]
+            kind = element[0]
+            if kind == _WS:
+                chars += WHITESPACE
+                idx, sub = idx + 1, None
+                continue
+            if kind == _LIT:
+                return chars + element[1][sub or 0]
+            if kind == _CHOICE:
+                prefix = sub or ""
+                return chars + "".join({opt[len(prefix)] for opt in element[1] if opt.startswith(prefix)})
+            return None
+        return chars
+
+    def _step(self, state: tuple, ch: str) -> Optional[tuple]:
+        idx, sub = state
+        while idx < len(self.elements):
+            element = self.elements[idx]
+            kind = element[0]
+
+            if kind == _WS:
+                if ch in WHITESPACE:
+                    return (idx, None)
+                # Zero or more whitespace: move on and retry this char
+                idx, sub = idx + 1, None
+                continue
+
+            if kind == _LIT:
+                text = element[1]
+                pos = sub or 0
+                if text[pos] != ch:
+                    return None
+                pos += 1
+                return (idx + 1, None) if pos == len(text) else (idx, pos)
+
+            if kind == _CHOICE:
+                candidate = (sub or "") + ch
+                matches = [opt for opt in element[1] if opt.startswith(candidate)]
+                if not matches:
+                    return None
+                return (idx + 1, None) if candidate in matches else (idx, candidate)
+
+            # _STRING: JSON string body up to the unescaped closing quote
+            escaped, length = sub or (False, 0)
+            if escaped:
+                return (idx, (False, length + 1)) if ch in ESCAPES else None
+            if ch == '"':
+                return (idx + 1, None)
+            if ch < " " or length >= self.max_response_chars:
+                return None
+            if ch == "\\":
+                return (idx, (True, length + 1))
+            return (idx, (False, length + 1))
+
+        # Past the closing brace nothing more is accepted
+        return None
+
+
+# --------------------------------------------------
+# TOKEN-LEVEL CONSTRAINT
+# --------------------------------------------------
+class TokenVocab:
+    """Decoded text of every token, built once per tokenizer."""
+
+    def __init__(self, tokenizer):
+        special = set(tokenizer.all_special_ids)
+        self.texts: List[Optional[str]] = []
+        self.by_first_char = {}
+        for token_id in range(len(tokenizer)):
+            if token_id in special:
+                self.texts.append(None)
+                continue
+            # Byte-level pieces of a multi-byte character decode to U+FFFD,
+            # which the string rule accepts like any other character
+            text = tokenizer.decode([token_id])
+            self.texts.append(text or None)
+            if text:
+                self.by_first_char.setdefault(text[0], []).append(token_id)
+
+
+class IntentLogitsProcessor:
+    """
+    Masks every token that would take a row's output outside IntentGrammar,
+    then forces EOS once the object is closed so generation stops there.
+
+    Only the `top_k` most likely tokens are checked on each step; if none of
+    them fits, tokens starting with an allowed character are checked instead.
+    """
+
+    def __init__(self, vocab: TokenVocab, grammar: IntentGrammar, eos_token_id: int, top_k: int = 64):
+        self.vocab = vocab
+        self.grammar = grammar
+        self.eos_token_id = eos_token_id
+        self.top_k = top_k
+        self.states: Optional[list] = None
+        self.prompt_len = 0
+
+    def _allowed(self, state: tuple, ranked: List[int]) -> List[Tuple[int, tuple]]:
+        allowed = []
+        for token_id in ranked:
+            text = self.vocab.texts[token_id]
+            if text is None:
+                continue
+            nxt = self.grammar.advance(state, text)
+            if nxt is not None:
+                allowed.append((token_id, nxt))
+        return allowed
+
+    def __call__(self, input_ids, scores):
+        import torch
+
+        if self.states is None:
+            self.prompt_len = input_ids.shape[1]
+            self.states = [self.grammar.initial() for _ in range(input_ids.shape[0])]
+        elif input_ids.shape[1] > self.prompt_len:
+            for row, state in enumerate(self.states):
+                if state is None or self.grammar.is_complete(state):
+                    continue
+                text = self.vocab.texts[int(input_ids[row, -1])]
+                self.states[row] = self.grammar.advance(state, text) if text is not None else None
+
+        mask = torch.full_like(scores, float("-inf"))
+        for row, state in enumerate(self.states):
+            if state is None:
+                # Lost track (shouldn't happen): leave this row unconstrained
+                mask[row] = 0
+                continue
+            if self.grammar.is_complete(state):
+                mask[row, self.eos_token_id] = 0
+                continue
+
+            ranked = torch.topk(scores[row], self.top_k).indices.tolist()
+            allowed = self._allowed(state, ranked)
+            if not allowed:
+                first = self.grammar.allowed_first_chars(state)
+                pool = (
+                    [t for ch in first for t in self.vocab.by_first_char.get(ch, [])]
+                    if first is not None
+                    else range(len(self.vocab.texts))
+                )
+                allowed = self._allowed(state, pool)
+
+            for token_id, _ in allowed:
+                mask[row, token_id] = 0
+
+        return scores + mask
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import metrics
+import shared_store
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# With several workers (SHARED_CACHE_PATH set), only one of them talks to the
+# hardware and keeps N-ATLaS warm. That worker, the leader, polls the
+# temperature sensor, sends the device commands (the other workers queue
+# theirs for it, see devices.py) and runs the warm-keeper's ping loop. It
+# holds an exclusive lock on SHARED_CACHE_PATH + ".leader" for as long as it
+# runs. The others try to take the lock every LEADER_RETRY seconds, so one
+# takes over when the leader exits; the OS releases the lock even on a crash.
+# Without a shared file (one process) this process always leads.
+#
+# LEADER_RETRY   seconds between a follower's attempts to become leader
+RETRY_SECONDS = float(os.getenv("LEADER_RETRY", 2))
+
+
+class Election:
+    """Leadership among the worker processes sharing `path` (None = always leader)."""
+
+    def __init__(self, path: Optional[str], retry: float = RETRY_SECONDS):
+        self.path = path
+        self.retry = retry
+        self.leading = False
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+
+    def try_lead(self) -> bool:
+        """Takes the lock if it is free. Never blocks."""
+        if self.leading:
+            return True
+        if self.path and fcntl is not None:
+            lock_file = open(self.path, "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._file = lock_file
+        elif self.path:
+            logger.warning("File locks aren't available here, every worker leads")
+        self.leading = True
+        return True
+
+    def start(self, on_elected: Callable[[], Awaitable[None]]) -> None:
+        """Awaits on_elected() once this process leads: right away, or when the leader goes."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._campaign(on_elected))
+
+    async def _campaign(self, on_elected: Callable[[], Awaitable[None]]) -> None:
+        while not self.try_lead():
+            await asyncio.sleep(self.retry)
+        if self.path:
+            logger.info(f"Worker {os.getpid()} is the leader")
+        await on_elected()
+
+    async def stop(self) -> None:
+        """Steps down; another worker takes over on its next attempt."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._file is not None:
+            # Closing the file releases the lock
+            self._file.close()
+            self._file = None
+        self.leading = False
+
+
+election = Election(shared_store.SHARED_CACHE_PATH + ".leader" if shared_store.SHARED_CACHE_PATH else None)
+metrics.gauge(
+    "leader",
+    "1 on the worker that polls sensors, sends device commands and keeps N-ATLaS warm",
+    fn=lambda: int(election.leading),
+)
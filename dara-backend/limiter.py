@@ -0,0 +1,57 @@
+import time
+import asyncio
+from typing import Optional
+
+import metrics
+
+# --------------------------------------------------
+# CONCURRENCY LIMITER
+# --------------------------------------------------
+# Caps how many calls to one upstream are in flight at once. Callers past
+# the cap wait in line; once `max_queue` are already waiting, new ones are
+# turned away with LimiterFull instead of piling up behind a slow upstream.
+
+
+class LimiterFull(Exception):
+    """Raised when the wait queue is at its limit."""
+
+
+class Limiter:
+    """
+    asyncio semaphore with a bounded wait queue and metrics:
+    {name}_inflight, {name}_queue_depth, {name}_queue_wait_seconds,
+    {name}_rejected_total.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: Optional[int] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.inflight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.queue_wait = metrics.summary(f"{name}_queue_wait_seconds", f"time spent waiting for a {name} slot")
+        self.rejected = metrics.counter(f"{name}_rejected_total", f"{name} calls turned away because the queue was full")
+        metrics.gauge(f"{name}_inflight", f"{name} calls in progress", fn=lambda: self.inflight)
+        metrics.gauge(f"{name}_queue_depth", f"{name} calls waiting for a slot", fn=lambda: self.waiting)
+
+    async def __aenter__(self) -> "Limiter":
+        if self._semaphore.locked() and self.max_queue is not None and self.waiting >= self.max_queue:
+            self.rejected.inc()
+            raise LimiterFull(f"{self.name}: {self.inflight} in flight and {self.waiting} waiting")
+
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            # Cancellation while queued just leaves the line
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.queue_wait.observe(time.monotonic() - started)
+        self.inflight += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.inflight -= 1
+        self._semaphore.release()
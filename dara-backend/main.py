@@ -1,15 +1,34 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Header, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 import uvicorn
-import io
+from contextlib import asynccontextmanager
+import os
+import asyncio
+import argparse
 import base64
+import json
 import time
 import logging
 import audio_utils
-import stt_whisper as stt_service # Reverted to Whisper
+import devices
+import executors
+import stt_registry as stt_service # Fastest healthy engine per request, see STT_ENGINES
+import stt_local
+import stt_stream
 import reasoning
-import tts
+import sensors
+import metrics
+import http_clients
+import idempotency
+import leader
+import negotiation
+import pipeline
+import tracing
+import vad
+from dataclasses import replace
+from typing import Optional
 from schemas import VoiceResponse
+from text_utils import normalize_language
 
 # Configure structured logging
 logging.basicConfig(
@@ -19,111 +38,664 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-app = FastAPI(title="Dára Home Backend")
+async def _lead():
+    """Runs on the one worker that talks to the hardware and keeps N-ATLaS warm."""
+    reasoning.atlas_keeper.start()
+    await sensors.poller.lead()
+    devices.dispatcher.lead()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_clients.startup()
+    if "local" in stt_service.registry.engines:
+        # Load the local Whisper model before the first request needs it
+        await executors.io.run(stt_local.load)
+    # Until this worker leads, it mirrors the leader's sensor readings and
+    # queues device commands for it (see leader.py)
+    sensors.poller.start()
+    leader.election.start(_lead)
+    yield
+    await sensors.poller.stop()
+    await reasoning.atlas_keeper.stop()
+    await devices.dispatcher.drain()
+    # Released last, so the next leader starts once this one has let go of the devices
+    await leader.election.stop()
+    await http_clients.shutdown()
+    await audio_utils.ffmpeg_pool.close()
+    # Includes the local Whisper pool
+    executors.shutdown()
+    tracing.flush()
+
+
+app = FastAPI(title="Dára Home Backend", lifespan=lifespan)
+
+stream_ttfb = metrics.summary("voice_stream_ttfb_seconds", "time from request to first streamed byte on /voice/stream")
+http_request_seconds = metrics.histogram(
+    "http_request_seconds",
+    "time to response headers, by route",
+    labels=("route", "method", "status"),
+)
 
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    start_time = time.perf_counter()
+    # Root span of the request; joins the caller's trace if it sent a traceparent
+    with tracing.span(f"{request.method} {request.url.path}", parent=request.headers.get("traceparent")) as span:
+        response = await call_next(request)
+        if span is not None:
+            span.set(**{"http.status_code": response.status_code})
+    process_time = time.perf_counter() - start_time
+    # Route template, not the raw path, so unknown URLs can't grow the label set
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    http_request_seconds.labels(route, request.method, str(response.status_code)).observe(process_time)
     logger.info(f"Path: {request.url.path} Method: {request.method} Time: {process_time:.4f}s Status: {response.status_code}")
     return response
 
+# --------------------------------------------------
+# CLIENT DISCONNECTS
+# --------------------------------------------------
+# FastAPI keeps running a handler after its client has gone. The slow stages
+# of /voice, /voice/audio and /voice/stream run through _unless_disconnected
+# so an abandoned request stops holding an STT call or an N-ATLaS slot. A
+# streamed body only notices a gone client when it next writes, which is too
+# late for the stages before the first event. /voice/ws reads the socket.
+client_disconnects = metrics.counter("voice_client_disconnects_total", "requests abandoned mid-pipeline because the client went away")
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has been read, so the only message left is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _unless_disconnected(request: Request, awaitable):
+    """Awaits `awaitable`, cancelling it and raising ClientDisconnected if the client goes away first."""
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.create_task(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+    if work not in done:
+        client_disconnects.inc()
+        raise ClientDisconnected()
+    return work.result()
+
+
+# Response formats per endpoint, default first (see negotiation.py)
+VOICE_FORMATS = [negotiation.JSON, negotiation.MULTIPART, negotiation.AUDIO]
+STREAM_FORMATS = [negotiation.NDJSON, negotiation.MULTIPART]
+
+
+async def _binary_response(media_type: str, transcript: str, language: str, intent, audio_chunks, headers: Optional[dict] = None):
+    """
+    Streams the spoken reply as raw MP3, either alone (intent in X-* headers)
+    or after a JSON metadata part in a multipart/mixed body. No base64.
+    """
+    audio = await negotiation.primed(audio_chunks)
+    if media_type == negotiation.AUDIO:
+        return StreamingResponse(
+            audio,
+            media_type=negotiation.AUDIO,
+            headers={**negotiation.intent_headers(transcript, language, intent), **(headers or {})},
+        )
+
+    parts = negotiation.Multipart()
+    metadata = {"transcript": transcript, "language": language, "intent": intent.model_dump(mode="json")}
+    return StreamingResponse(
+        negotiation.multipart_body(parts, metadata, audio),
+        media_type=parts.media_type,
+        headers={"Vary": "Accept", **(headers or {})},
+    )
+
+
+REPLAYED = {"Idempotent-Replayed": "true"}
+
+
+def _unless_fallback(flight: Optional[idempotency.Flight], reasoning_result: dict) -> Optional[idempotency.Flight]:
+    """
+    The flight, or None once it is abandoned because the reply is a fallback
+    (N-ATLaS cold, busy or failing). A retry must run again, not replay it.
+    """
+    if flight is not None and reasoning.is_fallback(reasoning_result):
+        flight.abandon()
+        return None
+    return flight
+
+
+def _replay_chunks(result: idempotency.VoiceResult):
+    """
+    The original reply audio, or, if its speech synthesis failed, the reply
+    synthesized again. Only the audio is redone; the device isn't touched.
+    """
+    if result.audio:
+        return idempotency.replay_chunks(result.audio)
+    return pipeline.stream_reply(result.response_text, result.language, None)
+
+
+async def _replay_response(media_type: str, result: idempotency.VoiceResult, headers: Optional[dict] = None):
+    """Answers a duplicate upload from the original request's result."""
+    logger.info(f"Replaying result for duplicate upload: '{result.transcript}'")
+    headers = {**REPLAYED, **(headers or {})}
+    if media_type == negotiation.JSON:
+        audio = result.audio or await pipeline.reply_audio(result.response_text, result.language, None)
+        response = VoiceResponse(
+            transcript=result.transcript,
+            language=result.language,
+            intent=result.intent,
+            response_audio=base64.b64encode(audio).decode("utf-8"),
+        )
+        return JSONResponse(response.model_dump(mode="json"), headers=headers)
+    return await _binary_response(
+        media_type, result.transcript, result.language, result.intent, _replay_chunks(result), headers
+    )
+
+
 @app.post("/voice", response_model=VoiceResponse)
-async def process_voice(audio: UploadFile = File(...)):
+async def process_voice(
+    request: Request,
+    audio: UploadFile = File(...),
+    accept: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
     Core endpoint for Dára Home.
-    Accepts audio file, returns transcript, intent, and base64 audio response.
+    Accepts audio file, returns transcript, intent, and the spoken response.
+    The format follows the Accept header:
+      application/json (default)  VoiceResponse with base64 audio
+      multipart/mixed             JSON metadata part + raw audio/mpeg part
+      audio/mpeg                  raw audio, intent in X-* headers
+    The binary formats stream the audio as it is synthesized.
+    A retried upload (same Idempotency-Key, or same audio) gets the first
+    attempt's result, marked with Idempotent-Replayed: true.
     """
+    media_type = negotiation.negotiate(accept, VOICE_FORMATS)
     # Basic check to see if it's actually an audio file
     if not audio.content_type.startswith("audio/") and not audio.filename.lower().endswith(('.mp3', '.mp4', '.wav', '.m4a')):
         # Just a warning for now
         pass
 
+    flight = None
     try:
-        t0 = time.time()
-        
         # Read audio content
         audio_bytes = await audio.read()
         logger.info(f"Received audio: {len(audio_bytes)} bytes. Filename: {audio.filename} Content-Type: {audio.content_type}")
 
         if len(audio_bytes) == 0:
             raise HTTPException(status_code=400, detail="Empty audio file received.")
+
+        # A retry of a request that already ran (or is running) isn't processed twice
+        key, upload = idempotency.request_key(audio_bytes, idempotency_key)
+        replay, flight = await _unless_disconnected(request, idempotency.voice_results.acquire(key, upload))
+        if replay is not None:
+            return await _replay_response(media_type, replay)
+
+        # Per-stage durations (voice_stage_seconds on /metrics, and trace spans)
+        timeline = pipeline.Timeline()
         
         # Normalize audio format first
-        wav_bytes = await audio_utils.convert_to_wav(audio_bytes)
+        with timeline.stage("convert"):
+            wav_bytes = await audio_utils.convert_to_wav(audio_bytes)
         logger.info(f"Converted WAV size: {len(wav_bytes)} bytes")
-        t1 = time.time()
+        # Drop leading/trailing silence; silent clips never reach the paid STT
+        with timeline.stage("vad"):
+            wav_bytes = vad.trim(wav_bytes).wav_bytes
         
-        # Get transcript from Deepgram
-        transcript, language = await stt_service.transcribe(wav_bytes)
-        t2 = time.time()
-        logger.info(f"STT: '{transcript}' ({language}) [{t2-t1:.4f}s]")
+        # Get transcript (Whisper/Deepgram, whichever the registry picks)
+        with timeline.stage("stt"):
+            transcript, language, engine = await _unless_disconnected(request, stt_service.transcribe_with_engine(wav_bytes))
+        logger.info(f"STT ({engine}): '{transcript}' ({language}) [{timeline.last:.4f}s]")
         
-        # Analyze intent
-        reasoning_result = await reasoning.classify_intent(transcript, language)
+        # Analyze intent (likely device confirmations are synthesized meanwhile)
+        with timeline.stage("reasoning"):
+            reasoning_result, speculation = await _unless_disconnected(request, pipeline.classify(transcript, language))
+        flight = _unless_fallback(flight, reasoning_result)
         intent = reasoning_result["intent"]
         response_text = reasoning_result["response_text"]
-        t3 = time.time()
-        logger.info(f"Intent: {intent.type} Action: {intent.action} Device: {intent.device} [{t3-t2:.4f}s]")
+        logger.info(f"Intent: {intent.type} Action: {intent.action} Device: {intent.device} [{timeline.last:.4f}s]")
         
-        # Generate voice response
         response_lang = intent.language or language
-        response_audio_bytes = await tts.generate_audio(response_text, response_lang)
-        t4 = time.time()
-        logger.info(f"TTS: Generated {len(response_audio_bytes)} bytes (raw) [{t4-t3:.4f}s]")
-        
-        logger.info(f"Total Processing Time: {t4-t0:.4f}s")
+        timeline.label(normalize_language(response_lang), engine, intent)
+        decision = idempotency.VoiceResult(upload, transcript, response_lang, intent, response_text, b"")
+        if flight is not None:
+            flight.decided(decision)
+        if media_type != negotiation.JSON:
+            logger.info(f"Streaming reply as {media_type}")
+            chunks = timeline.timed(pipeline.stream_reply(response_text, response_lang, speculation))
+            if flight is not None:
+                # The stream now owns the flight and finishes it with the full audio
+                chunks, flight = flight.record(chunks, decision), None
+            return await _binary_response(media_type, transcript, response_lang, intent, chunks)
+
+        # Generate voice response
+        with timeline.stage("tts"):
+            response_audio_bytes = await pipeline.reply_audio(response_text, response_lang, speculation)
+        logger.info(f"TTS: Generated {len(response_audio_bytes)} bytes (raw) [{timeline.last:.4f}s]")
         
         # Send it back
-        response_audio_b64 = base64.b64encode(response_audio_bytes).decode("utf-8")
-        
-        return VoiceResponse(
-            transcript=transcript,
-            language=response_lang,
-            intent=intent,
-            response_audio=response_audio_b64
-        )
+        with timeline.stage("encode"):
+            response_audio_b64 = base64.b64encode(response_audio_bytes).decode("utf-8")
+            response = VoiceResponse(
+                transcript=transcript,
+                language=response_lang,
+                intent=intent,
+                response_audio=response_audio_b64
+            )
+        timeline.record()
+        if flight is not None:
+            flight.finish(replace(decision, audio=response_audio_bytes))
+        logger.info(f"Total Processing Time: {timeline.elapsed():.4f}s")
+        return response
 
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        logger.info("Client disconnected, request abandoned")
+        # nginx's "client closed request"; nobody is there to read it
+        return Response(status_code=499)
+    except idempotency.IdempotencyConflict as e:
+        logger.info(f"Rejected: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except vad.NoSpeechError as e:
+        logger.info(f"Rejected: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except audio_utils.ConversionBusyError as e:
+        logger.warning(f"Rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Processing Error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if flight is not None:
+            # Failed or abandoned: a duplicate waiting on this one replays the
+            # decision, or runs itself if there was none yet
+            flight.abandon()
 
 
 @app.post("/voice/audio")
-async def process_voice_audio(audio: UploadFile = File(...)):
+async def process_voice_audio(
+    request: Request,
+    audio: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
-    Test endpoint that returns MP3 audio directly.
+    Test endpoint that returns MP3 audio directly, streamed as it is
+    synthesized. Transcript and intent come back in X-* headers
+    (percent-encoded UTF-8). Retries are deduplicated as on /voice.
     """
+    download = {"Content-Disposition": "attachment; filename=response.mp3"}
+    flight = None
     try:
         audio_bytes = await audio.read()
-        wav_bytes = await audio_utils.convert_to_wav(audio_bytes)
-        transcript, language = await stt_service.transcribe(wav_bytes)
+        key, upload = idempotency.request_key(audio_bytes, idempotency_key)
+        replay, flight = await _unless_disconnected(request, idempotency.voice_results.acquire(key, upload))
+        if replay is not None:
+            return await _replay_response(negotiation.AUDIO, replay, download)
+
+        timeline = pipeline.Timeline()
+        with timeline.stage("convert"):
+            wav_bytes = await audio_utils.convert_to_wav(audio_bytes)
+        with timeline.stage("vad"):
+            wav_bytes = vad.trim(wav_bytes).wav_bytes
+        with timeline.stage("stt"):
+            transcript, language, engine = await _unless_disconnected(request, stt_service.transcribe_with_engine(wav_bytes))
         
-        reasoning_result = await reasoning.classify_intent(transcript, language)
+        with timeline.stage("reasoning"):
+            reasoning_result, speculation = await _unless_disconnected(request, pipeline.classify(transcript, language))
+        flight = _unless_fallback(flight, reasoning_result)
         intent = reasoning_result["intent"]
         response_text = reasoning_result["response_text"]
         
         response_lang = intent.language or language
-        response_audio_base64 = await tts.generate_audio(response_text, response_lang)
-        
-        # Decode base64 to raw MP3 bytes
-        audio_mp3 = base64.b64decode(response_audio_base64)
-        
-        return StreamingResponse(
-            io.BytesIO(audio_mp3),
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": "attachment; filename=response.mp3",
-                "X-Transcript": transcript,
-                "X-Language": language
-            }
-        )
+        timeline.label(normalize_language(response_lang), engine, intent)
+        chunks = timeline.timed(pipeline.stream_reply(response_text, response_lang, speculation))
+        if flight is not None:
+            result = idempotency.VoiceResult(upload, transcript, response_lang, intent, response_text, b"")
+            chunks, flight = flight.record(chunks, result), None
+        return await _binary_response(negotiation.AUDIO, transcript, response_lang, intent, chunks, download)
 
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        logger.info("Client disconnected, request abandoned")
+        # nginx's "client closed request"; nobody is there to read it
+        return Response(status_code=499)
+    except idempotency.IdempotencyConflict as e:
+        logger.info(f"Rejected: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except vad.NoSpeechError as e:
+        logger.info(f"Rejected: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except audio_utils.ConversionBusyError as e:
+        logger.warning(f"Rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Processing Error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if flight is not None:
+            # Failed or abandoned: a duplicate waiting on this one replays the
+            # decision, or runs itself if there was none yet
+            flight.abandon()
+
+def _stream_event(event: str, **fields) -> bytes:
+    return (json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def _ndjson_events(events):
+    async for event, fields in events:
+        if event == "audio":
+            fields = {"data": base64.b64encode(fields).decode("ascii")}
+        yield _stream_event(event, **fields)
+
+
+async def _multipart_events(events, parts: negotiation.Multipart):
+    # Audio chunks are concatenated into a single audio/mpeg part
+    in_audio = False
+    async for event, fields in events:
+        if event == "audio":
+            if not in_audio:
+                in_audio = True
+                yield parts.part_header(negotiation.AUDIO, "audio")
+            yield fields
+            continue
+        in_audio = False
+        yield parts.json_part({"event": event, **fields}, event)
+    yield parts.close()
+
+
+@app.post("/voice/stream")
+async def process_voice_stream(
+    request: Request,
+    audio: UploadFile = File(...),
+    accept: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """
+    Streaming variant of /voice.
+    Responds with newline-delimited JSON events, each sent as soon as it is known:
+      {"event": "transcript", "transcript": ..., "language": ...}
+      {"event": "intent", "intent": {...}}
+      {"event": "audio", "data": <base64 mp3 chunk>}   (repeated)
+      {"event": "done", "ttfb_ms": ..., "total_ms": ...}
+    or {"event": "error", "detail": ...} if a stage fails.
+    With Accept: multipart/mixed the same events arrive as JSON parts and the
+    audio as one raw audio/mpeg part, without base64.
+    Clients can act on the intent before the spoken reply has finished.
+    A retried upload replays the first attempt's events (see /voice).
+    """
+    t0 = time.time()
+    media_type = negotiation.negotiate(accept, STREAM_FORMATS)
+    audio_bytes = await audio.read()
+    logger.info(f"Received audio (stream): {len(audio_bytes)} bytes. Filename: {audio.filename} Content-Type: {audio.content_type}")
+
+    if len(audio_bytes) == 0:
+        raise HTTPException(status_code=400, detail="Empty audio file received.")
+
+    key, upload = idempotency.request_key(audio_bytes, idempotency_key)
+    try:
+        replay, flight = await _unless_disconnected(request, idempotency.voice_results.acquire(key, upload))
+    except ClientDisconnected:
+        logger.info("Client disconnected, request abandoned")
+        return Response(status_code=499)
+    except idempotency.IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    headers = {"Vary": "Accept", **(REPLAYED if replay is not None else {})}
+
+    # The body streams after this handler returns; keep the request span
+    root = tracing.current()
+
+    async def replayed():
+        logger.info(f"Replaying result for duplicate upload: '{replay.transcript}'")
+        yield "transcript", {"transcript": replay.transcript, "language": replay.language}
+        yield "intent", {"intent": replay.intent.model_dump(mode="json")}
+        async for chunk in _replay_chunks(replay):
+            yield "audio", chunk
+        total_ms = round((time.time() - t0) * 1000)
+        yield "done", {"ttfb_ms": total_ms, "total_ms": total_ms}
+
+    async def events():
+        nonlocal flight
+        ttfb = None
+
+        def first_byte():
+            nonlocal ttfb
+            if ttfb is None:
+                ttfb = time.time() - t0
+                stream_ttfb.observe(ttfb)
+                logger.info(f"Stream TTFB: {ttfb:.4f}s")
+
+        try:
+            timeline = pipeline.Timeline(parent=root)
+            with timeline.stage("convert"):
+                wav_bytes = await audio_utils.convert_to_wav(audio_bytes)
+            with timeline.stage("vad"):
+                wav_bytes = vad.trim(wav_bytes).wav_bytes
+
+            with timeline.stage("stt"):
+                transcript, language, engine = await _unless_disconnected(request, stt_service.transcribe_with_engine(wav_bytes))
+            logger.info(f"STT ({engine}): '{transcript}' ({language}) [{timeline.last:.4f}s]")
+            first_byte()
+            yield "transcript", {"transcript": transcript, "language": language}
+
+            with timeline.stage("reasoning"):
+                reasoning_result, speculation = await _unless_disconnected(request, pipeline.classify(transcript, language))
+            flight = _unless_fallback(flight, reasoning_result)
+            intent = reasoning_result["intent"]
+            response_text = reasoning_result["response_text"]
+            logger.info(f"Intent: {intent.type} Action: {intent.action} Device: {intent.device} [{timeline.last:.4f}s]")
+            yield "intent", {"intent": intent.model_dump(mode="json")}
+
+            response_lang = intent.language or language
+            timeline.label(normalize_language(response_lang), engine, intent)
+            decision = idempotency.VoiceResult(upload, transcript, response_lang, intent, response_text, b"")
+            if flight is not None:
+                flight.decided(decision)
+            sent = []
+            async for chunk in timeline.timed(pipeline.stream_reply(response_text, response_lang, speculation)):
+                sent.append(chunk)
+                yield "audio", chunk
+            audio_out = b"".join(sent)
+            logger.info(f"TTS: Streamed {len(audio_out)} bytes [{timeline.last:.4f}s]")
+            if flight is not None:
+                flight.finish(replace(decision, audio=audio_out))
+            t4 = time.time()
+            logger.info(f"Total Processing Time: {t4-t0:.4f}s")
+
+            yield "done", {"ttfb_ms": round(ttfb * 1000), "total_ms": round((t4 - t0) * 1000)}
+
+        except ClientDisconnected:
+            logger.info("Client disconnected, stream abandoned")
+        except Exception as e:
+            logger.error(f"Processing Error: {str(e)}", exc_info=True)
+            first_byte()
+            yield "error", {"detail": str(e)}
+        finally:
+            if flight is not None:
+                flight.abandon()
+
+    source = replayed() if replay is not None else events()
+    if media_type == negotiation.MULTIPART:
+        parts = negotiation.Multipart()
+        return StreamingResponse(_multipart_events(source, parts), media_type=parts.media_type, headers=headers)
+    return StreamingResponse(_ndjson_events(source), media_type=negotiation.NDJSON, headers=headers)
+
+
+@app.websocket("/voice/ws")
+async def voice_ws(websocket: WebSocket, language: str = "en"):
+    """
+    Streaming speech recognition. The client sends 16 kHz mono s16le PCM as
+    binary frames while the user speaks, then {"type": "end"}. Frames are
+    forwarded to Deepgram live as they arrive. The server sends:
+      {"event": "partial", "transcript": ..., "final": bool}     as recognition progresses
+      {"event": "intent", "intent": {...}, "early": true}         a device command, sent to the device before the user stops
+      {"event": "transcript", "transcript": ..., "language": ...}
+      {"event": "intent", "intent": {...}, "revised": bool}       unless the early intent still holds
+      binary frames                                               the spoken reply (MP3)
+      {"event": "done", "total_ms": ...}
+    or {"event": "error", "detail": ...}.
+    """
+    await websocket.accept()
+    lang = normalize_language(language)
+    utterance = stt_stream.Utterance(lang)
+    # The command sent from the early intent, if any
+    early_command = None
+    t0 = time.time()
+    with tracing.span("WS /voice/ws", language=lang):
+        try:
+            async with stt_stream.StreamingSession(lang) as session:
+
+                async def listen():
+                    nonlocal early_command
+                    async for result in session.results():
+                        early = utterance.update(result)
+                        await websocket.send_json({"event": "partial", "transcript": utterance.text, "final": result.is_final})
+                        if early is not None:
+                            logger.info(f"Early intent from partial '{utterance.text}': {early['intent'].action} {early['intent'].device}")
+                            # Switch the device now; if the full sentence says otherwise,
+                            # the revised intent is classified and dispatched below
+                            early_command = devices.dispatch(early["intent"])
+                            await websocket.send_json({"event": "intent", "intent": early["intent"].model_dump(mode="json"), "early": True})
+
+                listener = asyncio.create_task(listen())
+                try:
+                    while True:
+                        message = await websocket.receive()
+                        if message["type"] == "websocket.disconnect":
+                            logger.info("Voice WebSocket closed by client mid-utterance")
+                            return
+                        if message.get("bytes"):
+                            await session.send_audio(message["bytes"])
+                        elif message.get("text") and json.loads(message["text"]).get("type") == "end":
+                            break
+                    # Stages are timed from end of speech; the session itself lasts as long as the user talks
+                    timeline = pipeline.Timeline()
+                    with timeline.stage("stt"):
+                        await session.finish()
+                        # Deepgram flushes the last segments, then closes its side
+                        await listener
+                finally:
+                    listener.cancel()
+
+            utterance.close()
+            transcript = utterance.final_text or utterance.text
+            logger.info(f"Streaming STT: '{transcript}' ({lang}) [{time.time()-t0:.4f}s session, {timeline.last:.4f}s after speech]")
+            await websocket.send_json({"event": "transcript", "transcript": transcript, "language": lang})
+
+            speculation = None
+            if utterance.early_still_holds():
+                # A temperature question is answered with the latest polled reading
+                reasoning_result = sensors.answer(utterance.early)
+                timeline.mark("reasoning")
+            else:
+                with timeline.stage("reasoning"):
+                    reasoning_result, speculation = await pipeline.classify(transcript, lang)
+                if early_command is not None:
+                    # "turn on the light... no wait": switch it back
+                    devices.revert(utterance.early["intent"], reasoning_result["intent"])
+                await websocket.send_json({
+                    "event": "intent",
+                    "intent": reasoning_result["intent"].model_dump(mode="json"),
+                    "revised": utterance.early is not None,
+                })
+
+            intent = reasoning_result["intent"]
+            timeline.label(normalize_language(intent.language or lang), "deepgram_live", intent)
+            async for chunk in timeline.timed(pipeline.stream_reply(reasoning_result["response_text"], intent.language or lang, speculation)):
+                await websocket.send_bytes(chunk)
+            await websocket.send_json({"event": "done", "total_ms": round((time.time() - t0) * 1000)})
+
+        except Exception as e:
+            logger.error(f"Voice WebSocket Error: {str(e)}", exc_info=True)
+            try:
+                await websocket.send_json({"event": "error", "detail": str(e)})
+            except Exception:
+                return
+    await websocket.close()
+
+
+@app.get("/sensors/temperature")
+async def temperature_history(since: float = 0):
+    """
+    Polled temperature readings per controller, oldest first, as parallel
+    arrays: {"controller URL": {"t": [unix seconds, ...], "c": [°C, ...]}}.
+    `since` (unix seconds) returns only newer readings.
+    """
+    await sensors.poller.refresh()
+    return {
+        "interval": sensors.poller.interval,
+        "max_age": sensors.poller.max_age,
+        "controllers": sensors.poller.history(since),
+    }
+
+
+@app.get("/stats")
+async def stats():
+    """
+    Snapshot of in-process counters (cache hits/misses/evictions, etc).
+    """
+    return metrics.snapshot()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    The same metrics in Prometheus text format, plus per-stage latency
+    histograms (voice_stage_seconds) for percentiles.
+    """
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# --------------------------------------------------
+# LAUNCH
+# --------------------------------------------------
+# python main.py                development: one process, reloads on edits
+# python main.py --workers 4    production: N processes sharing the port
+#
+# Each production worker runs the lifespan (HTTP clients, local Whisper)
+# before it accepts a connection, then one of them is elected to run the
+# keeper, the sensor poller and the device commands (leader.py). On SIGTERM it stops
+# accepting, then finishes in-flight requests for up to
+# SERVER_GRACEFUL_TIMEOUT seconds before the lifespan shutdown runs.
+#
+# WEB_CONCURRENCY          worker count when --workers isn't given (0 = development)
+# SERVER_GRACEFUL_TIMEOUT  seconds to drain in-flight requests on shutdown
+WORKERS = int(os.getenv("WEB_CONCURRENCY", 0))
+GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+
+
+def serve(argv=None):
+    parser = argparse.ArgumentParser(description="Dára Home backend")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes (0 = development server with reload)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    args = parser.parse_args(argv)
+
+    if args.workers <= 0:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
+        return
+
+    # Workers are fresh interpreters that inherit the environment, so this
+    # reaches each one's shared_store before its caches are built
+    os.environ.setdefault("SHARED_CACHE_PATH", os.path.abspath("dara_cache.sqlite3"))
+    logger.info(f"Starting {args.workers} workers, shared cache at {os.environ['SHARED_CACHE_PATH']}")
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    serve()
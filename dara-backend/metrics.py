@@ -0,0 +1,267 @@
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+# --------------------------------------------------
+# IN-PROCESS METRICS REGISTRY
+# --------------------------------------------------
+# Counters and gauges are registered once by name (usually at module import)
+# and read back as a flat snapshot by the /stats endpoint, or in Prometheus
+# text format by /metrics.
+#
+# Labelled metrics are families: `family.labels("en", "whisper")` returns the
+# child for those values (created on first use, a dict lookup afterwards).
+# On hot paths, resolve the child once and keep it.
+
+Number = Union[int, float]
+
+# Seconds; covers a cached fast-path reply up to an N-ATLaS cold start
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.value: Number = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: Number = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def collect(self) -> Number:
+        return self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str = "", fn: Optional[Callable[[], Number]] = None):
+        self.name = name
+        self.description = description
+        self.value: Number = 0
+        self._fn = fn
+
+    def set(self, value: Number) -> None:
+        self.value = value
+
+    def collect(self) -> Number:
+        if self._fn is not None:
+            return self._fn()
+        return self.value
+
+
+class Summary:
+    """Count, sum and max of observed values (e.g. latencies in seconds)."""
+    kind = "summary"
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.count = 0
+        self.sum: Number = 0
+        self.max: Number = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: Number) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def collect(self) -> Dict[str, Number]:
+        return {"count": self.count, "sum": self.sum, "max": self.max}
+
+
+class Histogram:
+    """Observations counted into fixed buckets, for percentiles in Prometheus."""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # One slot per upper bound plus +Inf; cumulated when collected
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum: Number = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: Number) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def collect(self) -> dict:
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative, buckets = 0, {}
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            buckets[_format_value(bound)] = cumulative
+        buckets["+Inf"] = count
+        return {"count": count, "sum": total, "buckets": buckets}
+
+
+class Family:
+    """A labelled metric: one child of `cls` per combination of label values."""
+
+    def __init__(self, cls, name: str, description: str = "", labels: Sequence[str] = (), **kwargs):
+        self.cls = cls
+        self.kind = cls.kind
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labels)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.cls(self.name, self.description, **self._kwargs)
+                    self.children[values] = child
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self.children.items())
+
+    def collect(self) -> dict:
+        return {
+            ",".join(f"{k}={v}" for k, v in zip(self.labelnames, values)): child.collect()
+            for values, child in self.items()
+        }
+
+
+_registry: Dict[str, Union[Counter, Gauge, Summary, Histogram, Family]] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name: str, description: str, labels: Sequence[str] = (), **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            if labels:
+                metric = Family(cls, name, description, labels, **kwargs)
+            else:
+                metric = cls(name, description, **kwargs)
+            _registry[name] = metric
+        elif metric.kind != cls.kind or tuple(labels) != getattr(metric, "labelnames", ()):
+            raise ValueError(f"Metric {name} already registered as a {metric.kind} with labels {getattr(metric, 'labelnames', ())}")
+        return metric
+
+
+def counter(name: str, description: str = "", labels: Sequence[str] = ()) -> Counter:
+    """Get or create the counter registered under `name` (a Family if `labels`)."""
+    return _register(Counter, name, description, labels)
+
+
+def gauge(name: str, description: str = "", fn: Optional[Callable[[], Number]] = None, labels: Sequence[str] = ()) -> Gauge:
+    """
+    Get or create a gauge. If `fn` is given it is called on every read;
+    children of a labelled gauge are set() instead.
+    """
+    if fn is not None and labels:
+        raise ValueError(f"Gauge {name}: fn can't be shared by labelled children")
+    return _register(Gauge, name, description, labels, fn=fn)
+
+
+def summary(name: str, description: str = "") -> Summary:
+    """Get or create the summary registered under `name`."""
+    return _register(Summary, name, description)
+
+
+def histogram(name: str, description: str = "", labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create the histogram registered under `name` (a Family if `labels`)."""
+    return _register(Histogram, name, description, labels, buckets=buckets)
+
+
+def ratio(numerator: Counter, denominator_parts: list) -> float:
+    """numerator / sum(denominator_parts), or 0.0 before anything was counted."""
+    total = sum(c.value for c in denominator_parts)
+    return numerator.value / total if total else 0.0
+
+
+def snapshot() -> dict:
+    """Current value of every registered metric, keyed by name."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: m.collect() for m in metrics}
+
+
+# --------------------------------------------------
+# PROMETHEUS TEXT FORMAT
+# --------------------------------------------------
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: Number) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _samples(metric, pairs) -> list:
+    """(suffix, label pairs, value) rows for one unlabelled metric."""
+    if metric.kind == "histogram":
+        data = metric.collect()
+        rows = [("_bucket", pairs + [("le", le)], n) for le, n in data["buckets"].items()]
+        return rows + [("_sum", pairs, data["sum"]), ("_count", pairs, data["count"])]
+    if metric.kind == "summary":
+        return [("_sum", pairs, metric.sum), ("_count", pairs, metric.count)]
+    return [("", pairs, metric.collect())]
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+
+    lines = []
+    for metric in metrics:
+        if isinstance(metric, Family):
+            children = [(list(zip(metric.labelnames, values)), child) for values, child in metric.items()]
+        else:
+            children = [([], metric)]
+
+        lines.append(f"# HELP {metric.name} {_escape(metric.description)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for pairs, child in children:
+            for suffix, labels, value in _samples(child, pairs):
+                lines.append(f"{metric.name}{suffix}{_label_text(labels)} {_format_value(value)}")
+
+        # Prometheus summaries have no max; expose it alongside as a gauge
+        if metric.kind == "summary":
+            lines.append(f"# TYPE {metric.name}_max gauge")
+            for pairs, child in children:
+                lines.append(f"{metric.name}_max{_label_text(pairs)} {_format_value(child.max)}")
+    return "\n".join(lines) + "\n"
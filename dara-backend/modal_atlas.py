@@ -1,5 +1,22 @@
 import modal
 import os
+import time
+from typing import Optional
+
+from fastapi import Header
+
+import tracing
+
+# Micro-batching: concurrent requests arriving within BATCH_WAIT_MS of each
+# other are decoded together, up to BATCH_MAX_SIZE at a time.
+BATCH_MAX_SIZE = int(os.getenv("ATLAS_BATCH_MAX_SIZE", 8))
+BATCH_WAIT_MS = float(os.getenv("ATLAS_BATCH_WAIT_MS", 25))
+
+# Constrained decoding: the model can only emit a valid intent object and
+# stops as soon as it closes, so MAX_NEW_TOKENS is just a safety cap.
+# Set ATLAS_CONSTRAINED_DECODING=0 to compare against free sampling.
+CONSTRAINED_DECODING = os.getenv("ATLAS_CONSTRAINED_DECODING", "1") != "0"
+MAX_NEW_TOKENS = int(os.getenv("ATLAS_MAX_NEW_TOKENS", 320))
 
 def download_model():
     from huggingface_hub import snapshot_download
@@ -13,66 +30,24 @@ image = (
         download_model,
         secrets=[modal.Secret.from_name("my-huggingface-secret")]
     )
+    .env({
+        "ATLAS_BATCH_MAX_SIZE": str(BATCH_MAX_SIZE),
+        "ATLAS_BATCH_WAIT_MS": str(BATCH_WAIT_MS),
+        "ATLAS_CONSTRAINED_DECODING": "1" if CONSTRAINED_DECODING else "0",
+        "ATLAS_MAX_NEW_TOKENS": str(MAX_NEW_TOKENS),
+    })
+    .add_local_python_source("atlas_batching", "atlas_prefix", "intent_grammar", "schemas", "tracing")
 )
 
 app = modal.App("dara-atlas", image=image)
 
-# Define the Model Class
-@app.cls(
-    gpu="A10G",
-    secrets=[modal.Secret.from_name("my-huggingface-secret")],
-    timeout=600,
-    scaledown_window=300,
-)
-class AtlasModel:
-    @modal.enter()
-    def load_model(self):
-        import torch
-        from transformers import AutoTokenizer, AutoModelForCausalLM
-        
-        print("Loading N-ATLaS with transformers...")
-        self.tokenizer = AutoTokenizer.from_pretrained("NCAIR1/N-ATLaS")
-        self.model = AutoModelForCausalLM.from_pretrained(
-            "NCAIR1/N-ATLaS",
-            torch_dtype=torch.float16,
-            device_map="auto",
-            trust_remote_code=True
-        )
-        print("Model loaded successfully!")
+# Languages whose system prompt is prefilled into a KV cache at start-up
+PREFIX_LANGUAGES = ["en", "yo", "ha", "ig"]
 
-    @modal.method()
-    def generate(self, messages: list):
-        # Use Chat Template
-        text_prompt = self.tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
-        
-        inputs = self.tokenizer(text_prompt, return_tensors="pt").to(self.model.device)
-        
-        outputs = self.model.generate(
-            **inputs,
-            max_new_tokens=512,
-            temperature=0.7,
-            do_sample=True,
-            pad_token_id=self.tokenizer.eos_token_id,
-        )
-        
-        # Decode only the new tokens
-        response = self.tokenizer.decode(outputs[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)
-        return response
 
-# Define the Web Endpoint
-@app.function()
-@modal.fastapi_endpoint(method="POST")
-def inference(item: dict):
-    # Expected input: {"transcript": "...", "language": "..."}
-    transcript = item.get("transcript", "")
-    language = item.get("language", "en")
-    
-    # Construct the system prompt
-    system_prompt = f"""
+def build_system_prompt(language: str) -> str:
+    # Identical for every request apart from the {language} placeholder
+    return f"""
 You are Dára Home, a multilingual Nigerian smart home assistant, similar to Alexa or Google Home. You are designed to help users with:
 
 1. Conversational interactions (friendly chat, questions, greetings)
@@ -101,8 +76,11 @@ a) CONVERSATION:
 b) INSTRUCTION:
 - Commands to control smart home devices.
 - Extract the device and action explicitly.
-- Supported devices: LIGHT, FAN
-- Supported actions: TURN_ON, TURN_OFF
+- Supported devices: LIGHT, FAN, TEMPERATURE
+- Supported actions: TURN_ON, TURN_OFF (LIGHT, FAN), CHECK (TEMPERATURE)
+- A question about the room temperature ("how hot is it?") is an INSTRUCTION
+  with action CHECK and device TEMPERATURE. The backend reads the sensor and
+  fills in the reading, so just say you are checking.
 - Do NOT invent unsupported devices or actions.
 
 ---
@@ -112,8 +90,8 @@ b) INSTRUCTION:
 {{
   "type": "CONVERSATION" or "INSTRUCTION",
   "language": "{language}",
-  "action": "TURN_ON | TURN_OFF | NONE",
-  "device": "LIGHT | FAN | NONE",
+  "action": "TURN_ON | TURN_OFF | CHECK | NONE",
+  "device": "LIGHT | FAN | TEMPERATURE | NONE",
   "response_text": "REQUIRED: string in the user's language. NEVER null. NEVER empty."
 }}
 - The field `response_text` is MANDATORY. It must be a friendly, spoken-style sentence.
@@ -180,6 +158,17 @@ Output:
   "response_text": "Lafiya kalau! Yaya kuke?"
 }}
 
+Example 5 (English):
+Input: "What's the temperature in the room?"
+Output:
+{{
+  "type": "INSTRUCTION",
+  "language": "en",
+  "action": "CHECK",
+  "device": "TEMPERATURE",
+  "response_text": "Let me check the temperature."
+}}
+
 ---
 
 6. ADDITIONAL RULES
@@ -198,14 +187,190 @@ Output:
 Your job: analyze the input, determine the intent, generate a friendly, culturally relevant response in the correct language, and return **only JSON** following the rules above.
 """
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": transcript}
-    ]
-    
-    # Run Generation
+
+# Define the Model Class
+@app.cls(
+    gpu="A10G",
+    secrets=[modal.Secret.from_name("my-huggingface-secret")],
+    timeout=600,
+    scaledown_window=300,
+)
+# Let concurrent calls land in the same container so they can be batched
+@modal.concurrent(max_inputs=BATCH_MAX_SIZE)
+class AtlasModel:
+    @modal.enter()
+    def load_model(self):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        
+        print("Loading N-ATLaS with transformers...")
+        self.tokenizer = AutoTokenizer.from_pretrained("NCAIR1/N-ATLaS")
+        self.model = AutoModelForCausalLM.from_pretrained(
+            "NCAIR1/N-ATLaS",
+            torch_dtype=torch.float16,
+            device_map="auto",
+            trust_remote_code=True
+        )
+        print("Model loaded successfully!")
+
+        # Tokenize and prefill the system prompt once per language; requests
+        # then only prefill their own user turn
+        from atlas_prefix import PrefixCache, split_chat_prompt
+        self.prompt_tails = {}
+        self.prefixes = {}
+        for lang in PREFIX_LANGUAGES:
+            prefix_text, self.prompt_tails[lang] = split_chat_prompt(self.tokenizer, build_system_prompt(lang))
+            self.prefixes[lang] = PrefixCache(self.tokenizer, self.model, prefix_text)
+            print(f"Prefix cache [{lang}]: {len(self.prefixes[lang])} tokens in {self.prefixes[lang].build_seconds:.2f}s")
+
+        # Decoded text of every token, for the JSON grammar constraint
+        from intent_grammar import TokenVocab
+        started = time.perf_counter()
+        self.vocab = TokenVocab(self.tokenizer)
+        eos = self.model.generation_config.eos_token_id
+        self.eos_token_id = eos[0] if isinstance(eos, list) else eos
+        if self.eos_token_id is None:
+            self.eos_token_id = self.tokenizer.eos_token_id
+        print(f"Token vocab for constrained decoding built in {time.perf_counter() - started:.2f}s")
+
+        from atlas_batching import MicroBatcher
+        self.batcher = MicroBatcher(
+            self._generate_batch,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait=BATCH_WAIT_MS / 1000,
+        )
+
+    def _constraint(self, language: str) -> list:
+        # Fresh per generate() call: the processor tracks each row's progress
+        if not CONSTRAINED_DECODING:
+            return []
+        from intent_grammar import IntentGrammar, IntentLogitsProcessor
+        return [IntentLogitsProcessor(self.vocab, IntentGrammar(language), self.eos_token_id)]
+
+    def _generate_batch(self, batch: list) -> list:
+        from atlas_batching import generate_batch
+        from atlas_prefix import generate_with_prefix
+        from transformers import LogitsProcessorList
+
+        gen_kwargs = dict(max_new_tokens=MAX_NEW_TOKENS, temperature=0.7, do_sample=True)
+        results = [None] * len(batch)
+
+        # Requests sharing a language share a cached prefix and decode together
+        by_language = {}
+        for i, (transcript, language) in enumerate(batch):
+            by_language.setdefault(language, []).append(i)
+
+        for language, indices in by_language.items():
+            started_ns = time.time_ns()
+            transcripts = [batch[i][0].strip() for i in indices]
+            if language in self.prefixes:
+                tail = self.prompt_tails[language]
+                outputs = generate_with_prefix(
+                    self.tokenizer,
+                    self.model,
+                    self.prefixes[language],
+                    [t + tail for t in transcripts],
+                    logits_processors=self._constraint(language),
+                    **gen_kwargs,
+                )
+            else:
+                # Unknown language code: no cached prefix, full prefill
+                prompts = [
+                    self.tokenizer.apply_chat_template(
+                        [
+                            {"role": "system", "content": build_system_prompt(language)},
+                            {"role": "user", "content": t},
+                        ],
+                        tokenize=False,
+                        add_generation_prompt=True,
+                    )
+                    for t in transcripts
+                ]
+                generated = generate_batch(
+                    self.tokenizer,
+                    self.model,
+                    prompts,
+                    logits_processor=LogitsProcessorList(self._constraint(language)),
+                    **gen_kwargs,
+                )
+                outputs = [
+                    (text, {"prefix_tokens_reused": 0, "batch_size": len(prompts), "tokens_generated": n})
+                    for text, n in generated
+                ]
+
+            finished_ns = time.time_ns()
+            for i, (text, stats) in zip(indices, outputs):
+                stats["constrained"] = CONSTRAINED_DECODING
+                # Wall-clock bounds of this language group's decode, for tracing
+                timing = {"started_ns": started_ns, "finished_ns": finished_ns}
+                results[i] = {"text": text, "stats": stats, "timing": timing}
+
+        print(f"Decoded batch of {len(batch)} ({self.batcher.stats()})")
+        return results
+
+    @modal.method()
+    def ping(self):
+        # Cheap call used by the backend's warm-keeper to keep this container up
+        return "ok"
+
+    def _spans(self, traceparent: str, submitted_ns: int, timing: dict, stats: dict) -> list:
+        # Rebuilt after the fact: the batch was decoded on the batcher's thread
+        started, finished = timing["started_ns"], timing["finished_ns"]
+        prefill_end = started + int(stats.get("prefill_ms", 0) * 1_000_000)
+        with tracing.collect() as spans:
+            parent = tracing.record_span(
+                "atlas.generate", submitted_ns, time.time_ns(), traceparent,
+                **{"atlas.batch_size": stats.get("batch_size"), "atlas.constrained": stats.get("constrained")},
+            )
+            tracing.record_span("atlas.queue", submitted_ns, started, parent)
+            if "prefill_ms" in stats:
+                tracing.record_span(
+                    "atlas.prefill", started, prefill_end, parent,
+                    **{"atlas.prompt_tokens": stats.get("prompt_tokens"), "atlas.prefix_tokens_reused": stats.get("prefix_tokens_reused")},
+                )
+            tracing.record_span(
+                "atlas.decode", prefill_end, finished, parent,
+                **{"atlas.tokens_generated": stats.get("tokens_generated")},
+            )
+        return spans
+
+    @modal.method()
+    def generate(self, transcript: str, language: str, traceparent: Optional[str] = None) -> dict:
+        # Waits for the micro-batcher to decode this prompt alongside any
+        # other requests that arrived in the same window.
+        # Returns {"text": ..., "stats": {prefill_ms, prefix_tokens_reused, ...}},
+        # plus "spans" (OTLP/JSON) when the caller sent a trace context
+        submitted_ns = time.time_ns()
+        result = self.batcher.submit((transcript, language))
+        timing = result.pop("timing")
+        if traceparent:
+            result["spans"] = self._spans(traceparent, submitted_ns, timing, result["stats"])
+        return result
+
+# Define the Web Endpoint
+@app.function()
+# Many requests in flight at once so AtlasModel sees them together
+@modal.concurrent(max_inputs=BATCH_MAX_SIZE * 4)
+@modal.fastapi_endpoint(method="POST")
+def inference(item: dict, traceparent: Optional[str] = Header(None)):
+    # Expected input: {"transcript": "...", "language": "..."}
+    # or {"ping": true} from the backend's warm-keeper
+    # A W3C traceparent header (sent by the backend when tracing is on) makes
+    # the reply carry this container's spans, for the backend to export.
+    if item.get("ping"):
+        return {"status": AtlasModel().ping.remote()}
+
+    transcript = item.get("transcript", "")
+    language = item.get("language", "en")
+
+    # Run Generation (system prompt is built and cached inside AtlasModel)
     print("Sending prompt to model...")
     model = AtlasModel()
-    response_text = model.generate.remote(messages)
+    spans = []
+    if tracing.parse_traceparent(traceparent):
+        with tracing.collect() as spans, tracing.span("atlas.inference", parent=traceparent, language=language) as span:
+            result = model.generate.remote(transcript, language, span.traceparent)
+    else:
+        result = model.generate.remote(transcript, language)
     
-    return {"generated_text": response_text}
+    return {"generated_text": result["text"], "stats": result["stats"], "spans": spans + result.get("spans", [])}
@@ -0,0 +1,152 @@
+import json
+import logging
+import secrets
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONTENT NEGOTIATION FOR THE VOICE ENDPOINTS
+# --------------------------------------------------
+# JSON      the original VoiceResponse, audio base64-encoded (default)
+# MULTIPART multipart/mixed: a JSON metadata part, then the raw MP3 part
+# AUDIO     raw audio/mpeg body, transcript and intent in X-* headers
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+MULTIPART = "multipart/mixed"
+AUDIO = "audio/mpeg"
+
+
+def negotiate(accept: Optional[str], offered: list) -> str:
+    """
+    Picks the best of `offered` for an Accept header. Ties on q-value go to
+    the more specific range, then to the one the client listed first.
+    Falls back to offered[0], the endpoint's default, when nothing matches
+    or no header was sent.
+    """
+    if not accept:
+        return offered[0]
+
+    best = None  # ((q, specificity, -position), media_type)
+    for position, item in enumerate(accept.split(",")):
+        fields = [f.strip() for f in item.split(";")]
+        media_range = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+
+        range_type, _, range_subtype = media_range.partition("/")
+        for media_type in offered:
+            kind = media_type.partition("/")[0]
+            if media_range == media_type:
+                specificity = 2
+            elif range_type == kind and range_subtype == "*":
+                specificity = 1
+            elif media_range == "*/*":
+                # */* means "whatever you'd normally send"
+                if media_type != offered[0]:
+                    continue
+                specificity = 0
+            else:
+                continue
+            rank = (q, specificity, -position)
+            if best is None or rank > best[0]:
+                best = (rank, media_type)
+
+    return best[1] if best else offered[0]
+
+
+def header_value(text: str) -> str:
+    """Percent-encodes free text (transcripts, Yoruba diacritics) for an HTTP header."""
+    return quote(text, safe=" ,.!?'-")
+
+
+def intent_headers(transcript: str, language: str, intent) -> dict:
+    """X-* headers carrying the same metadata as the JSON body, for raw audio responses."""
+    return {
+        "X-Transcript": header_value(transcript),
+        "X-Language": language,
+        "X-Intent-Type": intent.type.value,
+        "X-Intent-Action": intent.action.value,
+        "X-Intent-Device": intent.device.value,
+        "X-Response-Text": header_value(intent.response_text),
+        "Vary": "Accept",
+    }
+
+
+class Multipart:
+    """Builds a multipart/mixed body part by part, for streaming."""
+
+    def __init__(self):
+        self.boundary = f"dara-{secrets.token_hex(12)}"
+        self.media_type = f"{MULTIPART}; boundary={self.boundary}"
+        self._opened = False
+
+    def _delimiter(self) -> bytes:
+        # Every delimiter after the first ends the previous part's body
+        prefix = b"\r\n" if self._opened else b""
+        self._opened = True
+        return prefix + f"--{self.boundary}\r\n".encode("ascii")
+
+    def json_part(self, data: dict, name: str) -> bytes:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return self.part_header("application/json; charset=utf-8", name) + body
+
+    def part_header(self, content_type: str, name: str) -> bytes:
+        headers = f"Content-Type: {content_type}\r\nContent-Disposition: inline; name=\"{name}\"\r\n\r\n"
+        return self._delimiter() + headers.encode("ascii")
+
+    def close(self) -> bytes:
+        return f"\r\n--{self.boundary}--\r\n".encode("ascii")
+
+
+async def primed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Pulls the first chunk of `chunks` now, so a failure before any audio
+    exists surfaces as an ordinary exception (and a 500) rather than a
+    truncated 200. Returns an iterator over the full stream; a later failure
+    is raised from it. Closing it closes `chunks`, which stops the synthesis.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def replay():
+        try:
+            if first:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    return replay()
+
+
+async def multipart_body(parts: Multipart, metadata: dict, audio: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    metadata JSON part, then the audio part streamed chunk by chunk, then the
+    closing boundary. If the audio fails part way, an {"event": "error"}
+    JSON part follows what was sent, so the client knows the audio is cut short.
+    """
+    yield parts.json_part(metadata, "metadata")
+    yield parts.part_header(AUDIO, "audio")
+    try:
+        async for chunk in audio:
+            yield chunk
+    except Exception as e:
+        logger.error(f"Reply audio failed mid-stream: {e}")
+        yield parts.json_part({"event": "error", "detail": str(e)}, "error")
+    yield parts.close()
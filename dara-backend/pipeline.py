@@ -0,0 +1,251 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional, Tuple
+
+import devices
+import fast_path
+import metrics
+import reasoning
+import sensors
+import tracing
+import tts
+from schemas import Device, IntentType
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# SPECULATIVE TTS
+# --------------------------------------------------
+# A transcript that looks like a device command, but not clearly enough for
+# the fast-path to answer it, still has to go to N-ATLaS. While the model is
+# generating, we synthesize the canned confirmation for the likely command.
+# If N-ATLaS agrees on the (action, device), that confirmation is used as
+# the reply and its audio is usually ready already. Otherwise it's cancelled.
+#
+# SPECULATIVE_TTS                 set to 0 to disable
+# SPECULATIVE_TTS_MIN_CONFIDENCE  fast_path.lookup confidence needed to speculate
+ENABLED = os.getenv("SPECULATIVE_TTS", "1") != "0"
+MIN_CONFIDENCE = float(os.getenv("SPECULATIVE_TTS_MIN_CONFIDENCE", 0.3))
+
+_started = metrics.counter("speculative_tts_started_total", "canned replies synthesized ahead of N-ATLaS")
+_useful = metrics.counter("speculative_tts_useful_total", "speculative replies N-ATLaS confirmed and we played")
+_wasted = metrics.counter("speculative_tts_wasted_total", "speculative replies discarded because the intent differed")
+_saved = metrics.summary("speculative_tts_saved_seconds", "TTS time overlapped with N-ATLaS on useful speculations")
+metrics.gauge(
+    "speculative_tts_useful_ratio",
+    "useful / resolved speculations",
+    fn=lambda: metrics.ratio(_useful, [_useful, _wasted]),
+)
+
+
+class Speculation:
+    """Canned confirmation for a likely command, synthesizing in the background."""
+
+    def __init__(self, match: fast_path.FastPathMatch, text: str):
+        self.match = match
+        self.text = text
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task = asyncio.create_task(tts.generate_audio(text, match.language))
+        self.task.add_done_callback(self._on_done)
+        _started.inc()
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self.finished = time.monotonic()
+
+    def matches(self, intent) -> bool:
+        return (
+            intent.type == IntentType.INSTRUCTION
+            and intent.action == self.match.action
+            and intent.device == self.match.device
+        )
+
+    def accept(self) -> None:
+        now = time.monotonic()
+        _useful.inc()
+        _saved.observe(min(now, self.finished or now) - self.started)
+
+    def cancel(self) -> None:
+        _wasted.inc()
+        if not self.task.done():
+            self.task.cancel()
+
+    async def audio(self) -> bytes:
+        try:
+            return await self.task
+        except Exception as e:
+            logger.warning(f"Speculative TTS failed ({type(e).__name__}): {e}")
+            return b""
+
+
+def speculate(transcript: str, language: str) -> Optional[Speculation]:
+    """Starts a Speculation if the transcript is worth one, else None."""
+    if not ENABLED or not transcript:
+        return None
+
+    match = fast_path.lookup(transcript, language)
+    if match is None or match.confidence < MIN_CONFIDENCE:
+        return None
+    if match.device == Device.TEMPERATURE:
+        # The reply is the sensor reading, not a canned confirmation
+        return None
+    if fast_path.ENABLED and match.confidence >= fast_path.MIN_CONFIDENCE:
+        # The fast-path will answer this itself, TTS starts right after
+        return None
+    if reasoning.atlas_keeper.is_cold():
+        # We'd reply "warming up", so the confirmation would be wasted
+        return None
+
+    text = fast_path.response_for(match.action, match.device, match.language)
+    if text is None:
+        return None
+
+    logger.info(f"Speculating {match.action} {match.device} ({match.language}, confidence {match.confidence:.2f})")
+    return Speculation(match, text)
+
+
+# --------------------------------------------------
+# STAGE TIMINGS
+# --------------------------------------------------
+# Each voice request times every stage on a Timeline; the durations go into
+# one histogram once the language, STT engine and intent type are known.
+# Marking is a perf_counter() call and a list append. Stages are also trace
+# spans (see tracing.py) when tracing is on.
+STAGES = ("convert", "vad", "stt", "reasoning", "tts", "encode")
+
+_stage_seconds = metrics.histogram(
+    "voice_stage_seconds",
+    "time spent in each stage of a voice request",
+    labels=("stage", "language", "engine", "intent"),
+)
+_request_seconds = metrics.histogram(
+    "voice_request_seconds",
+    "end-to-end voice request time, up to the last audio byte",
+    labels=("language", "engine", "intent"),
+)
+
+
+class Timeline:
+    """Per-request stage durations, recorded as voice_stage_seconds."""
+
+    def __init__(self, parent: Optional[tracing.Span] = None):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages = []
+        # Request span the stage spans hang off; the current one by default
+        self.span = parent or tracing.current()
+        self.engine = "none"
+        self.language = "other"
+        self.intent = "none"
+
+    def mark(self, stage: str) -> float:
+        """Ends `stage` now; returns its duration in seconds."""
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.stages.append((stage, elapsed))
+        self._last = now
+        return elapsed
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Times the block as `stage`, and as a child span of the request."""
+        self._last = time.perf_counter()
+        with tracing.span(stage, parent=self.span):
+            yield
+        self.mark(stage)
+
+    @property
+    def last(self) -> float:
+        """Duration of the most recent stage, for log lines."""
+        return self.stages[-1][1] if self.stages else 0.0
+
+    def label(self, language: Optional[str] = None, engine: Optional[str] = None, intent=None) -> None:
+        if language is not None:
+            # Bounded label set: anything without a voice is "other"
+            self.language = language if language in tts.VOICE_MAP else "other"
+        if engine is not None:
+            self.engine = engine
+        if intent is not None:
+            self.intent = intent.type.value
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def record(self) -> None:
+        for stage, seconds in self.stages:
+            _stage_seconds.labels(stage, self.language, self.engine, self.intent).observe(seconds)
+        _request_seconds.labels(self.language, self.engine, self.intent).observe(self._last - self.started)
+        self.stages = []
+
+    async def timed(self, chunks: AsyncIterator[bytes], stage: str = "tts") -> AsyncIterator[bytes]:
+        """Passes a streamed reply through; ends `stage` and records at its last chunk."""
+        span = tracing.start_span(stage, parent=self.span)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            if span is not None:
+                span.end()
+        self.mark(stage)
+        self.record()
+
+
+# --------------------------------------------------
+# PIPELINE STAGES
+# --------------------------------------------------
+async def classify(transcript: str, language: str) -> Tuple[dict, Optional[Speculation]]:
+    """
+    reasoning.classify_intent with speculative TTS alongside it. A device
+    command is sent to its controller (devices.py) as soon as it is known.
+    Returns the reasoning result and the Speculation if it was confirmed;
+    its text has then replaced the model's response_text.
+    """
+    speculation = speculate(transcript, language)
+    try:
+        result = await reasoning.classify_intent(transcript, language)
+    except BaseException:
+        if speculation is not None:
+            speculation.cancel()
+        raise
+
+    # Switch the device now; the reply is synthesized meanwhile
+    devices.dispatch(result["intent"])
+    # A temperature question is answered with the latest polled reading
+    result = sensors.answer(result)
+
+    if speculation is None:
+        return result, None
+
+    intent = result["intent"]
+    if not speculation.matches(intent):
+        logger.info(f"Speculation discarded, N-ATLaS said {intent.action} {intent.device}")
+        speculation.cancel()
+        return result, None
+
+    speculation.accept()
+    intent = intent.model_copy(update={"response_text": speculation.text, "language": speculation.match.language})
+    return {"intent": intent, "response_text": speculation.text}, speculation
+
+
+async def reply_audio(response_text: str, language: str, speculation: Optional[Speculation]) -> bytes:
+    """Full reply audio, taken from a confirmed speculation when there is one."""
+    if speculation is not None:
+        audio = await speculation.audio()
+        if audio:
+            return audio
+    return await tts.generate_audio(response_text, language)
+
+
+async def stream_reply(response_text: str, language: str, speculation: Optional[Speculation]) -> AsyncIterator[bytes]:
+    """Streaming counterpart of reply_audio."""
+    if speculation is not None:
+        audio = await speculation.audio()
+        if audio:
+            for i in range(0, len(audio), tts.STREAM_CHUNK_BYTES):
+                yield audio[i:i + tts.STREAM_CHUNK_BYTES]
+            return
+    async for chunk in tts.stream_audio(response_text, language):
+        yield chunk
@@ -1,11 +1,76 @@
 import os
 import json
-import requests
+import time
+import httpx
 import asyncio
 from dotenv import load_dotenv
+
+import fast_path
+import http_clients
+import intent_cache
+import metrics
+import tracing
+from limiter import Limiter, LimiterFull
+from text_utils import normalize_language
+from schemas import Intent, IntentType, Action, Device
+from warm_keeper import WarmKeeper
+
 # Modal N-ATLaS Endpoint
 ATLAS_ENDPOINT = "https://lawrenceokosao--dara-atlas-inference.modal.run"
 
+WARMING_UP_TEXT = "Please wait, system warming up."
+BUSY_TEXT = "I'm a bit busy right now, please try again in a moment."
+
+# --------------------------------------------------
+# REQUEST BUDGETS
+# --------------------------------------------------
+# ATLAS_MAX_CONCURRENCY   requests in flight to Modal at once
+# ATLAS_MAX_QUEUE         requests allowed to wait for a slot; beyond that we
+#                         answer BUSY_TEXT straight away
+# ATLAS_DEADLINE_SECONDS  overall budget for queueing + the call; 0 = only the
+#                         client's connect/read timeouts apply
+#                         (HTTP_ATLAS_CONNECT_TIMEOUT, HTTP_ATLAS_TIMEOUT)
+MAX_CONCURRENCY = int(os.getenv("ATLAS_MAX_CONCURRENCY", 32))
+MAX_QUEUE = int(os.getenv("ATLAS_MAX_QUEUE", 64))
+DEADLINE_SECONDS = float(os.getenv("ATLAS_DEADLINE_SECONDS", 0))
+
+atlas_limiter = Limiter("atlas", MAX_CONCURRENCY, MAX_QUEUE)
+
+# Tracks whether the Modal container is up and pings it during active hours.
+# Started/stopped from the FastAPI lifespan in main.py.
+atlas_keeper = WarmKeeper("atlas", ATLAS_ENDPOINT, client_name="atlas")
+
+_prefill_seconds = metrics.summary("atlas_prefill_seconds", "N-ATLaS prompt prefill time on the GPU")
+_prefix_tokens_saved = metrics.counter("atlas_prefix_tokens_saved_total", "system prompt tokens served from the prefix KV cache")
+_tokens_generated = metrics.summary("atlas_tokens_generated", "tokens N-ATLaS generated per reply")
+_replies = metrics.counter("atlas_replies_total", "N-ATLaS replies received")
+_cancelled = metrics.counter("atlas_cancelled_total", "N-ATLaS requests abandoned because the client disconnected")
+_parse_failures = metrics.counter("atlas_parse_failures_total", "N-ATLaS replies that weren't a valid intent")
+metrics.gauge(
+    "atlas_parse_failure_ratio",
+    "share of N-ATLaS replies that weren't a valid intent",
+    fn=lambda: metrics.ratio(_parse_failures, [_replies]),
+)
+
+NOT_UNDERSTOOD_TEXT = "I didn't understand that."
+
+
+def fallback_reply(language: str, text: str) -> dict:
+    """
+    A reply made up here because N-ATLaS couldn't answer (cold, busy, failed)
+    or there was nothing to classify. It says nothing about the transcript,
+    so it must not be cached or replayed to a retry.
+    """
+    return {
+        "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text=text),
+        "response_text": text,
+        "fallback": True,
+    }
+
+
+def is_fallback(result: dict) -> bool:
+    return result.get("fallback", False)
+
 def parse_intent_data(data: dict, language: str) -> dict:
     intent_type = data.get("type", "CONVERSATION")
     action = data.get("action", "NONE")
@@ -27,33 +92,68 @@ def parse_intent_data(data: dict, language: str) -> dict:
 async def classify_intent(transcript: str, language: str) -> dict:
     """
     Hits the N-ATLaS endpoint on Modal.
+    Plain device commands are answered locally by fast_path first, and
+    transcripts N-ATLaS has already classified by intent_cache.
     Returns: {"intent": Intent, "response_text": str}
     """
     if not transcript:
-        return {
-            "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text="..."),
-            "response_text": "..."
-        }
+        return fallback_reply(language, "...")
+
+    fast = fast_path.classify(transcript, language)
+    if fast is not None:
+        print(f"Fast-path match: {fast['intent'].action} {fast['intent'].device}")
+        return fast
+
+    # Said before: reuse what N-ATLaS answered then (see intent_cache.py)
+    cached = await intent_cache.lookup(transcript, language)
+    if cached is not None:
+        print(f"Intent cache hit: {cached['intent'].action} {cached['intent'].device}")
+        return cached
 
+    # Rather than block for a cold start, reply now and let the keeper wake it
+    if atlas_keeper.should_fallback():
+        print("N-ATLaS is cold, replying locally while it warms up")
+        return fallback_reply(language, WARMING_UP_TEXT)
+
+    started = None
     try:
         # Try our Modal endpoint first
         print("Sending to N-ATLaS (Modal transformers)...")
         
-        # Need to offload this since requests is blocking
-        response = await asyncio.to_thread(
-            requests.post,
-            ATLAS_ENDPOINT,
-            json={"transcript": transcript, "language": language},
-            timeout=120  # Allow time for cold start
-        )
+        async with asyncio.timeout(DEADLINE_SECONDS or None):
+            async with atlas_limiter:
+                # Latency seen by the keeper starts once we have a slot
+                started = time.monotonic()
+                # Shared keep-alive client; its read timeout allows for cold starts
+                # Send the two letter code so the model's prefix KV cache applies
+                response = await http_clients.get("atlas").post(
+                    ATLAS_ENDPOINT,
+                    json={"transcript": transcript, "language": normalize_language(language)},
+                )
         
         response.raise_for_status()
+        atlas_keeper.observe(time.monotonic() - started, ok=True)
         result = response.json()
         
         generated_text = result.get("generated_text", "")
         print(f"DEBUG N-ATLaS Output: {generated_text}")
+
+        # Modal's own spans (queue, prefill, decode) when the call was traced
+        tracing.ingest(result.get("spans"), "dara-atlas")
+
+        stats = result.get("stats") or {}
+        if "prefill_ms" in stats:
+            _prefill_seconds.observe(stats["prefill_ms"] / 1000)
+        _prefix_tokens_saved.inc(stats.get("prefix_tokens_reused", 0))
+        if "tokens_generated" in stats:
+            _tokens_generated.observe(stats["tokens_generated"])
+        _replies.inc()
+        if stats:
+            print(f"N-ATLaS stats: {stats}")
         
-        # Parse the JSON blob from the model output
+        # Parse the JSON blob from the model output. With constrained
+        # decoding on the Modal side this is the whole output, but keep
+        # the search so older deployments still parse.
         try:
             # Find JSON in the response
             start = generated_text.find("{")
@@ -61,34 +161,44 @@ async def classify_intent(transcript: str, language: str) -> dict:
             if start != -1 and end != -1:
                 json_str = generated_text[start:end+1]
                 data = json.loads(json_str)
-                return parse_intent_data(data, language)
+                parsed = parse_intent_data(data, language)
+                await intent_cache.store(transcript, language, parsed["intent"])
+                return parsed
             else:
                 # No JSON block found
                 print("No JSON found in N-ATLaS output")
+                _parse_failures.inc()
                 return {
-                    "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text="I didn't understand that."),
-                    "response_text": "I didn't understand that."
+                    "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text=NOT_UNDERSTOOD_TEXT),
+                    "response_text": NOT_UNDERSTOOD_TEXT
                 }
                 
-        except json.JSONDecodeError as e:
-            print(f"JSON Parse Error: {e}")
+        except ValueError as e:
+            # JSONDecodeError, or a type/action/device outside the enums
             print(f"JSON Parse Error: {e}")
+            _parse_failures.inc()
             return {
-                "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text="I didn't understand that."),
-                "response_text": "I didn't understand that."
+                "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text=NOT_UNDERSTOOD_TEXT),
+                "response_text": NOT_UNDERSTOOD_TEXT
             }
 
-    except requests.exceptions.Timeout:
+    except asyncio.CancelledError:
+        # The caller went away; the pooled client drops the in-flight request
+        _cancelled.inc()
+        print("N-ATLaS request cancelled")
+        raise
+    except LimiterFull as e:
+        print(f"N-ATLaS queue full ({e})")
+        return fallback_reply(language, BUSY_TEXT)
+    except (httpx.TimeoutException, TimeoutError) as e:
         # Modal is probably starting up, just wait properly next time
         print("Modal timeout (cold start)")
-        print("Modal timeout (cold start)")
-        return {
-            "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text="Please wait, system warming up."),
-            "response_text": "Please wait, system warming up."
-        }
+        if started is not None:
+            atlas_keeper.observe_error(e)
+        return fallback_reply(language, WARMING_UP_TEXT)
     except Exception as e:
         print(f"N-ATLaS Error ({type(e).__name__}): {e}")
-        return {
-            "intent": Intent(type=IntentType.CONVERSATION, language=language, response_text="System error."),
-            "response_text": "System error."
-        }
+        if isinstance(e, httpx.HTTPError) and started is not None:
+            # A connect error marks it cold; an error status doesn't
+            atlas_keeper.observe_error(e)
+        return fallback_reply(language, "System error.")
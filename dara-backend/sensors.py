@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+
+import devices
+import executors
+import http_clients
+import metrics
+import shared_store
+from schemas import Action, Device, Intent
+from text_utils import normalize_language
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# A DHT read on the ESP32 takes ~250 ms and sometimes fails with "Sensor
+# Error", so nothing waits on one. The controller is polled in the background
+# and "what's the temperature?" is answered from the latest reading.
+# The sensor's controller comes from ESP32_CONTROLLERS (a bare URL, or
+# temperature=url); unset = no polling.
+#
+# SENSOR_POLL_INTERVAL   seconds between reads
+# SENSOR_POLL_JITTER     +/- share of the interval each wait is randomized by, so
+#                        several workers (or controllers) don't read in lockstep
+# SENSOR_MAX_AGE         a reading older than this isn't reported as current
+# SENSOR_HISTORY         readings kept per controller
+# With several workers only the leader (leader.py) polls. It writes each
+# controller's readings to the shared store, and the other workers copy them
+# every SYNC_SECONDS and before answering GET /sensors/temperature.
+POLL_INTERVAL = float(os.getenv("SENSOR_POLL_INTERVAL", 30))
+POLL_JITTER = float(os.getenv("SENSOR_POLL_JITTER", 0.2))
+MAX_AGE_SECONDS = float(os.getenv("SENSOR_MAX_AGE", 120))
+HISTORY = int(os.getenv("SENSOR_HISTORY", 240))
+
+SYNC_SECONDS = 5
+
+# Spoken replies to CHECK TEMPERATURE; {celsius} is filled in
+REPLIES = {
+    "en": "It's {celsius} degrees Celsius in the room.",
+    "yo": "Ìgbóná inú yàrá jẹ́ ìwọ̀n {celsius} Celsius.",
+    "ha": "Zafin ɗakin ya kai digiri {celsius} Celsius.",
+    "ig": "Okpomọkụ ime ụlọ bụ digrii {celsius} Celsius.",
+}
+UNAVAILABLE = {
+    "en": "Sorry, I can't read the temperature right now.",
+    "yo": "Má bínú, mi ò lè ka ìgbóná báyìí.",
+    "ha": "Yi haƙuri, ba zan iya karanta zafi yanzu ba.",
+    "ig": "Ndo, enweghị m ike ịgụ okpomọkụ ugbu a.",
+}
+
+_reads = metrics.counter("sensor_reads_total", "temperature sensor reads by outcome (ok, error)", labels=("result",))
+_checks = metrics.counter("sensor_checks_total", "temperature questions by answer (fresh, stale)", labels=("result",))
+
+
+def parse_reading(text: str) -> float:
+    """'28.0 °C' (the firmware's reply) -> 28.0. Raises ValueError otherwise."""
+    return float(text.strip().split()[0])
+
+
+# --------------------------------------------------
+# POLLER
+# --------------------------------------------------
+class SensorPoller:
+    """
+    Reads GET /temperature from each controller on a jittered interval and
+    keeps the last `history` readings per controller as (unix time, °C).
+    With a `shared` store the leader's readings are published there and
+    followers mirror them instead of polling.
+    """
+
+    def __init__(
+        self,
+        controllers,
+        interval: float = POLL_INTERVAL,
+        jitter: float = POLL_JITTER,
+        max_age: float = MAX_AGE_SECONDS,
+        history: int = HISTORY,
+        client: Optional[httpx.AsyncClient] = None,
+        shared: Optional["shared_store.SharedStore"] = None,
+    ):
+        self.controllers = list(dict.fromkeys(controllers))
+        self.interval = interval
+        self.jitter = jitter
+        self.max_age = max_age
+        self._client = client
+        self.shared = shared
+        # Without a shared store every process polls for itself
+        self.leading = shared is None
+        self.readings: Dict[str, Deque[Tuple[float, float]]] = {c: deque(maxlen=history) for c in self.controllers}
+        self._tasks = []
+
+    def newest_age(self) -> float:
+        """Seconds since the newest reading from any controller, -1 before the first."""
+        newest = max((r[-1][0] for r in self.readings.values() if r), default=None)
+        return time.time() - newest if newest is not None else -1
+
+    async def poll(self, controller: str) -> Optional[float]:
+        """One read; the reading is stored and returned, or None if it failed."""
+        client = self._client or http_clients.get("esp32")
+        try:
+            # Don't talk over a device command; the controller serves one client at a time
+            async with devices.dispatcher.lock(controller):
+                response = await client.get(f"{controller}/temperature")
+            response.raise_for_status()
+            celsius = parse_reading(response.text)
+        except (httpx.HTTPError, ValueError, IndexError) as e:
+            _reads.labels("error").inc()
+            logger.info(f"Temperature read from {controller} failed ({type(e).__name__}): {e}")
+            return None
+        _reads.labels("ok").inc()
+        # Millisecond timestamps, as returned by history() and compared with `since`
+        self.readings[controller].append((round(time.time(), 3), celsius))
+        if self.shared is not None:
+            await executors.io.run(self.shared.set, controller, json.dumps(list(self.readings[controller])).encode("utf-8"))
+        return celsius
+
+    async def refresh(self) -> None:
+        """Copies the leader's readings from the shared store; a no-op on the leader."""
+        if self.shared is None or self.leading:
+            return
+        published = await executors.io.run(lambda: {c: self.shared.get(c) for c in self.controllers})
+        for controller, data in published.items():
+            if data is not None:
+                buffer = self.readings[controller]
+                buffer.clear()
+                buffer.extend(tuple(row) for row in json.loads(data))
+
+    def latest(self, controller: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        """Newest (unix time, °C) still within max_age, or None."""
+        controller = controller or (self.controllers[0] if self.controllers else None)
+        buffer = self.readings.get(controller)
+        if not buffer:
+            return None
+        at, celsius = buffer[-1]
+        return (at, celsius) if time.time() - at <= self.max_age else None
+
+    def history(self, since: float = 0) -> dict:
+        """Readings per controller as parallel arrays: {"t": [...], "c": [...]}."""
+        result = {}
+        for controller, buffer in self.readings.items():
+            rows = [r for r in buffer if r[0] > since]
+            result[controller] = {"t": [at for at, _ in rows], "c": [c for _, c in rows]}
+        return result
+
+    def answer(self, result: dict) -> dict:
+        """
+        Fills the latest reading into a CHECK TEMPERATURE reasoning result (any
+        other result is returned as is). Never waits for the sensor; with no
+        recent reading, or no sensor configured, the reply says so.
+        """
+        intent: Intent = result["intent"]
+        if intent.action != Action.CHECK or intent.device != Device.TEMPERATURE:
+            return result
+
+        language = normalize_language(intent.language)
+        if language not in REPLIES:
+            language = "en"
+        reading = self.latest()
+        if reading is None:
+            _checks.labels("stale").inc()
+            text = UNAVAILABLE[language]
+        else:
+            _checks.labels("fresh").inc()
+            text = REPLIES[language].format(celsius=f"{reading[1]:g}")
+        return {"intent": intent.model_copy(update={"response_text": text}), "response_text": text}
+
+    async def _loop(self, controller: str) -> None:
+        # First read right away, offset a little so workers don't start in step
+        await asyncio.sleep(random.uniform(0, self.interval * self.jitter))
+        while True:
+            await self.poll(controller)
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _follow(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(SYNC_SECONDS)
+
+    def start(self) -> None:
+        """Polls the controllers; with a shared store, only on the leader (see lead())."""
+        if self._tasks or not self.controllers:
+            return
+        if self.shared is not None and not self.leading:
+            self._tasks = [asyncio.create_task(self._follow())]
+        else:
+            self._tasks = [asyncio.create_task(self._loop(c)) for c in self.controllers]
+
+    async def lead(self) -> None:
+        """This worker polls from now on, instead of mirroring the leader."""
+        if self.leading:
+            return
+        await self.stop()
+        self.leading = True
+        self.start()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def _temperature_controllers():
+    controller = devices.dispatcher.controllers.get(Device.TEMPERATURE)
+    return [controller] if controller else []
+
+
+poller = SensorPoller(
+    _temperature_controllers(),
+    shared=shared_store.open_store("sensor_readings", 1024 * 1024, None, name="sensor_readings_shared"),
+)
+metrics.gauge("sensor_reading_age_seconds", "age of the newest temperature reading", fn=lambda: poller.newest_age())
+
+
+def answer(result: dict) -> dict:
+    return poller.answer(result)
@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import logging
+import itertools
+import threading
+from typing import List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# Every worker process keeps its own in-memory caches. With several workers
+# (see `python main.py --workers N`), cached TTS clips and intents are also
+# kept in one SQLite file, so a phrase synthesized or classified by one
+# worker is a hit on all of them. SQLite in WAL mode lets readers in every
+# process run alongside a writer; a lookup is a single indexed read.
+#
+# SHARED_CACHE_PATH   SQLite file shared by the workers (unset = per-process
+#                     caches only; `main.py --workers N` sets a default)
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      BLOB NOT NULL,
+    size       INTEGER NOT NULL,
+    expires_at REAL,
+    stored_at  REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_stored ON entries (namespace, stored_at);
+"""
+
+# Eviction runs every this many writes rather than on each one
+_EVICT_EVERY = 32
+
+
+class SharedStore:
+    """
+    Byte-bounded, TTL'd key/value namespace in a SQLite file that several
+    processes open at once. get() and set() have the same shape as
+    tts_cache.DiskCache, so either can be the TTS cache's second tier.
+    Every call blocks on SQLite (up to its 5 s lock timeout), so callers on
+    the event loop go through executors.io.
+
+    Hits, misses and evictions are published as `<name>_hits_total`,
+    `<name>_misses_total` and `<name>_evictions_total` (per process).
+    """
+
+    def __init__(self, path: str, namespace: str, max_bytes: int, ttl: Optional[float], name: Optional[str] = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self._local = threading.local()
+        self._writes = itertools.count(1)
+
+        name = name or f"shared_{namespace}"
+        self.hits = metrics.counter(f"{name}_hits_total", f"{namespace} lookups served from the shared store")
+        self.misses = metrics.counter(f"{name}_misses_total", f"{namespace} lookups not in the shared store")
+        self.evictions = metrics.counter(f"{name}_evictions_total", f"{namespace} entries dropped from the shared store for size or age")
+
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread: each io executor worker has its own
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            # Durable enough for a cache, and commits don't wait for fsync
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared {self.namespace} store read failed: {e}")
+            row = None
+        if row is None or (row[1] is not None and row[1] <= now):
+            self.misses.inc()
+            return None
+        self.hits.inc()
+        return row[0]
+
+    def set(self, key: str, data: bytes) -> None:
+        """Blocking write; every _EVICT_EVERY-th one also runs evict()."""
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, size, expires_at, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, data, len(data), expires_at, now),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared {self.namespace} store write failed: {e}")
+            return
+        if next(self._writes) % _EVICT_EVERY == 0:
+            self.evict()
+
+    def add(self, key: str, data: bytes) -> bool:
+        """
+        Stores `data` only if `key` has no live entry, atomically across
+        processes. Returns whether it was stored; True if the store failed,
+        so a broken file never holds a caller back.
+        """
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (self.namespace, key, now),
+            )
+            added = db.execute(
+                "INSERT OR IGNORE INTO entries (namespace, key, value, size, expires_at, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, data, len(data), expires_at, now),
+            ).rowcount == 1
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Shared {self.namespace} store write failed: {e}")
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            return True
+        return added
+
+    def delete(self, key: str) -> None:
+        try:
+            self._connect().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared {self.namespace} store write failed: {e}")
+
+    def take(self) -> List[bytes]:
+        """Removes every entry and returns the live ones, oldest first, like a queue."""
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? ORDER BY stored_at, key",
+                (self.namespace,),
+            ).fetchall()
+            if rows:
+                db.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Shared {self.namespace} store read failed: {e}")
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            return []
+        now = time.time()
+        return [value for value, expires_at in rows if expires_at is None or expires_at > now]
+
+    def evict(self) -> None:
+        """
+        Drops expired entries, then the oldest until under budget. Age is
+        time since stored: reads don't write, so hits stay cheap.
+        """
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            removed = db.execute(
+                "DELETE FROM entries WHERE namespace = ? AND expires_at <= ?",
+                (self.namespace, time.time()),
+            ).rowcount
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+            if total > self.max_bytes:
+                rows = db.execute(
+                    "SELECT key, size FROM entries WHERE namespace = ? ORDER BY stored_at",
+                    (self.namespace,),
+                ).fetchall()
+                doomed = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((self.namespace, key))
+                    total -= size
+                db.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", doomed)
+                removed += len(doomed)
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Shared {self.namespace} store eviction failed: {e}")
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            return
+        self.evictions.inc(removed)
+
+    def bytes(self) -> int:
+        return self._connect().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+def open_store(namespace: str, max_bytes: int, ttl: Optional[float], name: Optional[str] = None) -> Optional[SharedStore]:
+    """The namespace in SHARED_CACHE_PATH, or None when no shared file is configured."""
+    if not SHARED_CACHE_PATH:
+        return None
+    try:
+        return SharedStore(SHARED_CACHE_PATH, namespace, max_bytes, ttl, name)
+    except sqlite3.Error as e:
+        logger.error(f"Shared {namespace} store disabled: {e}")
+        return None
@@ -0,0 +1,53 @@
+import os
+import random
+import asyncio
+from typing import Optional, Tuple
+
+# --------------------------------------------------
+# OFFLINE STT ENGINE
+# --------------------------------------------------
+# Stand-in for Whisper/Deepgram with the same transcribe(bytes) -> (text, lang)
+# contract. Enable it with STT_ENGINES=fake (or "fake,whisper", etc.) to run
+# the backend without API keys, or build FakeEngine instances in tests.
+#
+# STT_FAKE_TEXT        transcript to return
+# STT_FAKE_LANGUAGE    language code to return
+# STT_FAKE_LATENCY     seconds to wait before answering
+# STT_FAKE_JITTER      extra random wait, up to this many seconds
+TEXT = os.getenv("STT_FAKE_TEXT", "Turn on the light")
+LANGUAGE = os.getenv("STT_FAKE_LANGUAGE", "en")
+LATENCY = float(os.getenv("STT_FAKE_LATENCY", 0.05))
+JITTER = float(os.getenv("STT_FAKE_JITTER", 0.0))
+
+
+class FakeEngine:
+    """
+    Scriptable engine: fixed answer, latency and failure rate.
+    Counts calls and cancellations so tests can check what the registry did.
+    """
+
+    def __init__(self, text: str = TEXT, language: str = LANGUAGE, latency: float = LATENCY,
+                 jitter: float = JITTER, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.text = text
+        self.language = language
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.cancelled = 0
+        self._random = random.Random(seed)
+
+    async def __call__(self, audio_bytes: bytes) -> Tuple[str, str]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self._random.random() < self.error_rate:
+            raise RuntimeError("fake STT failure")
+        return self.text, self.language
+
+
+# Module-level engine registered as "fake"
+transcribe = FakeEngine()
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+import importlib.util
+from typing import Optional, Tuple
+
+import executors
+import metrics
+from audio_utils import parse_wav_header, can_decode_natively, decode_pcm, downmix, resample, TARGET_RATE
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# LOCAL WHISPER (faster-whisper / CTranslate2, CPU)
+# --------------------------------------------------
+# Runs a quantized Whisper model in-process so transcription keeps working
+# when the uplink is slow or down. Enable with STT_ENGINES=local (or e.g.
+# "local,whisper" to keep the API as a hedge/fallback).
+#
+# STT_LOCAL_MODEL      model size or path ("tiny", "base", "small", "medium", ...)
+# STT_LOCAL_COMPUTE    CTranslate2 compute type; int8 is the quantized CPU path
+# STT_LOCAL_THREADS    CPU threads per transcription
+# STT_LOCAL_WORKERS    transcriptions run in parallel (each uses STT_LOCAL_THREADS)
+# STT_LOCAL_BEAM       beam size; 1 = greedy, fastest
+MODEL = os.getenv("STT_LOCAL_MODEL", "small")
+COMPUTE_TYPE = os.getenv("STT_LOCAL_COMPUTE", "int8")
+THREADS = int(os.getenv("STT_LOCAL_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+WORKERS = int(os.getenv("STT_LOCAL_WORKERS", 1))
+BEAM_SIZE = int(os.getenv("STT_LOCAL_BEAM", 1))
+
+# faster-whisper is optional (pip install faster-whisper)
+AVAILABLE = importlib.util.find_spec("faster_whisper") is not None
+
+_model = None
+_load_lock = threading.Lock()
+# Dedicated pool: a long transcription never takes a slot from audio
+# conversion or TTS (see executors.py)
+_executor = executors.Executor("stt_local", WORKERS)
+
+_rtf = metrics.summary("stt_local_rtf", "local Whisper processing time / audio duration")
+_load_seconds = metrics.gauge("stt_local_load_seconds", "time taken to load the local Whisper model")
+
+
+def load():
+    """Loads the model once. Called from the FastAPI lifespan; safe to call again."""
+    global _model
+    with _load_lock:
+        if _model is not None:
+            return _model
+        from faster_whisper import WhisperModel
+
+        started = time.perf_counter()
+        _model = WhisperModel(MODEL, device="cpu", compute_type=COMPUTE_TYPE, cpu_threads=THREADS)
+        _load_seconds.set(time.perf_counter() - started)
+        logger.info(f"Local Whisper '{MODEL}' ({COMPUTE_TYPE}, {THREADS} threads) loaded in {time.perf_counter() - started:.1f}s")
+        return _model
+
+
+def shutdown() -> None:
+    _executor.shutdown()
+
+
+def pcm_samples(audio_bytes: bytes):
+    """16 kHz mono float32 samples from a WAV, as the model expects."""
+    info = parse_wav_header(audio_bytes)
+    if not can_decode_natively(info):
+        raise ValueError("Local STT expects PCM WAV (convert_to_wav output)")
+    samples = downmix(decode_pcm(audio_bytes, info))
+    if info.sample_rate != TARGET_RATE:
+        samples = resample(samples, info.sample_rate)
+    return samples
+
+
+def transcribe_sync(audio_bytes: bytes, language: Optional[str] = None) -> Tuple[str, str]:
+    """Blocking transcription; runs on the dedicated pool via transcribe()."""
+    model = load()
+    samples = pcm_samples(audio_bytes)
+    duration = len(samples) / TARGET_RATE
+
+    started = time.perf_counter()
+    segments, info = model.transcribe(samples, beam_size=BEAM_SIZE, language=language, condition_on_previous_text=False)
+    # Segments are generated lazily; decoding happens while we join them
+    text = " ".join(segment.text.strip() for segment in segments).strip()
+    elapsed = time.perf_counter() - started
+
+    if duration > 0:
+        _rtf.observe(elapsed / duration)
+    logger.info(f"Local STT: {duration:.1f}s of audio in {elapsed:.2f}s (RTF {elapsed / max(duration, 1e-6):.2f})")
+    return text, info.language
+
+
+async def transcribe(audio_bytes: bytes) -> Tuple[str, str]:
+    """
+    Transcribes a 16 kHz WAV with the local model.
+    Returns: (transcript, detected_language_code)
+    """
+    return await _executor.run(transcribe_sync, audio_bytes)
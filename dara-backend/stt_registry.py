@@ -0,0 +1,247 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# STT_ENGINES            engines to use, in order of preference before any latency is known
+# STT_HEDGE              1 = if the chosen engine runs past its p95, also ask the next one
+# STT_WINDOW             recent calls kept per engine for latency/error stats
+# STT_MIN_SAMPLES        calls needed before an engine's p95 is trusted for hedging
+# STT_MAX_ERROR_RATE     error rate over the window above which an engine is unhealthy
+# STT_COOLDOWN_SECONDS   how long an unhealthy engine is skipped before it is retried
+# STT_EXPLORE            share of requests sent to a random healthy engine to keep stats fresh
+ENGINES = [name.strip() for name in os.getenv("STT_ENGINES", "whisper,deepgram").split(",") if name.strip()]
+HEDGE = os.getenv("STT_HEDGE", "1") != "0"
+WINDOW = int(os.getenv("STT_WINDOW", 50))
+MIN_SAMPLES = int(os.getenv("STT_MIN_SAMPLES", 10))
+MAX_ERROR_RATE = float(os.getenv("STT_MAX_ERROR_RATE", 0.5))
+COOLDOWN_SECONDS = float(os.getenv("STT_COOLDOWN_SECONDS", 30))
+EXPLORE = float(os.getenv("STT_EXPLORE", 0.05))
+
+Transcriber = Callable[[bytes], Awaitable[Tuple[str, str]]]
+
+EMPTY_RESULT = ("", "en")
+NO_ENGINE = "none"
+
+
+# --------------------------------------------------
+# PER-ENGINE PROFILE
+# --------------------------------------------------
+class Engine:
+    """
+    One STT backend with the `transcribe(bytes) -> (text, lang)` contract,
+    plus a rolling window of its recent latencies and failures.
+    The transcriber must raise on failure; an empty transcript is a success.
+    """
+
+    def __init__(self, name: str, transcribe: Transcriber, window: int = WINDOW):
+        self.name = name
+        self.transcribe = transcribe
+        self.latencies = deque(maxlen=window)  # seconds, successful calls only
+        self.outcomes = deque(maxlen=window)   # True = ok
+        self.unhealthy_until = 0.0
+
+        self.requests = metrics.counter(f"stt_{name}_requests_total", f"requests sent to {name}")
+        self.errors = metrics.counter(f"stt_{name}_errors_total", f"{name} requests that failed")
+        self.latency = metrics.summary(f"stt_{name}_latency_seconds", f"{name} transcription latency")
+        metrics.gauge(f"stt_{name}_p95_seconds", f"{name} rolling p95 latency", fn=lambda: self.quantile(0.95) or 0.0)
+        metrics.gauge(f"stt_{name}_healthy", f"1 if {name} is taking requests", fn=lambda: int(self.healthy()))
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.requests.inc()
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.latency.observe(latency)
+            return
+
+        self.errors.inc()
+        if len(self.outcomes) >= min(MIN_SAMPLES, self.outcomes.maxlen) and self.error_rate() > MAX_ERROR_RATE:
+            logger.warning(f"STT engine {self.name} unhealthy ({self.error_rate():.0%} errors), skipping for {COOLDOWN_SECONDS:.0f}s")
+            self.unhealthy_until = time.monotonic() + COOLDOWN_SECONDS
+            # Start the next probe with a clean slate
+            self.outcomes.clear()
+
+    async def run(self, audio_bytes: bytes) -> Tuple[str, str]:
+        started = time.monotonic()
+        try:
+            result = await self.transcribe(audio_bytes)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the engine
+            raise
+        except Exception as e:
+            self.record(time.monotonic() - started, ok=False)
+            logger.warning(f"STT engine {self.name} failed ({type(e).__name__}): {e}")
+            raise
+        self.record(time.monotonic() - started, ok=True)
+        return result
+
+
+# --------------------------------------------------
+# REGISTRY
+# --------------------------------------------------
+class STTRegistry:
+    """
+    Routes each transcription to the fastest healthy engine (by rolling
+    median latency). Engines without enough samples keep their configured
+    order. If the chosen engine is slower than its own p95, the next engine
+    is asked too and the first answer wins. Failures fall over to the next
+    engine.
+    """
+
+    def __init__(self, hedge: bool = HEDGE, explore: float = EXPLORE):
+        self.engines: Dict[str, Engine] = {}
+        self.hedge = hedge
+        self.explore = explore
+        self.hedges = metrics.counter("stt_hedges_total", "hedged second STT requests sent")
+        self.hedge_wins = metrics.counter("stt_hedge_wins_total", "hedged requests that answered first")
+        self.failovers = metrics.counter("stt_failovers_total", "STT requests retried on another engine after an error")
+        self.failures = metrics.counter("stt_failures_total", "STT requests no engine could answer")
+
+    def register(self, name: str, transcribe: Transcriber) -> Engine:
+        engine = Engine(name, transcribe)
+        self.engines[name] = engine
+        return engine
+
+    def ranked(self) -> List[Engine]:
+        """Healthy engines, best first; unhealthy ones only if nothing else is left."""
+        engines = list(self.engines.values())
+        healthy = [e for e in engines if e.healthy()] or engines
+
+        def key(item):
+            position, engine = item
+            if len(engine.latencies) < MIN_SAMPLES:
+                return (1, position, 0.0)
+            return (0, 0, engine.quantile(0.5))
+
+        order = [e for _, e in sorted(enumerate(healthy), key=key)]
+        if len(order) > 1 and random.random() < self.explore:
+            pick = order.pop(random.randrange(1, len(order)))
+            order.insert(0, pick)
+        return order
+
+    def hedge_delay(self, engine: Engine) -> Optional[float]:
+        if not self.hedge or len(engine.latencies) < MIN_SAMPLES:
+            return None
+        return engine.quantile(0.95)
+
+    async def transcribe(self, audio_bytes: bytes) -> Tuple[str, str]:
+        text, language, _ = await self.transcribe_with_engine(audio_bytes)
+        return text, language
+
+    async def transcribe_with_engine(self, audio_bytes: bytes) -> Tuple[str, str, str]:
+        """transcribe(), plus the name of the engine that answered (NO_ENGINE if none did)."""
+        queue = self.ranked()
+        if not queue:
+            logger.error("No STT engines registered")
+            return (*EMPTY_RESULT, NO_ENGINE)
+
+        pending: Dict[asyncio.Task, Engine] = {}
+
+        def launch() -> Engine:
+            engine = queue.pop(0)
+            pending[asyncio.create_task(engine.run(audio_bytes))] = engine
+            return engine
+
+        primary = launch()
+        hedge_delay = self.hedge_delay(primary)
+        hedged = False
+        started = time.monotonic()
+
+        try:
+            while pending:
+                timeout = None
+                if hedge_delay is not None and not hedged and queue:
+                    timeout = max(0.0, hedge_delay - (time.monotonic() - started))
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.hedges.inc()
+                    backup = launch()
+                    logger.info(f"STT {primary.name} past p95 ({hedge_delay:.2f}s), hedging with {backup.name}")
+                    continue
+
+                for task in done:
+                    engine = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and engine is not primary:
+                            self.hedge_wins.inc()
+                        return (*task.result(), engine.name)
+                    # Nothing else racing: fall over to the next engine
+                    if not pending and queue:
+                        self.failovers.inc()
+                        launch()
+
+            self.failures.inc()
+            return (*EMPTY_RESULT, NO_ENGINE)
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+# --------------------------------------------------
+# DEFAULT REGISTRY
+# --------------------------------------------------
+def _load_engine(name: str) -> Optional[Transcriber]:
+    # Imported on demand so an engine's SDK is only needed if it is enabled
+    if name == "whisper":
+        import stt_whisper
+        return stt_whisper.transcribe if stt_whisper.OPENAI_API_KEY else None
+    if name == "deepgram":
+        import stt_deepgram
+        return stt_deepgram.transcribe if stt_deepgram.DEEPGRAM_API_KEY else None
+    if name == "local":
+        import stt_local
+        return stt_local.transcribe if stt_local.AVAILABLE else None
+    if name == "fake":
+        import stt_fake
+        return stt_fake.transcribe
+    raise ValueError(f"Unknown STT engine: {name}")
+
+
+def build_default(names: List[str] = ENGINES) -> STTRegistry:
+    registry = STTRegistry()
+    for name in names:
+        transcribe = _load_engine(name)
+        if transcribe is None:
+            logger.warning(f"STT engine {name} has no API key or isn't installed, not registering it")
+            continue
+        registry.register(name, transcribe)
+    logger.info(f"STT engines: {', '.join(registry.engines) or 'none'}")
+    return registry
+
+
+registry = build_default()
+
+
+async def transcribe(audio_bytes: bytes) -> Tuple[str, str]:
+    """Same contract as the individual engines; the registry picks which one runs."""
+    return await registry.transcribe(audio_bytes)
+
+
+async def transcribe_with_engine(audio_bytes: bytes) -> Tuple[str, str, str]:
+    """(transcript, language, engine name), for per-engine latency metrics."""
+    return await registry.transcribe_with_engine(audio_bytes)
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+from urllib.parse import urlencode
+
+from dotenv import load_dotenv
+from websockets.asyncio.client import connect
+
+import fast_path
+import http_clients
+import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# DEEPGRAM_LIVE_URL              streaming endpoint (point it at a mock server in tests)
+# STT_STREAM_MODEL               Deepgram model for live audio
+# STT_STREAM_ENDPOINTING_MS      silence Deepgram waits for before finalizing a segment
+# STT_STREAM_EARLY_STABILITY     consecutive interim results that must agree on a device
+#                                command before it fires ahead of end-of-utterance
+DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
+DEFAULT_LIVE_URL = "wss://api.deepgram.com/v1/listen"
+LIVE_URL = os.getenv("DEEPGRAM_LIVE_URL", DEFAULT_LIVE_URL)
+MODEL = os.getenv("STT_STREAM_MODEL", "nova-2")
+ENDPOINTING_MS = int(os.getenv("STT_STREAM_ENDPOINTING_MS", 300))
+EARLY_STABILITY = int(os.getenv("STT_STREAM_EARLY_STABILITY", 2))
+
+SAMPLE_RATE = 16000
+
+_sessions = metrics.counter("stt_stream_sessions_total", "streaming STT sessions opened")
+_partials = metrics.counter("stt_stream_partials_total", "interim transcripts received")
+_early = metrics.counter("stt_stream_early_intents_total", "device commands fired from a partial transcript")
+_early_lead = metrics.summary("stt_stream_early_lead_seconds", "time between an early intent and end of utterance")
+
+
+@dataclass
+class TranscriptResult:
+    text: str
+    is_final: bool      # this segment won't change any more
+    speech_final: bool  # Deepgram saw the speaker pause after it
+
+
+# --------------------------------------------------
+# STREAMING SESSION
+# --------------------------------------------------
+class StreamingSession:
+    """
+    One live recognition session. Use as an async context manager, feed
+    16 kHz mono s16le PCM with send_audio(), call finish() at the end of the
+    utterance and iterate results() for interim and final segments.
+    """
+
+    def __init__(self, language: str = "en", url: str = LIVE_URL, api_key: Optional[str] = DEEPGRAM_API_KEY):
+        if url == DEFAULT_LIVE_URL and not api_key:
+            raise RuntimeError("DEEPGRAM_API_KEY not found in environment variables.")
+        params = {
+            "model": MODEL,
+            "language": language,
+            "encoding": "linear16",
+            "sample_rate": SAMPLE_RATE,
+            "channels": 1,
+            "interim_results": "true",
+            "smart_format": "true",
+            "endpointing": ENDPOINTING_MS,
+        }
+        self.url = f"{url}?{urlencode(params)}"
+        self.headers = {"Authorization": f"Token {api_key}"} if api_key else {}
+        self._ws = None
+
+    async def __aenter__(self) -> "StreamingSession":
+        try:
+            self._ws = await connect(self.url, additional_headers=self.headers)
+        except Exception as e:
+            http_clients.count_error("deepgram_live", e)
+            raise
+        _sessions.inc()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._ws.close()
+
+    async def send_audio(self, pcm: bytes) -> None:
+        await self._ws.send(pcm)
+
+    async def finish(self) -> None:
+        """Tells the recognizer the utterance is over; it flushes and closes."""
+        await self._ws.send(json.dumps({"type": "CloseStream"}))
+
+    async def results(self) -> AsyncIterator[TranscriptResult]:
+        async for message in self._ws:
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            if data.get("type") != "Results":
+                continue
+            alternatives = data.get("channel", {}).get("alternatives") or [{}]
+            result = TranscriptResult(
+                text=alternatives[0].get("transcript", ""),
+                is_final=bool(data.get("is_final")),
+                speech_final=bool(data.get("speech_final")),
+            )
+            if not result.is_final:
+                _partials.inc()
+            yield result
+
+
+# --------------------------------------------------
+# UTTERANCE ASSEMBLY + EARLY INTENT
+# --------------------------------------------------
+class Utterance:
+    """
+    Joins finalized segments and the latest interim one into the running
+    transcript, and checks it against the fast-path after every update.
+    `update` returns a fast-path result once, the first time a device
+    command has been stable for EARLY_STABILITY interim results (or appears
+    in a finalized segment).
+    """
+
+    def __init__(self, language: str, stability: int = EARLY_STABILITY):
+        self.language = language
+        self.stability = max(1, stability)
+        self.finals = []
+        self.interim = ""
+        self.early: Optional[dict] = None
+        self.early_at: Optional[float] = None
+        self._candidate = None
+        self._seen = 0
+
+    @property
+    def text(self) -> str:
+        return " ".join(part for part in [*self.finals, self.interim] if part).strip()
+
+    @property
+    def final_text(self) -> str:
+        return " ".join(part for part in self.finals if part).strip()
+
+    def update(self, result: TranscriptResult) -> Optional[dict]:
+        if result.is_final:
+            self.finals.append(result.text)
+            self.interim = ""
+        else:
+            self.interim = result.text
+
+        if self.early is not None:
+            return None
+
+        found = fast_path.match(self.text, self.language)
+        slots = (found["intent"].action, found["intent"].device) if found else None
+        if slots is None:
+            self._candidate, self._seen = None, 0
+            return None
+
+        self._seen = self._seen + 1 if slots == self._candidate else 1
+        self._candidate = slots
+        if result.is_final or self._seen >= self.stability:
+            self.early = found
+            self.early_at = time.monotonic()
+            _early.inc()
+            return found
+        return None
+
+    def close(self) -> None:
+        """Marks end of utterance, for the early-intent lead time metric."""
+        if self.early_at is not None:
+            _early_lead.observe(time.monotonic() - self.early_at)
+
+    def early_still_holds(self) -> bool:
+        """Whether the complete transcript agrees with the intent fired early."""
+        if self.early is None:
+            return False
+        found = fast_path.match(self.final_text or self.text, self.language)
+        if found is None:
+            return False
+        early = self.early["intent"]
+        return (found["intent"].action, found["intent"].device) == (early.action, early.device)
@@ -1,24 +1,39 @@
 import os
 import io
 from openai import AsyncOpenAI
+from typing import Optional
 from dotenv import load_dotenv
 
+import http_clients
+
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+_client: Optional[AsyncOpenAI] = None
+_client_transport = None
+
+
+def get_client() -> AsyncOpenAI:
+    """AsyncOpenAI bound to the shared pooled 'openai' HTTP client."""
+    global _client, _client_transport
+    http_client = http_clients.get("openai")
+    if _client is None or _client_transport is not http_client:
+        _client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        _client_transport = http_client
+    return _client
 
 async def transcribe(audio_bytes: bytes) -> tuple[str, str]:
     """
     Sends audio bytes to OpenAI Whisper API (Async).
     Returns: (transcript, detected_language_code)
+    Raises on failure so stt_registry can fail over.
     """
     try:
         # OpenAI API requires a file-like object with a name
         audio_file = io.BytesIO(audio_bytes)
         audio_file.name = "audio.wav"
 
-        transcript_response = await client.audio.transcriptions.create(
+        transcript_response = await get_client().audio.transcriptions.create(
             model="whisper-1",
             file=audio_file,
             response_format="verbose_json"
@@ -32,4 +47,4 @@ async def transcribe(audio_bytes: bytes) -> tuple[str, str]:
 
     except Exception as e:
         print(f"STT Error: {e}")
-        return "", "en"
+        raise
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from atlas_batching import MicroBatcher, generate_batch
+
+
+# --------------------------------------------------
+# TINY STAND-IN MODEL
+# --------------------------------------------------
+# Character-level "tokenizer" and a "model" that answers each prompt with the
+# prompt reversed. Enough to exercise padding, batching and decoding on CPU.
+PAD = 0
+
+
+class FakeTensor(list):
+    @property
+    def shape(self):
+        return (len(self), len(self[0]) if self else 0)
+
+
+class FakeBatch(dict):
+    def to(self, device):
+        return self
+
+
+class TinyTokenizer:
+    eos_token = "\0"
+    eos_token_id = PAD
+    pad_token = None
+    padding_side = "right"
+
+    @property
+    def pad_token_id(self):
+        return None if self.pad_token is None else PAD
+
+    def __call__(self, prompts, return_tensors=None, padding=False):
+        rows = [[ord(c) for c in p] for p in prompts]
+        width = max(len(r) for r in rows)
+        ids, mask = FakeTensor(), FakeTensor()
+        for r in rows:
+            pad = [PAD] * (width - len(r))
+            if self.padding_side == "left":
+                ids.append(pad + r)
+                mask.append([0] * len(pad) + [1] * len(r))
+            else:
+                ids.append(r + pad)
+                mask.append([1] * len(r) + [0] * len(pad))
+        return FakeBatch(input_ids=ids, attention_mask=mask)
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(chr(i) for i in ids if not (skip_special_tokens and i == PAD))
+
+
+class TinyModel:
+    device = "cpu"
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def generate(self, input_ids, attention_mask, pad_token_id, max_new_tokens=16, **kwargs):
+        self.batch_sizes.append(len(input_ids))
+        width = max(len(r) for r in input_ids)
+        out = []
+        for ids, mask in zip(input_ids, attention_mask):
+            prompt = [i for i, m in zip(ids, mask) if m]
+            reply = list(reversed(prompt))[:max_new_tokens]
+            out.append(ids + reply + [pad_token_id] * (width - len(reply)))
+        return out
+
+
+# --------------------------------------------------
+# TESTS
+# --------------------------------------------------
+def test_generate_batch_left_pads_and_returns_only_new_text():
+    tokenizer, model = TinyTokenizer(), TinyModel()
+    assert generate_batch(tokenizer, model, ["abc", "hello"]) == [("cba", 3), ("olleh", 5)]
+    assert tokenizer.padding_side == "left"
+    assert model.batch_sizes == [2]
+
+
+def test_concurrent_submissions_share_a_batch():
+    tokenizer, model = TinyTokenizer(), TinyModel()
+    batcher = MicroBatcher(lambda prompts: [text for text, _ in generate_batch(tokenizer, model, prompts)], max_batch_size=4, max_wait=0.2)
+
+    prompts = [f"prompt {i}" for i in range(4)]
+    results = {}
+
+    def call(p):
+        results[p] = batcher.submit(p, timeout=5)
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in prompts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert results == {p: p[::-1] for p in prompts}
+    assert model.batch_sizes == [4]
+    assert batcher.stats()["largest_batch"] == 4
+
+
+def test_batch_closes_after_wait_window():
+    batcher = MicroBatcher(lambda items: [i * 2 for i in items], max_batch_size=8, max_wait=0.01)
+    started = time.monotonic()
+    assert batcher.submit(21, timeout=5) == 42
+    assert time.monotonic() - started < 1
+    batcher.close()
+    assert batcher.stats()["batches"] == 1
+
+
+def test_batch_errors_reach_every_caller():
+    def boom(items):
+        raise ValueError("out of memory")
+
+    batcher = MicroBatcher(boom, max_batch_size=2, max_wait=0.01)
+    with pytest.raises(ValueError, match="out of memory"):
+        batcher.submit("x", timeout=5)
+    batcher.close()
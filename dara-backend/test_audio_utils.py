@@ -0,0 +1,179 @@
+import sys
+import struct
+import asyncio
+
+import numpy as np
+import pytest
+
+import audio_utils
+from audio_utils import (
+    WAVE_FORMAT_EXTENSIBLE,
+    WAVE_FORMAT_IEEE_FLOAT,
+    WAVE_FORMAT_PCM,
+    FFmpegPool,
+    can_decode_natively,
+    convert_to_wav,
+    decode_pcm,
+    parse_wav_header,
+    resample,
+)
+
+# Stands in for ffmpeg: reads stdin to EOF, then hangs
+HANGING_CHILD = [sys.executable, "-c", "import sys, time; sys.stdin.buffer.read(); time.sleep(60)"]
+
+
+def _tracking_pool(monkeypatch, timeout: float, warm: int = 0):
+    monkeypatch.setattr(audio_utils, "FFMPEG_ARGS", HANGING_CHILD)
+    pool = FFmpegPool(size=2, max_pending=2, warm=warm, timeout=timeout)
+    spawned = []
+    spawn = pool._spawn
+
+    async def tracked():
+        proc = await spawn()
+        spawned.append(proc)
+        return proc
+
+    pool._spawn = tracked
+    return pool, spawned
+
+
+def test_timed_out_conversion_kills_and_reaps_the_child(monkeypatch):
+    async def scenario():
+        pool, spawned = _tracking_pool(monkeypatch, timeout=0.5)
+        with pytest.raises(ValueError, match="timed out"):
+            await pool.convert(b"RIFF")
+        assert spawned[0].returncode is not None
+        assert pool._active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_conversion_kills_and_reaps_the_child(monkeypatch):
+    async def scenario():
+        pool, spawned = _tracking_pool(monkeypatch, timeout=30, warm=1)
+        task = asyncio.create_task(pool.convert(b"RIFF"))
+        while not spawned or pool._tasks:
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # The conversion's child is gone; the warm spare is still there until close()
+        assert spawned[0].returncode is not None
+        assert len(pool._spares) == 1 and pool._spares[0].returncode is None
+        await pool.close()
+        assert all(proc.returncode is not None for proc in spawned)
+
+    asyncio.run(scenario())
+
+
+# A mono frame at half scale in each format
+HALF_SCALE = {
+    (WAVE_FORMAT_PCM, 8): bytes([192]),
+    (WAVE_FORMAT_PCM, 16): struct.pack("<h", 16384),
+    (WAVE_FORMAT_PCM, 24): (0x400000).to_bytes(3, "little"),
+    (WAVE_FORMAT_PCM, 32): struct.pack("<i", 1 << 30),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): struct.pack("<f", 0.5),
+}
+
+
+def make_wav(payload: bytes, format_tag=WAVE_FORMAT_PCM, channels=1, rate=16000, bits=16, extensible=False, extra_chunks=b"") -> bytes:
+    align = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", WAVE_FORMAT_EXTENSIBLE if extensible else format_tag, channels, rate, rate * align, align, bits)
+    if extensible:
+        # cbSize, valid bits, channel mask, then the sub-format GUID (tag in its first two bytes)
+        fmt += struct.pack("<HHI", 22, bits, 0) + struct.pack("<H", format_tag) + bytes(14)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + extra_chunks + b"data" + struct.pack("<I", len(payload)) + payload
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+@pytest.mark.parametrize("format_tag, bits", list(HALF_SCALE))
+def test_decodes_each_sample_format_to_float32(format_tag, bits):
+    wav = make_wav(HALF_SCALE[(format_tag, bits)] * 4, format_tag, bits=bits)
+    info = parse_wav_header(wav)
+
+    assert (info.format_tag, info.bits_per_sample, info.data_size) == (format_tag, bits, 4 * bits // 8)
+    assert can_decode_natively(info)
+    samples = decode_pcm(wav, info)
+    assert samples.dtype == np.float32 and samples.shape == (4, 1)
+    assert np.allclose(samples, 0.5, atol=1e-4)
+
+
+def test_extensible_header_reports_the_sub_format():
+    wav = make_wav(struct.pack("<ff", 0.25, -0.25), WAVE_FORMAT_IEEE_FLOAT, channels=2, bits=32, extensible=True)
+    info = parse_wav_header(wav)
+
+    assert (info.format_tag, info.channels, info.bits_per_sample) == (WAVE_FORMAT_IEEE_FLOAT, 2, 32)
+    assert decode_pcm(wav, info).tolist() == [[0.25, -0.25]]
+
+
+def test_stereo_is_downmixed_to_target_mono():
+    left, right = np.int16(16384), np.int16(-8192)
+    frames = np.array([[left, right]] * 1600, dtype="<i2")
+    wav = make_wav(frames.tobytes(), channels=2)
+
+    out = asyncio.run(convert_to_wav(wav))
+    info = parse_wav_header(out)
+    assert audio_utils.is_target_pcm(info)
+    pcm = np.frombuffer(out, dtype="<i2", offset=info.data_offset)
+    assert len(pcm) == 1600 and np.all(pcm == 4096)
+
+
+def test_odd_sized_chunks_are_skipped_with_their_pad_byte():
+    wav = make_wav(HALF_SCALE[(WAVE_FORMAT_PCM, 16)], extra_chunks=b"LIST" + struct.pack("<I", 3) + b"abc\x00")
+    info = parse_wav_header(wav)
+    assert info.data_offset == len(wav) - 2 and info.data_size == 2
+
+
+def test_streaming_recorder_sizes_are_clamped_to_the_payload():
+    wav = bytearray(make_wav(bytes(10)))
+    wav[-14:-10] = struct.pack("<I", 0xFFFFFFFF)
+    assert parse_wav_header(bytes(wav)).data_size == 10
+
+
+@pytest.mark.parametrize("wav", [
+    make_wav(bytes(8))[:30],                                         # cut inside the fmt chunk
+    b"RIFF" + bytes(4) + b"WAVE" + b"data" + struct.pack("<I", 2) + bytes(2),  # data before fmt
+    make_wav(bytes(8), bits=12),                                     # no native decoder
+    make_wav(bytes(8), format_tag=0x0002, bits=4),                   # ADPCM
+    b"ID3\x04" + bytes(64),                                          # not a WAV at all
+])
+def test_malformed_or_unsupported_wavs_fall_back_to_ffmpeg(monkeypatch, wav):
+    sent = []
+
+    async def fake_ffmpeg(data):
+        sent.append(data)
+        return b"converted"
+
+    monkeypatch.setattr(audio_utils.ffmpeg_pool, "convert", fake_ffmpeg)
+    assert asyncio.run(convert_to_wav(wav)) == b"converted"
+    assert sent == [wav]
+
+
+def test_native_failure_falls_back_to_ffmpeg(monkeypatch):
+    async def fake_ffmpeg(data):
+        return b"converted"
+
+    def broken(audio_bytes, info):
+        raise ValueError("buffer is smaller than requested size")
+
+    monkeypatch.setattr(audio_utils.ffmpeg_pool, "convert", fake_ffmpeg)
+    monkeypatch.setattr(audio_utils, "convert_pcm_native", broken)
+    assert asyncio.run(convert_to_wav(make_wav(bytes(8), rate=44100))) == b"converted"
+
+
+def test_target_pcm_passes_through_untouched():
+    wav = make_wav(bytes(320))
+    assert asyncio.run(convert_to_wav(wav)) is wav
+
+
+@pytest.mark.parametrize("src_rate", [8000, 22050, 44100, 48000])
+def test_resampled_length_dtype_and_level(src_rate):
+    t = np.arange(src_rate) / src_rate
+    x = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+    y = resample(x, src_rate)
+    assert y.dtype == np.float32
+    assert len(y) == -(-len(x) * 16000 // src_rate) == 16000
+    # A 440 Hz tone keeps its level away from the edges
+    assert np.sqrt(np.mean(y[1000:-1000] ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.02)
@@ -0,0 +1,123 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from devices import DeviceDispatcher, parse_controllers
+from schemas import Action, Device, Intent, IntentType
+from shared_store import SharedStore
+
+CONTROLLER = "http://esp32.test"
+
+
+def _fake_controller(calls: list, fail: bool = False) -> FastAPI:
+    """The firmware's switch routes, recording each command it receives."""
+    app = FastAPI()
+
+    for device in ("light", "fan"):
+        for state in ("on", "off"):
+            def handler(device=device, state=state):
+                calls.append(f"/{device}/turn/{state}")
+                if fail:
+                    return PlainTextResponse("Relay Error", status_code=500)
+                return PlainTextResponse(f"{device.capitalize()} turned {state.upper()}")
+            app.post(f"/{device}/turn/{state}")(handler)
+    return app
+
+
+def _dispatcher(calls: list, queue: SharedStore = None, **kwargs) -> DeviceDispatcher:
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_fake_controller(calls, **kwargs)))
+    return DeviceDispatcher(parse_controllers(CONTROLLER), state_ttl=60, client=client, queue=queue)
+
+
+def _command(action: Action, device: Device) -> Intent:
+    return Intent(type=IntentType.INSTRUCTION, action=action, device=device)
+
+
+def test_parse_controllers():
+    assert parse_controllers("http://a/") == {Device.LIGHT: "http://a", Device.FAN: "http://a", Device.TEMPERATURE: "http://a"}
+    assert parse_controllers("fan=http://b, heater=http://c") == {Device.FAN: "http://b"}
+    assert parse_controllers("") == {}
+
+
+def test_sends_commands_in_order_and_skips_repeats():
+    async def scenario():
+        calls = []
+        dispatcher = _dispatcher(calls)
+
+        first = dispatcher.dispatch(_command(Action.TURN_ON, Device.LIGHT))
+        # Known to be on already (the first command is still in flight)
+        assert dispatcher.dispatch(_command(Action.TURN_ON, Device.LIGHT)) is None
+        second = dispatcher.dispatch(_command(Action.TURN_ON, Device.FAN))
+        third = dispatcher.dispatch(_command(Action.TURN_OFF, Device.LIGHT))
+        assert await asyncio.gather(first, second, third) == [True, True, True]
+        assert calls == ["/light/turn/on", "/fan/turn/on", "/light/turn/off"]
+
+        assert dispatcher.known_state(Device.LIGHT) == Action.TURN_OFF
+        assert dispatcher.dispatch(Intent(type=IntentType.CONVERSATION)) is None
+        assert dispatcher.dispatch(_command(Action.CHECK, Device.TEMPERATURE)) is None
+
+    asyncio.run(scenario())
+
+
+def test_failed_command_forgets_the_state():
+    async def scenario():
+        calls = []
+        dispatcher = _dispatcher(calls, fail=True)
+
+        assert await dispatcher.dispatch(_command(Action.TURN_ON, Device.FAN)) is False
+        assert dispatcher.known_state(Device.FAN) is None
+        # So trying again really sends it
+        assert dispatcher.dispatch(_command(Action.TURN_ON, Device.FAN)) is not None
+        await dispatcher.drain()
+        assert calls == ["/fan/turn/on", "/fan/turn/on"]
+
+    asyncio.run(scenario())
+
+
+def test_followers_queue_commands_for_the_leader(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    def queue() -> SharedStore:
+        return SharedStore(path, "device_commands", 4096, 10, name="test_device_queue")
+
+    async def scenario():
+        leader_calls, follower_calls = [], []
+        leader, follower = _dispatcher(leader_calls, queue()), _dispatcher(follower_calls, queue())
+
+        # Nobody leads yet: commands wait in the queue
+        await follower.dispatch(_command(Action.TURN_ON, Device.LIGHT))
+        await follower.dispatch(_command(Action.TURN_ON, Device.LIGHT))
+        await follower.dispatch(_command(Action.TURN_ON, Device.FAN))
+        assert follower.known_state(Device.LIGHT) is None
+
+        leader.lead()
+        while len(leader_calls) < 2:
+            await asyncio.sleep(0.01)
+        await leader.dispatch(_command(Action.TURN_OFF, Device.LIGHT))
+        await leader.drain()
+
+        # In order, once, and only by the leader; it skipped the repeat
+        assert leader_calls == ["/light/turn/on", "/fan/turn/on", "/light/turn/off"]
+        assert follower_calls == []
+        assert leader._serving is None
+
+    asyncio.run(scenario())
+
+
+def test_revert_switches_back_unless_the_final_intent_sets_that_device(monkeypatch):
+    import devices
+
+    sent = []
+    monkeypatch.setattr(devices, "dispatch", lambda intent: sent.append((intent.action, intent.device)))
+    early = _command(Action.TURN_ON, Device.LIGHT)
+
+    devices.revert(early, Intent(type=IntentType.CONVERSATION, response_text="Okay."))
+    devices.revert(early, _command(Action.TURN_ON, Device.FAN))
+    assert sent == [(Action.TURN_OFF, Device.LIGHT)] * 2
+
+    sent.clear()
+    devices.revert(early, _command(Action.TURN_OFF, Device.LIGHT))
+    devices.revert(_command(Action.CHECK, Device.TEMPERATURE), Intent(type=IntentType.CONVERSATION))
+    assert sent == []
@@ -0,0 +1,62 @@
+import time
+import asyncio
+import threading
+import contextvars
+
+import metrics
+from executors import Executor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_sized_pool_reports_saturation_and_queue_wait():
+    executor = Executor("test_sized", workers=2)
+    gate = threading.Event()
+
+    async def scenario():
+        tasks = [asyncio.create_task(executor.run(gate.wait, 5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert (executor.busy, executor.queued) == (2, 1)
+        assert metrics.snapshot()["executor_test_sized_utilization"] == 1.0
+
+        gate.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert (executor.busy, executor.queued) == (0, 0)
+    assert executor.tasks.value == 3
+    assert executor.saturated.value == 1
+    assert executor.queue_wait.count == 3
+    executor.shutdown()
+
+
+def test_cancelled_before_start_leaves_the_queue():
+    executor = Executor("test_cancel", workers=1)
+    gate = threading.Event()
+    ran = []
+
+    async def scenario():
+        holder = asyncio.create_task(executor.run(gate.wait, 5))
+        queued = asyncio.create_task(executor.run(ran.append, 1))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert executor.queued == 0
+        gate.set()
+        await holder
+
+    asyncio.run(scenario())
+    time.sleep(0.05)
+    assert ran == []
+    executor.shutdown()
+
+
+def test_context_is_carried_into_the_worker():
+    executor = Executor("test_context", workers=1)
+
+    async def scenario():
+        request_id.set("abc")
+        return await executor.run(request_id.get)
+
+    assert asyncio.run(scenario()) == "abc"
+    executor.shutdown()
@@ -0,0 +1,111 @@
+import pytest
+
+import fast_path
+from fast_path import PhraseIndex
+from schemas import Action, Device, IntentType
+
+ON, OFF, CHECK = Action.TURN_ON, Action.TURN_OFF, Action.CHECK
+LIGHT, FAN, TEMPERATURE = Device.LIGHT, Device.FAN, Device.TEMPERATURE
+
+COMMANDS = [
+    ("turn on the light", "en", ON, LIGHT),
+    ("Turn on the lights, please.", "en", ON, LIGHT),
+    ("could you switch off the fan", "en", OFF, FAN),
+    ("turn the light on", "en", ON, LIGHT),
+    ("fan off", "en", OFF, FAN),
+    ("Ẹ jọ̀wọ́, tan iná", "yo", ON, LIGHT),
+    ("e jowo tan ina", "yo", ON, LIGHT),
+    ("paná", "yo", OFF, LIGHT),
+    ("pa fáànù náà", "yo", OFF, FAN),
+    ("Don Allah kunna fitila", "ha", ON, LIGHT),
+    ("kashe fanka", "ha", OFF, FAN),
+    ("biko gbanye ọkụ", "ig", ON, LIGHT),
+    ("gbanyụọ fan", "ig", OFF, FAN),
+    # Whisper names the language; the phrases decide when it's unknown
+    ("tan iná", "Yoruba", ON, LIGHT),
+    ("kashe fitila", "", OFF, LIGHT),
+    # Temperature questions; the reply is filled in from the sensor
+    ("What's the temperature?", "en", CHECK, TEMPERATURE),
+    ("what is the temperature in the room", "en", CHECK, TEMPERATURE),
+    ("how hot is it", "en", CHECK, TEMPERATURE),
+    ("Báwo ni ìgbóná inú yàrá?", "yo", CHECK, TEMPERATURE),
+    ("Yaya zafin dakin yake?", "ha", CHECK, TEMPERATURE),
+    ("Kedu ka okpomọkụ dị n'ime ụlọ?", "ig", CHECK, TEMPERATURE),
+]
+
+# Negations, questions and near-misses that must go to N-ATLaS
+NOT_COMMANDS = [
+    ("don't turn on the light", "en"),
+    ("Don’t turn on the light", "en"),
+    ("dont turn on the light", "en"),
+    ("do not switch off the fan", "en"),
+    ("no, turn on the light", "en"),
+    ("light is on?", "en"),
+    ("is the light on", "en"),
+    ("are the lights on", "en"),
+    ("what turned on the fan", "en"),
+    ("turn on the light if it's dark", "en"),
+    ("turn on the light tomorrow morning", "en"),
+    ("turn on the light tomorrow", "en"),
+    ("turn on the light in the morning", "en"),
+    ("turn off the fan tonight", "en"),
+    ("switch off the fan at 10", "en"),
+    ("turn on the light until 9", "en"),
+    ("turn off the fan in 5 minutes", "en"),
+    ("turn on the light at 7 pm", "en"),
+    ("turn on the light and the fan", "en"),
+    ("turn on and off the light", "en"),
+    ("turn on the television", "en"),
+    ("the light", "en"),
+    ("lighthouse on", "en"),
+    ("má tan iná", "yo"),
+    ("ṣé iná tan", "yo"),
+    ("kar ka kunna fitila", "ha"),
+    ("kada ka kashe fanka", "ha"),
+    ("emela gbanye ọkụ", "ig"),
+    ("ebula gbanyụọ ọkụ", "ig"),
+    ("tan iná ní ọ̀la", "yo"),
+    ("kunna fitila gobe", "ha"),
+    ("gbanye ọkụ echi", "ig"),
+    ("don't check the temperature", "en"),
+    ("set the temperature to twenty", "en"),
+    ("what is the fan", "en"),
+    ("", "en"),
+]
+
+
+@pytest.mark.parametrize("transcript, language, action, device", COMMANDS)
+def test_device_commands_are_answered_locally(transcript, language, action, device):
+    result = fast_path.match(transcript, language)
+
+    assert result is not None
+    intent = result["intent"]
+    assert (intent.type, intent.action, intent.device) == (IntentType.INSTRUCTION, action, device)
+    assert result["response_text"] == intent.response_text == fast_path.response_for(action, device, intent.language)
+
+
+@pytest.mark.parametrize("transcript, language", NOT_COMMANDS)
+def test_negations_questions_and_near_misses_are_left_to_the_llm(transcript, language):
+    assert fast_path.match(transcript, language) is None
+
+
+def test_reply_is_in_the_requested_language():
+    assert fast_path.match("tan iná", "yo")["response_text"] == "Ó dáa, mo ti tan iná."
+    assert fast_path.match("kunna fitila", "ha")["intent"].language == "ha"
+    # An unsupported language falls back to where the phrases came from
+    assert fast_path.match("gbanye ọkụ", "xx")["intent"].language == "ig"
+
+
+def test_phrase_index_matches_whole_words_only():
+    index = PhraseIndex([("on", "ON"), ("turn on", "TURN ON"), ("light", "LIGHT")])
+
+    found = sorted(index.find("turn on the light"))
+    assert found == [(0, 1, "TURN ON"), (1, 1, "ON"), (3, 3, "LIGHT")]
+    assert index.find("lighthouse onward") == []
+
+
+def test_classify_counts_hits_and_misses():
+    hits, misses = fast_path._hits.value, fast_path._misses.value
+    fast_path.classify("turn on the light", "en")
+    fast_path.classify("is the light on", "en")
+    assert (fast_path._hits.value, fast_path._misses.value) == (hits + 1, misses + 1)
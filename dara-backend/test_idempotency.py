@@ -0,0 +1,217 @@
+import asyncio
+
+import pytest
+
+import idempotency
+from idempotency import IdempotencyConflict, ResultStore, VoiceResult
+from shared_store import SharedStore
+from schemas import Action, Device, Intent, IntentType
+
+
+def _result(upload: str, audio: bytes = b"ID3 reply") -> VoiceResult:
+    intent = Intent(type=IntentType.INSTRUCTION, action=Action.TURN_ON, device=Device.LIGHT, language="en")
+    return VoiceResult(upload, "turn on the light", "en", intent, "Turning on the light", audio)
+
+
+def test_request_key_prefers_the_header():
+    key, upload = idempotency.request_key(b"audio", "  abc-123 ")
+    assert key == "key:abc-123"
+    assert upload == idempotency.fingerprint(b"audio")
+    assert idempotency.request_key(b"audio", None)[0] == f"audio:{upload}"
+
+
+def test_duplicates_wait_for_the_running_request_then_hit_the_cache():
+    async def scenario():
+        store = ResultStore("test_single_flight")
+        replay, flight = await store.acquire("k", "u")
+        assert replay is None and flight is not None
+
+        waiters = [asyncio.create_task(store.acquire("k", "u")) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert not any(w.done() for w in waiters)
+
+        flight.finish(_result("u"))
+        for replay, other in await asyncio.gather(*waiters):
+            assert other is None and replay.transcript == "turn on the light"
+        assert store.coalesced.value == 3
+
+        replay, other = await store.acquire("k", "u")
+        assert other is None and replay.audio == b"ID3 reply"
+        assert store.cache.hits.value == 1
+
+        with pytest.raises(IdempotencyConflict):
+            await store.acquire("k", "another recording")
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_request_hands_over_to_a_waiter():
+    async def scenario():
+        store = ResultStore("test_abandon")
+        _, flight = await store.acquire("k", "u")
+        waiter = asyncio.create_task(store.acquire("k", "u"))
+        await asyncio.sleep(0)
+
+        # Failed before the intent was known
+        flight.abandon()
+        replay, retry = await waiter
+        assert replay is None and retry is not None
+        assert "k" in store.inflight
+
+    asyncio.run(scenario())
+
+
+def test_decision_is_replayed_when_the_reply_audio_is_missing():
+    async def scenario():
+        store = ResultStore("test_decided")
+        _, flight = await store.acquire("k", "u")
+        waiter = asyncio.create_task(store.acquire("k", "u"))
+        await asyncio.sleep(0)
+
+        # The device was switched, then TTS failed or the client left
+        flight.decided(_result("u", audio=b""))
+        flight.abandon()
+        replay, retry = await waiter
+        assert retry is None
+        assert replay.intent.action == Action.TURN_ON and replay.audio == b""
+        assert store.cache.get("k").transcript == "turn on the light"
+        assert "k" not in store.inflight
+
+        # A reply without audio is cached too; the replay synthesizes it again
+        _, flight = await store.acquire("k2", "u")
+        flight.finish(_result("u", audio=b""))
+        replay, retry = await store.acquire("k2", "u")
+        assert retry is None and replay.response_text == "Turning on the light"
+
+    asyncio.run(scenario())
+
+
+def test_failed_stream_still_memoizes_the_decision():
+    async def scenario():
+        store = ResultStore("test_record_failed")
+        _, flight = await store.acquire("k", "u")
+
+        async def chunks():
+            yield b"ID3"
+            raise RuntimeError("Spitch 502")
+
+        with pytest.raises(RuntimeError):
+            async for _ in flight.record(chunks(), _result("u", audio=b"")):
+                pass
+        # Partial audio is dropped; the intent is kept
+        assert store.cache.get("k").audio == b""
+
+    asyncio.run(scenario())
+
+
+def test_record_finishes_with_the_streamed_audio():
+    async def scenario():
+        store = ResultStore("test_record")
+        _, flight = await store.acquire("k", "u")
+
+        async def chunks():
+            yield b"ID3"
+            yield b" reply"
+
+        streamed = [c async for c in flight.record(chunks(), _result("u", audio=b""))]
+        assert b"".join(streamed) == b"ID3 reply"
+        assert store.cache.get("k").audio == b"ID3 reply"
+
+    asyncio.run(scenario())
+
+
+def _worker(path: str, n: int) -> ResultStore:
+    """A ResultStore as one worker process would open it."""
+    return ResultStore(
+        f"test_shared_results_{n}",
+        shared=SharedStore(path, "voice_results", 1 << 20, 600, name="test_shared_results"),
+        claims=SharedStore(path, "voice_claims", 1 << 20, 60, name="test_shared_claims"),
+    )
+
+
+def test_retry_on_another_worker_waits_and_replays_the_decision(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def scenario():
+        first, second = _worker(path, 1), _worker(path, 2)
+        _, flight = await first.acquire("k", "u")
+        retry = asyncio.create_task(second.acquire("k", "u"))
+        await asyncio.sleep(0.3)
+        assert not retry.done()
+
+        # The device was switched: the other worker replays, never runs it
+        flight.decided(_result("u", audio=b""))
+        replay, other = await retry
+        assert other is None and replay.intent.action == Action.TURN_ON
+        assert second.coalesced.value == 1
+
+        flight.finish(_result("u"))
+        await asyncio.sleep(0.1)
+        replay, _ = await _worker(path, 3).acquire("k", "u")
+        assert replay.audio == b"ID3 reply"
+
+    asyncio.run(scenario())
+
+
+def test_failure_on_one_worker_hands_the_upload_to_another(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def scenario():
+        first, second = _worker(path, 1), _worker(path, 2)
+        _, flight = await first.acquire("k", "u")
+        retry = asyncio.create_task(second.acquire("k", "u"))
+        await asyncio.sleep(0.2)
+
+        flight.abandon()
+        replay, other = await retry
+        assert replay is None and other is not None
+
+    asyncio.run(scenario())
+
+
+def test_warming_up_reply_is_not_replayed_to_a_retry(monkeypatch):
+    pytest.importorskip("spitch")
+    import httpx
+    from types import SimpleNamespace
+
+    import main
+    import pipeline
+    import reasoning
+
+    async def convert_to_wav(data):
+        return data
+
+    async def transcribe_with_engine(wav):
+        return "what can you do", "en", "fake"
+
+    async def reply_audio(text, language, speculation):
+        return b"ID3 " + text.encode()
+
+    replies = [reasoning.fallback_reply("en", reasoning.WARMING_UP_TEXT)]
+
+    async def classify_intent(transcript, language):
+        if replies:
+            return replies.pop()
+        intent = Intent(type=IntentType.CONVERSATION, language="en", response_text="I can switch your lights.")
+        return {"intent": intent, "response_text": intent.response_text}
+
+    monkeypatch.setattr(main.audio_utils, "convert_to_wav", convert_to_wav)
+    monkeypatch.setattr(main.vad, "trim", lambda wav: SimpleNamespace(wav_bytes=wav))
+    monkeypatch.setattr(main.stt_service, "transcribe_with_engine", transcribe_with_engine)
+    monkeypatch.setattr(pipeline.reasoning, "classify_intent", classify_intent)
+    monkeypatch.setattr(pipeline, "reply_audio", reply_audio)
+    monkeypatch.setattr(idempotency, "voice_results", ResultStore("test_fallback_results"))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://dara.test") as client:
+            upload = {"audio": ("cold.wav", b"RIFF same clip", "audio/wav")}
+            first = await client.post("/voice", files=upload)
+            retry = await client.post("/voice", files=upload)
+        return first, retry
+
+    first, retry = asyncio.run(scenario())
+    assert first.json()["intent"]["response_text"] == reasoning.WARMING_UP_TEXT
+    assert "Idempotent-Replayed" not in retry.headers
+    assert retry.json()["intent"]["response_text"] == "I can switch your lights."
+    assert "audio:" + idempotency.fingerprint(b"RIFF same clip") not in idempotency.voice_results.inflight
@@ -0,0 +1,45 @@
+import metrics
+from intent_cache import IntentCache
+from schemas import Action, Device, Intent, IntentType
+
+
+def _instruction() -> Intent:
+    return Intent(type=IntentType.INSTRUCTION, language="yo", action=Action.TURN_ON, device=Device.LIGHT, response_text="Mo ti tan iná.")
+
+
+def test_normalized_transcripts_share_an_entry():
+    cache = IntentCache("test_intent_cache_keys")
+    cache.set("Ẹ jọ̀wọ́, tan iná!", "Yoruba", _instruction())
+
+    hit = cache.get("  e jowo TAN ina ", "yo")
+    assert hit["intent"].action == Action.TURN_ON
+    assert hit["response_text"] == "Mo ti tan iná."
+    assert cache.get("e jowo tan ina", "en") is None
+
+    # A caller changing its copy doesn't change the cache
+    hit["intent"].response_text = "changed"
+    assert cache.get("e jowo tan ina", "yo")["response_text"] == "Mo ti tan iná."
+
+
+def test_conversation_replies_are_opt_in():
+    chat = Intent(type=IntentType.CONVERSATION, language="en", response_text="I'm fine, thanks.")
+
+    cache = IntentCache("test_intent_cache_chat")
+    cache.set("how are you", "en", chat)
+    assert cache.get("how are you", "en") is None
+
+    cache = IntentCache("test_intent_cache_chat_on", conversation=True)
+    cache.set("how are you", "en", chat)
+    assert cache.get("How are you?", "en")["response_text"] == "I'm fine, thanks."
+
+
+def test_hit_ratio_is_reported_per_language():
+    cache = IntentCache("test_intent_cache_ratio")
+    cache.set("tan ina", "ig", _instruction())
+    before = metrics.snapshot()["intent_cache_lookups_total"].get("language=ig,result=hit", 0)
+
+    cache.get("tan ina", "ig")
+    assert metrics.snapshot()["intent_cache_lookups_total"]["language=ig,result=hit"] == before + 1
+    assert 0 < metrics.snapshot()["intent_cache_hit_ratio"]["language=ig"] <= 1
+    cache.get("tan ina", "xx")
+    assert "language=other,result=miss" in metrics.snapshot()["intent_cache_lookups_total"]
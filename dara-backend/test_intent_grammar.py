@@ -0,0 +1,44 @@
+import json
+
+from intent_grammar import IntentGrammar
+
+VALID = """
+{
+  "type": "INSTRUCTION",
+  "language": "yo",
+  "action": "TURN_ON",
+  "device": "LIGHT",
+  "response_text": "Mo ti tan iná, \\"ẹ ṣé\\"!"
+}"""
+
+
+def test_accepts_a_valid_intent_and_completes_at_the_closing_brace():
+    grammar = IntentGrammar("yo")
+    state = grammar.advance(grammar.initial(), VALID)
+    assert grammar.is_complete(state)
+    assert json.loads(VALID)["device"] == "LIGHT"
+    # Nothing may follow the object, so generation can stop there
+    assert grammar.advance(state, "\n") is None
+
+
+def test_rejects_values_outside_the_schema():
+    grammar = IntentGrammar("yo")
+    for text in [
+        '{"type": "CHAT"',
+        '{"type": "INSTRUCTION", "language": "en"',
+        '{"type": "INSTRUCTION", "language": "yo", "action": "DIM"',
+        '{"type": "INSTRUCTION", "language": "yo", "action": "NONE", "device": "TV"',
+        'Sure! {"type"',
+    ]:
+        assert grammar.advance(grammar.initial(), text) is None, text
+
+
+def test_response_text_is_capped_and_allowed_chars_are_reported():
+    grammar = IntentGrammar("en", max_response_chars=5)
+    head = '{"type":"CONVERSATION","language":"en","action":"NONE","device":"NONE","response_text":"'
+    state = grammar.advance(grammar.initial(), head + "hello")
+    assert grammar.advance(state, "!") is None
+    assert grammar.is_complete(grammar.advance(state, '"}'))
+
+    state = grammar.advance(grammar.initial(), '{ "type": "')
+    assert sorted(grammar.allowed_first_chars(state)) == ["C", "I"]
@@ -0,0 +1,38 @@
+import asyncio
+
+from leader import Election
+
+
+def test_one_worker_leads_and_another_takes_over_when_it_stops(tmp_path):
+    path = str(tmp_path / "cache.sqlite3.leader")
+
+    async def scenario():
+        elected = []
+
+        def campaign(name: str) -> Election:
+            election = Election(path, retry=0.05)
+
+            async def on_elected():
+                elected.append(name)
+
+            election.start(on_elected)
+            return election
+
+        first = campaign("first")
+        await asyncio.sleep(0.01)
+        second = campaign("second")
+        await asyncio.sleep(0.2)
+        assert elected == ["first"]
+        assert first.leading and not second.leading
+
+        await first.stop()
+        await asyncio.sleep(0.2)
+        assert elected == ["first", "second"] and second.leading
+        await second.stop()
+
+    asyncio.run(scenario())
+
+
+def test_a_single_process_always_leads():
+    election = Election(None)
+    assert election.try_lead() and election.leading
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from limiter import Limiter, LimiterFull
+
+
+def test_limits_concurrency_and_sheds_past_the_queue():
+    async def scenario():
+        limiter = Limiter("test_shed", max_concurrency=2, max_queue=1)
+        release = asyncio.Event()
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.inflight)
+                await release.wait()
+
+        tasks = [asyncio.create_task(call()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert (limiter.inflight, limiter.waiting) == (2, 1)
+
+        with pytest.raises(LimiterFull):
+            await call()
+        assert limiter.rejected.value == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert peak == 2
+        assert (limiter.inflight, limiter.waiting) == (0, 0)
+        assert limiter.queue_wait.count == 3
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        limiter = Limiter("test_cancel", max_concurrency=1)
+        release = asyncio.Event()
+
+        async def call():
+            async with limiter:
+                await release.wait()
+
+        holder = asyncio.create_task(call())
+        waiter = asyncio.create_task(call())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.waiting == 0
+
+        release.set()
+        await holder
+        async with limiter:
+            assert limiter.inflight == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+import pytest
+
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram("h", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        h.observe(value)
+
+    data = h.collect()
+    assert data["buckets"] == {"0.1": 2, "1.0": 3, "+Inf": 4}
+    assert data["count"] == 4 and data["sum"] == pytest.approx(2.65)
+
+
+def test_family_children_and_label_conflicts():
+    family = metrics.counter("test_family_total", "labelled counter", labels=("service", "kind"))
+    family.labels("atlas", "timeout").inc()
+    family.labels("atlas", "timeout").inc()
+    family.labels("spitch", "other").inc()
+
+    assert metrics.snapshot()["test_family_total"] == {
+        "service=atlas,kind=timeout": 2,
+        "service=spitch,kind=other": 1,
+    }
+    assert metrics.counter("test_family_total", labels=("service", "kind")) is family
+    with pytest.raises(ValueError):
+        metrics.counter("test_family_total")
+    with pytest.raises(ValueError):
+        family.labels("atlas")
+
+
+def test_prometheus_text_format():
+    stage = metrics.histogram("test_stage_seconds", "stage time", labels=("stage",), buckets=(0.5,))
+    stage.labels("stt").observe(0.25)
+    metrics.summary("test_latency_seconds", "latency").observe(2)
+    metrics.counter("test_escaped_total", labels=("path",)).labels('a"b\\c').inc()
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE test_stage_seconds histogram" in lines
+    assert 'test_stage_seconds_bucket{stage="stt",le="0.5"} 1' in lines
+    assert 'test_stage_seconds_bucket{stage="stt",le="+Inf"} 1' in lines
+    assert 'test_stage_seconds_sum{stage="stt"} 0.25' in lines
+    assert 'test_stage_seconds_count{stage="stt"} 1' in lines
+    assert "test_latency_seconds_count 1" in lines
+    assert "test_latency_seconds_max 2" in lines
+    assert 'test_escaped_total{path="a\\"b\\\\c"} 1' in lines
@@ -0,0 +1,174 @@
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from negotiation import AUDIO, JSON, MULTIPART, Multipart, multipart_body, negotiate, primed
+
+
+async def _chunks(*items):
+    """Yields bytes items; an exception item is raised at that point."""
+    for item in items:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+async def _collect(stream) -> list:
+    return [chunk async for chunk in stream]
+
+
+def test_negotiate_prefers_quality_then_specificity_then_order():
+    offered = [JSON, MULTIPART, AUDIO]
+    assert negotiate(None, offered) == JSON
+    assert negotiate("audio/mpeg", offered) == AUDIO
+    assert negotiate("audio/*;q=0.9, multipart/mixed", offered) == MULTIPART
+    assert negotiate("multipart/*, audio/mpeg", offered) == AUDIO
+    assert negotiate("*/*", offered) == JSON
+    assert negotiate("text/html, audio/mpeg;q=0", offered) == JSON
+
+
+def test_failure_before_the_first_chunk_is_raised_by_primed():
+    async def scenario():
+        with pytest.raises(RuntimeError, match="Spitch is down"):
+            await primed(_chunks(RuntimeError("Spitch is down")))
+
+    asyncio.run(scenario())
+
+
+def test_failure_after_the_first_chunk_is_raised_from_the_stream():
+    async def scenario():
+        stream = await primed(_chunks(b"ID3", b"more", RuntimeError("connection reset")))
+        received = []
+        with pytest.raises(RuntimeError, match="connection reset"):
+            async for chunk in stream:
+                received.append(chunk)
+        assert received == [b"ID3", b"more"]
+
+    asyncio.run(scenario())
+
+
+def test_closing_the_primed_stream_closes_the_source():
+    closed = []
+
+    async def source():
+        try:
+            yield b"one"
+            yield b"two"
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        stream = await primed(source())
+        assert await stream.__anext__() == b"one"
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert closed == [True]
+
+
+def test_multipart_body_reports_a_mid_stream_failure():
+    async def scenario():
+        parts = Multipart()
+        body = b"".join(await _collect(multipart_body(parts, {"transcript": "hi"}, _chunks(b"ID3", RuntimeError("Spitch 502")))))
+        return parts, body
+
+    parts, body = asyncio.run(scenario())
+    sections = body.split(f"--{parts.boundary}".encode())
+    assert b'name="metadata"' in sections[1]
+    assert sections[2].endswith(b"ID3\r\n")
+    assert b'name="error"' in sections[3] and b'"detail": "Spitch 502"' in sections[3]
+    assert sections[4] == b"--\r\n"
+
+
+# --------------------------------------------------
+# tts.stream_audio, with a fake Spitch SDK
+# --------------------------------------------------
+class FakeSpitch:
+    """speech.with_streaming_response.generate(...) yielding `chunks`, or raising an exception item."""
+
+    def __init__(self, chunks, delay: float = 0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = threading.Event()
+        self.speech = SimpleNamespace(with_streaming_response=SimpleNamespace(generate=self._generate))
+
+    @contextmanager
+    def _generate(self, **kwargs):
+        def iter_bytes(size):
+            for item in self.chunks:
+                if isinstance(item, Exception):
+                    raise item
+                time.sleep(self.delay)
+                yield item
+
+        try:
+            yield SimpleNamespace(iter_bytes=iter_bytes)
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture
+def tts(monkeypatch):
+    pytest.importorskip("spitch")
+    import tts
+    from cache import LRUCache
+    from tts_cache import TTSCache
+
+    monkeypatch.setattr(tts, "tts_cache", TTSCache(LRUCache("test_negotiation_tts", max_bytes=1 << 20), None))
+    return tts
+
+
+def test_stream_audio_raises_a_spitch_failure_through_primed(tts, monkeypatch):
+    monkeypatch.setattr(tts, "spitch_client", FakeSpitch([RuntimeError("Spitch 503")]))
+
+    async def scenario():
+        with pytest.raises(RuntimeError, match="Spitch 503"):
+            await primed(tts.stream_audio("Sure, I've turned on the light.", "en"))
+
+    asyncio.run(scenario())
+
+
+def test_stream_audio_raises_when_spitch_returns_nothing(tts, monkeypatch):
+    monkeypatch.setattr(tts, "spitch_client", FakeSpitch([]))
+
+    async def scenario():
+        with pytest.raises(tts.TTSError):
+            await primed(tts.stream_audio("Sure, I've turned off the fan.", "en"))
+
+    asyncio.run(scenario())
+
+
+def test_stream_audio_failure_after_audio_is_raised_and_not_cached(tts, monkeypatch):
+    monkeypatch.setattr(tts, "spitch_client", FakeSpitch([b"ID3", RuntimeError("reset")]))
+    text = "Ó dáa, mo ti tan iná."
+
+    async def scenario():
+        received = []
+        with pytest.raises(RuntimeError, match="reset"):
+            async for chunk in tts.stream_audio(text, "yo"):
+                received.append(chunk)
+        assert received == [b"ID3"]
+
+    asyncio.run(scenario())
+    assert tts.tts_cache.memory.bytes == 0
+
+
+def test_stream_audio_stops_spitch_when_the_reader_leaves(tts, monkeypatch):
+    spitch = FakeSpitch([b"ID3"] * 50, delay=0.02)
+    monkeypatch.setattr(tts, "spitch_client", spitch)
+
+    async def scenario():
+        stream = await primed(tts.stream_audio("To, na kunna fitila.", "ha"))
+        assert await stream.__anext__() == b"ID3"
+        await stream.aclose()
+
+    started = time.monotonic()
+    asyncio.run(scenario())
+    # The SDK response is closed well before all 50 chunks (1 s) were read
+    assert spitch.closed.wait(0.5)
+    assert time.monotonic() - started < 0.8
+    assert tts.tts_cache.memory.bytes == 0
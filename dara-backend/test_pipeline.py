@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("spitch")
+
+import executors
+import pipeline
+import tts
+from schemas import Action, Device, Intent, IntentType
+
+# fast_path confidence 0.67: speculated on, but left to N-ATLaS
+HESITANT = "turn on the light so the baby can sleep"
+
+
+class FakeSpitch:
+    """speech.generate(...) that blocks until `release` is set, counting calls."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.speech = SimpleNamespace(generate=self._generate)
+
+    def _generate(self, **kwargs):
+        self.calls.append(kwargs["text"])
+        self.release.wait(5)
+        return SimpleNamespace(content=b"ID3 " + kwargs["text"].encode())
+
+
+@pytest.fixture
+def spitch(monkeypatch):
+    from cache import LRUCache
+    from tts_cache import TTSCache
+
+    fake = FakeSpitch()
+    monkeypatch.setattr(tts, "spitch_client", fake)
+    monkeypatch.setattr(tts, "tts_cache", TTSCache(LRUCache("test_pipeline_tts", max_bytes=1 << 20), None))
+    # One worker, so a test can hold it and keep the speculation queued
+    monkeypatch.setattr(executors, "tts", executors.Executor("test_pipeline_tts", 1))
+    yield fake
+    fake.release.set()
+
+
+def _reasoning(monkeypatch, action: Action, device: Device, gate: asyncio.Event = None):
+    async def classify_intent(transcript, language):
+        if gate is not None:
+            await gate.wait()
+        intent = Intent(type=IntentType.INSTRUCTION, language="en", action=action, device=device, response_text="Okay, done.")
+        return {"intent": intent, "response_text": intent.response_text}
+
+    monkeypatch.setattr(pipeline.reasoning, "classify_intent", classify_intent)
+
+
+def test_confirmed_speculation_replaces_the_reply_and_its_audio_is_used(spitch, monkeypatch):
+    _reasoning(monkeypatch, Action.TURN_ON, Device.LIGHT)
+    spitch.release.set()
+    useful = pipeline._useful.value
+
+    async def scenario():
+        result, speculation = await pipeline.classify(HESITANT, "en")
+        audio = await pipeline.reply_audio(result["response_text"], "en", speculation)
+        return result, speculation, audio
+
+    result, speculation, audio = asyncio.run(scenario())
+    canned = "Sure, I've turned on the light for you."
+    assert speculation is not None
+    assert result["response_text"] == result["intent"].response_text == canned
+    assert audio == b"ID3 " + canned.encode()
+    # Synthesized once, by the speculation
+    assert spitch.calls == [canned]
+    assert pipeline._useful.value == useful + 1
+
+
+def test_mismatched_speculation_is_cancelled_before_its_tts_job_runs(spitch, monkeypatch):
+    _reasoning(monkeypatch, Action.TURN_OFF, Device.FAN)
+    wasted = pipeline._wasted.value
+    pool = executors.tts
+    held = threading.Event()
+
+    async def scenario():
+        # Hold the only TTS worker, so the speculation's job is still queued
+        blocker = asyncio.ensure_future(pool.run(held.wait, 5))
+        await asyncio.sleep(0.05)
+
+        result, speculation = await pipeline.classify(HESITANT, "en")
+        assert speculation is None
+        assert result["response_text"] == "Okay, done."
+        await asyncio.sleep(0)
+        assert pool.queued == 0
+
+        held.set()
+        await blocker
+
+    asyncio.run(scenario())
+    assert pipeline._wasted.value == wasted + 1
+    assert spitch.calls == []
+    assert (pool.busy, pool.queued) == (0, 0)
+
+
+def test_mismatched_speculation_already_running_releases_its_worker(spitch, monkeypatch):
+    pool = executors.tts
+
+    async def scenario():
+        gate = asyncio.Event()
+        _reasoning(monkeypatch, Action.TURN_OFF, Device.FAN, gate)
+        classify = asyncio.create_task(pipeline.classify(HESITANT, "en"))
+        while not spitch.calls:
+            await asyncio.sleep(0.01)
+        assert pool.busy == 1
+
+        gate.set()
+        result, speculation = await classify
+        assert speculation is None
+
+        # Spitch can't be interrupted; its reply is dropped and the worker freed
+        spitch.release.set()
+        while pool.busy:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert (pool.busy, pool.queued) == (0, 0)
+    assert tts.tts_cache.memory.bytes == 0
+
+
+def test_failed_reasoning_cancels_the_speculation(spitch, monkeypatch):
+    async def classify_intent(transcript, language):
+        raise RuntimeError("N-ATLaS exploded")
+
+    monkeypatch.setattr(pipeline.reasoning, "classify_intent", classify_intent)
+    wasted = pipeline._wasted.value
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await pipeline.classify(HESITANT, "en")
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert pipeline._wasted.value == wasted + 1
+    spitch.release.set()
+
+
+def test_clear_commands_and_chat_are_not_speculated_on():
+    assert pipeline.speculate("turn on the light", "en") is None
+    assert pipeline.speculate("what is the capital of France", "en") is None
+    assert pipeline.speculate("", "en") is None
@@ -0,0 +1,120 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from schemas import Action, Device, Intent, IntentType
+from sensors import SensorPoller, parse_reading
+from shared_store import SharedStore
+
+CONTROLLER = "http://esp32.test"
+
+
+def _poller(replies: list, **kwargs) -> SensorPoller:
+    """A poller reading from a fake firmware /temperature that serves `replies` in turn."""
+    app = FastAPI()
+
+    @app.get("/temperature")
+    def temperature():
+        status, body = replies.pop(0)
+        return PlainTextResponse(body, status_code=status)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    return SensorPoller([CONTROLLER], client=client, **kwargs)
+
+
+def _check(language: str = "en") -> dict:
+    intent = Intent(type=IntentType.INSTRUCTION, language=language, action=Action.CHECK, device=Device.TEMPERATURE, response_text="Let me check.")
+    return {"intent": intent, "response_text": intent.response_text}
+
+
+def test_parse_reading():
+    assert parse_reading("28.0 °C") == 28.0
+    assert parse_reading(" -3.5 °C\n") == -3.5
+
+
+def test_readings_are_kept_and_sensor_errors_skipped():
+    async def scenario():
+        poller = _poller([(200, "27.5 °C"), (500, "Sensor Error"), (200, "28.0 °C"), (200, "28.5 °C")], history=2)
+        assert await poller.poll(CONTROLLER) == 27.5
+        assert await poller.poll(CONTROLLER) is None
+        await poller.poll(CONTROLLER)
+        await poller.poll(CONTROLLER)
+
+        # Ring buffer of two
+        history = poller.history()[CONTROLLER]
+        assert history["c"] == [28.0, 28.5]
+        assert len(history["t"]) == 2
+        assert poller.history(since=history["t"][1])[CONTROLLER] == {"t": [], "c": []}
+        assert poller.latest()[1] == 28.5
+
+    asyncio.run(scenario())
+
+
+def test_check_is_answered_from_the_cache_within_its_freshness_bound():
+    async def scenario():
+        poller = _poller([(200, "31.0 °C")], max_age=60)
+        # Nothing read yet: says so instead of waiting for the sensor
+        assert poller.answer(_check())["response_text"] == "Sorry, I can't read the temperature right now."
+
+        await poller.poll(CONTROLLER)
+        answered = poller.answer(_check("yo"))
+        assert "31" in answered["response_text"]
+        assert answered["intent"].response_text == answered["response_text"]
+
+        # Too old to report
+        poller.readings[CONTROLLER].append((time.time() - 61, 32.0))
+        assert poller.answer(_check())["response_text"] == "Sorry, I can't read the temperature right now."
+
+        light = {"intent": Intent(type=IntentType.INSTRUCTION, action=Action.TURN_ON, device=Device.LIGHT), "response_text": "Done."}
+        assert poller.answer(light) is light
+
+    asyncio.run(scenario())
+
+
+def test_followers_mirror_the_leaders_readings(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    def shared() -> SharedStore:
+        return SharedStore(path, "sensor_readings", 4096, None, name="test_sensor_readings")
+
+    async def scenario():
+        leader = _poller([(200, "29.5 °C")], shared=shared())
+        follower = _poller([], shared=shared())
+        await leader.lead()
+        await leader.stop()
+
+        await leader.poll(CONTROLLER)
+        assert follower.history()[CONTROLLER]["c"] == []
+        await follower.refresh()
+        assert follower.history() == leader.history()
+        assert follower.latest()[1] == 29.5
+
+    asyncio.run(scenario())
+
+
+def test_temperature_question_is_answered_with_the_cached_reading(monkeypatch):
+    pytest.importorskip("spitch")
+    import pipeline
+    import sensors
+
+    async def classify_intent(transcript, language):
+        raise AssertionError("answered by the fast-path, N-ATLaS isn't asked")
+
+    poller = _poller([])
+    poller.readings[CONTROLLER].append((time.time(), 27.5))
+    monkeypatch.setattr(sensors, "poller", poller)
+    monkeypatch.setattr(pipeline.devices, "dispatch", lambda intent: None)
+    monkeypatch.setattr(pipeline.reasoning.fast_path, "ENABLED", True)
+
+    result, speculation = asyncio.run(pipeline.classify("What's the temperature in the room?", "en"))
+    assert speculation is None
+    assert result["intent"].action == Action.CHECK and result["intent"].device == Device.TEMPERATURE
+    assert result["response_text"] == "It's 27.5 degrees Celsius in the room."
+    assert result["intent"].response_text == result["response_text"]
+
+    result, _ = asyncio.run(pipeline.classify("Yaya zafin dakin yake?", "ha"))
+    assert result["response_text"] == "Zafin ɗakin ya kai digiri 27.5 Celsius."
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import multiprocessing
+
+from intent_cache import IntentCache
+from schemas import Action, Device, Intent, IntentType
+from shared_store import SharedStore
+
+
+def _write_from_another_process(path: str) -> None:
+    SharedStore(path, "test", max_bytes=1024, ttl=None).set("clip", b"ID3 from worker 2")
+
+
+def test_entries_written_by_one_process_are_read_by_another(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    store = SharedStore(path, "test", max_bytes=1024, ttl=None, name="test_shared_procs")
+    assert store.get("clip") is None
+
+    worker = multiprocessing.get_context("spawn").Process(target=_write_from_another_process, args=(path,))
+    worker.start()
+    worker.join(30)
+    assert worker.exitcode == 0
+    assert store.get("clip") == b"ID3 from worker 2"
+
+
+def test_expiry_and_byte_budget(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    store = SharedStore(path, "test", max_bytes=10, ttl=60, name="test_shared_budget")
+    for key in "abcd":
+        store.set(key, b"12345")
+    store.evict()
+    # Oldest first until the namespace fits in 10 bytes
+    assert [store.get(k) for k in "abcd"] == [None, None, b"12345", b"12345"]
+    assert store.bytes() == 10
+
+    expired = SharedStore(path, "other", max_bytes=10, ttl=-1, name="test_shared_ttl")
+    expired.set("x", b"1")
+    assert expired.get("x") is None
+    # Namespaces don't touch each other's entries
+    assert store.get("d") == b"12345"
+
+
+def test_add_only_claims_missing_or_expired_keys(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    claims = SharedStore(path, "claims", max_bytes=1024, ttl=60, name="test_shared_add")
+    assert claims.add("k", b"")
+    assert not claims.add("k", b"")
+    claims.delete("k")
+    assert claims.add("k", b"")
+
+    expired = SharedStore(path, "claims", max_bytes=1024, ttl=-1, name="test_shared_add")
+    assert expired.add("old", b"")
+    assert expired.add("old", b"")
+
+
+def test_intent_cache_shares_entries_between_workers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    worker_1 = IntentCache("test_shared_intents_1", shared=SharedStore(path, "intent", 4096, None, name="test_shared_intent"))
+    worker_2 = IntentCache("test_shared_intents_2", shared=SharedStore(path, "intent", 4096, None, name="test_shared_intent"))
+
+    intent = Intent(type=IntentType.INSTRUCTION, language="ha", action=Action.TURN_OFF, device=Device.FAN, response_text="To, na kashe fanka.")
+    worker_1.set("Kashe fanka", "ha", intent)
+    hit = worker_2.get("kashe fanka.", "ha")
+    assert hit["intent"] == intent
+
+
+class ThreadRecordingStore(SharedStore):
+    """Notes the thread each SQLite call runs on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread().name)
+        return super().get(key)
+
+    def set(self, key, data):
+        self.threads.append(threading.current_thread().name)
+        super().set(key, data)
+
+
+def test_event_loop_callers_reach_sqlite_through_the_io_executor(tmp_path):
+    from tts_cache import TTSCache
+
+    path = str(tmp_path / "cache.sqlite3")
+    intent = Intent(type=IntentType.INSTRUCTION, language="en", action=Action.TURN_ON, device=Device.LIGHT, response_text="Done.")
+    intents = IntentCache("test_shared_async_intents", shared=ThreadRecordingStore(path, "intent", 4096, None, name="test_shared_async"))
+    clips = TTSCache(None, ThreadRecordingStore(path, "tts", 4096, None, name="test_shared_async"))
+    clips.set_disk("clip", b"ID3")
+
+    async def scenario():
+        await intents.set_async("turn on the light", "en", intent)
+        intents.clear()
+        assert (await intents.get_async("turn on the light", "en"))["intent"] == intent
+        assert await clips.get_async("clip") == b"ID3"
+
+    asyncio.run(scenario())
+    threads = intents.shared.threads + clips.disk.threads[1:]
+    assert len(threads) == 3 and all(name.startswith("io-executor") for name in threads)
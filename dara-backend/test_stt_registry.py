@@ -0,0 +1,73 @@
+import asyncio
+
+import stt_registry
+from stt_fake import FakeEngine
+from stt_registry import STTRegistry
+
+
+def make_registry(**engines) -> STTRegistry:
+    registry = STTRegistry(hedge=True, explore=0.0)
+    for name, engine in engines.items():
+        registry.register(name, engine)
+    return registry
+
+
+def warm_up(registry: STTRegistry, latencies: dict) -> None:
+    # Seed each engine's rolling profile without waiting for real calls
+    for name, latency in latencies.items():
+        for _ in range(stt_registry.MIN_SAMPLES):
+            registry.engines[name].record(latency, ok=True)
+
+
+def test_routes_to_the_fastest_engine_once_profiles_exist():
+    slow, fast = FakeEngine("slow", latency=0.01), FakeEngine("fast", latency=0.01)
+    registry = make_registry(slow=slow, fast=fast)
+
+    # No profile yet: configured order
+    assert [e.name for e in registry.ranked()] == ["slow", "fast"]
+
+    warm_up(registry, {"slow": 0.5, "fast": 0.1})
+    assert asyncio.run(registry.transcribe(b"")) == ("fast", "en")
+    assert (slow.calls, fast.calls) == (0, 1)
+
+
+def test_falls_over_when_an_engine_errors():
+    broken, backup = FakeEngine("broken", latency=0.0, error_rate=1.0), FakeEngine("backup", latency=0.0)
+    registry = make_registry(broken=broken, backup=backup)
+
+    assert asyncio.run(registry.transcribe(b"")) == ("backup", "en")
+    assert registry.engines["broken"].error_rate() == 1.0
+
+
+def test_unhealthy_engine_is_skipped_until_cooldown():
+    broken, backup = FakeEngine("broken", latency=0.0, error_rate=1.0), FakeEngine("backup", latency=0.0)
+    registry = make_registry(broken=broken, backup=backup)
+
+    for _ in range(stt_registry.MIN_SAMPLES):
+        asyncio.run(registry.transcribe(b""))
+    assert not registry.engines["broken"].healthy()
+
+    calls = broken.calls
+    asyncio.run(registry.transcribe(b""))
+    assert broken.calls == calls
+
+
+def test_hedges_past_p95_and_takes_the_first_answer():
+    stuck, quick = FakeEngine("stuck", latency=1.0), FakeEngine("quick", latency=0.01)
+    registry = make_registry(stuck=stuck, quick=quick)
+    # Stuck is usually fast (p95 50 ms), so it is chosen first
+    warm_up(registry, {"stuck": 0.05, "quick": 0.2})
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        result = await registry.transcribe(b"")
+        return result, asyncio.get_running_loop().time() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result == ("quick", "en")
+    assert elapsed < 0.5
+    assert stuck.cancelled == 1
+
+
+def test_no_engines_returns_empty_transcript():
+    assert asyncio.run(STTRegistry().transcribe(b"")) == stt_registry.EMPTY_RESULT
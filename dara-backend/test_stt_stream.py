@@ -0,0 +1,231 @@
+import json
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+
+import pytest
+from websockets.asyncio.server import serve
+
+import stt_stream
+from stt_stream import StreamingSession, Utterance, TranscriptResult
+
+CHUNK = 3200  # 100 ms of 16 kHz s16le
+
+
+# --------------------------------------------------
+# MOCK DEEPGRAM LIVE SERVER
+# --------------------------------------------------
+# Reveals one more word of `script` per audio chunk as an interim result,
+# finalizes the whole thing on CloseStream and closes, like Deepgram does.
+def deepgram_mock(script: str, received: list):
+    words = script.split()
+
+    def results(text: str, final: bool) -> str:
+        return json.dumps({
+            "type": "Results",
+            "is_final": final,
+            "speech_final": final,
+            "channel": {"alternatives": [{"transcript": text, "confidence": 0.9}]},
+        })
+
+    async def handler(ws):
+        received.append(ws.request.path)
+        chunks = 0
+        async for message in ws:
+            if isinstance(message, bytes):
+                chunks += 1
+                await ws.send(results(" ".join(words[:chunks]), final=False))
+            elif json.loads(message).get("type") == "CloseStream":
+                await ws.send(results(script, final=True))
+                await ws.send(json.dumps({"type": "Metadata"}))
+                await ws.close()
+
+    return handler
+
+
+async def run_session(script: str, n_chunks: int, language: str = "en"):
+    received, seen, early = [], [], []
+    async with serve(deepgram_mock(script, received), "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        utterance = Utterance(language, stability=2)
+        async with StreamingSession(language, url=f"ws://127.0.0.1:{port}/v1/listen", api_key=None) as session:
+
+            async def listen():
+                async for result in session.results():
+                    seen.append((result.text, result.is_final))
+                    found = utterance.update(result)
+                    if found is not None:
+                        early.append((len(seen), found["intent"].action.value, found["intent"].device.value))
+
+            listener = asyncio.create_task(listen())
+            for _ in range(n_chunks):
+                await session.send_audio(b"\0" * CHUNK)
+                await asyncio.sleep(0.01)
+            await session.finish()
+            await listener
+    return received, seen, early, utterance
+
+
+# --------------------------------------------------
+# TESTS
+# --------------------------------------------------
+def test_session_streams_partials_and_final_transcript():
+    received, seen, _, utterance = asyncio.run(run_session("hello there how are you", 5))
+
+    assert "encoding=linear16" in received[0] and "interim_results=true" in received[0]
+    assert seen[0] == ("hello", False)
+    assert seen[-1] == ("hello there how are you", True)
+    assert utterance.final_text == "hello there how are you"
+    assert utterance.early is None
+
+
+def test_device_command_fires_before_end_of_utterance():
+    # "turn off the fan" is complete after 4 chunks; the user keeps talking
+    _, seen, early, utterance = asyncio.run(run_session("turn off the fan please", 6))
+
+    # Fires on the second interim that agrees, before the final segment
+    assert early == [(5, "TURN_OFF", "FAN")]
+    assert not seen[early[0][0] - 1][1]
+    assert utterance.early_still_holds()
+
+
+def test_early_intent_is_revised_when_the_sentence_changes():
+    utterance = Utterance("en", stability=1)
+    assert utterance.update(TranscriptResult("turn on the light", False, False)) is not None
+    utterance.update(TranscriptResult("turn on the light and the fan", True, True))
+    assert not utterance.early_still_holds()
+
+
+def test_default_endpoint_needs_a_key():
+    with pytest.raises(RuntimeError):
+        StreamingSession("en", url=stt_stream.DEFAULT_LIVE_URL, api_key=None)
+
+
+# --------------------------------------------------
+# /voice/ws
+# --------------------------------------------------
+@contextmanager
+def deepgram_in_thread(script: str):
+    """The mock server on its own loop, since TestClient runs the app on another."""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    port = []
+
+    async def run():
+        stop = asyncio.Event()
+        port.append(stop)
+        async with serve(deepgram_mock(script, []), "127.0.0.1", 0) as server:
+            port.append(server.sockets[0].getsockname()[1])
+            started.set()
+            await stop.wait()
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(run(),))
+    thread.start()
+    started.wait(5)
+    try:
+        yield f"ws://127.0.0.1:{port[1]}/v1/listen"
+    finally:
+        loop.call_soon_threadsafe(port[0].set)
+        thread.join(5)
+        loop.close()
+
+
+def run_voice_ws(monkeypatch, script: str) -> list:
+    from starlette.testclient import TestClient
+    import main
+    import pipeline
+
+    async def stream_reply(text, language, speculation):
+        yield b"ID3"
+
+    monkeypatch.setattr(pipeline, "stream_reply", stream_reply)
+    events = []
+    with deepgram_in_thread(script) as url:
+        monkeypatch.setattr(stt_stream, "StreamingSession", functools.partial(StreamingSession, url=url, api_key=None))
+        with TestClient(main.app).websocket_connect("/voice/ws?language=en") as ws:
+            for _ in script.split():
+                ws.send_bytes(b"\0" * CHUNK)
+            ws.send_text(json.dumps({"type": "end"}))
+            while not events or events[-1]["event"] not in ("done", "error"):
+                message = ws.receive()
+                if message.get("text"):
+                    events.append(json.loads(message["text"]))
+    return events
+
+
+def record_dispatch(monkeypatch) -> list:
+    import devices
+
+    dispatched = []
+
+    def dispatch(intent):
+        if intent.action.value == "NONE":
+            return None
+        dispatched.append((intent.action.value, intent.device.value))
+        # Anything but None: the command was sent
+        return True
+
+    monkeypatch.setattr(devices, "dispatch", dispatch)
+    return dispatched
+
+
+def test_voice_ws_sends_the_early_intent_to_the_device(monkeypatch):
+    pytest.importorskip("spitch")
+    import devices
+    import pipeline
+
+    dispatched = record_dispatch(monkeypatch)
+
+    async def classify(transcript, language):
+        raise AssertionError("the early intent still holds; nothing to classify")
+
+    monkeypatch.setattr(pipeline, "classify", classify)
+    events = run_voice_ws(monkeypatch, "turn off the fan please")
+
+    intents = [e for e in events if e["event"] == "intent"]
+    assert [e.get("early") for e in intents] == [True]
+    assert events[-1]["event"] == "done"
+    assert dispatched == [("TURN_OFF", "FAN")]
+
+
+def test_voice_ws_sends_a_revised_intent_to_the_device_too(monkeypatch):
+    pytest.importorskip("spitch")
+    import devices
+    import pipeline
+    from schemas import Action, Device, Intent, IntentType
+
+    dispatched = record_dispatch(monkeypatch)
+
+    async def classify_intent(transcript, language):
+        intent = Intent(type=IntentType.INSTRUCTION, language="en", action=Action.TURN_ON, device=Device.FAN, response_text="Okay.")
+        return {"intent": intent, "response_text": intent.response_text}
+
+    monkeypatch.setattr(pipeline.reasoning, "classify_intent", classify_intent)
+    events = run_voice_ws(monkeypatch, "turn on the light and the fan")
+
+    intents = [e for e in events if e["event"] == "intent"]
+    assert [e.get("early") for e in intents] == [True, None]
+    assert intents[-1]["revised"] is True
+    # The light, switched early, is switched back
+    assert dispatched == [("TURN_ON", "LIGHT"), ("TURN_ON", "FAN"), ("TURN_OFF", "LIGHT")]
+
+
+def test_voice_ws_switches_back_an_early_intent_taken_back(monkeypatch):
+    pytest.importorskip("spitch")
+    import pipeline
+    from schemas import Intent, IntentType
+
+    dispatched = record_dispatch(monkeypatch)
+
+    async def classify_intent(transcript, language):
+        intent = Intent(type=IntentType.CONVERSATION, language="en", response_text="Okay, I'll wait.")
+        return {"intent": intent, "response_text": intent.response_text}
+
+    monkeypatch.setattr(pipeline.reasoning, "classify_intent", classify_intent)
+    events = run_voice_ws(monkeypatch, "turn on the light please no wait")
+
+    intents = [e for e in events if e["event"] == "intent"]
+    assert [e.get("early") for e in intents] == [True, None]
+    assert intents[-1]["intent"]["type"] == "CONVERSATION"
+    assert dispatched == [("TURN_ON", "LIGHT"), ("TURN_OFF", "LIGHT")]
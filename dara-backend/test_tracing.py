@@ -0,0 +1,70 @@
+import json
+import asyncio
+
+import httpx
+
+import http_clients
+import tracing
+
+
+def test_spans_nest_and_propagate_context():
+    with tracing.collect() as spans:
+        with tracing.span("request", parent="00-" + "a" * 32 + "-" + "b" * 16 + "-01") as root:
+            with tracing.span("stt", engine="fake") as child:
+                header = tracing.traceparent()
+        assert tracing.current() is None
+
+    stt, request = spans
+    assert request["traceId"] == stt["traceId"] == "a" * 32
+    assert request["parentSpanId"] == "b" * 16
+    assert stt["parentSpanId"] == root.span_id
+    assert header == child.traceparent
+    assert {"key": "engine", "value": {"stringValue": "fake"}} in stt["attributes"]
+
+
+def test_spans_are_free_when_tracing_is_off():
+    with tracing.span("anything") as span:
+        assert span is None
+    assert tracing.traceparent() is None
+    assert tracing.parse_traceparent("garbage") is None
+
+
+def test_file_exporter_writes_otlp_json(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure("file", path=str(path))
+    try:
+        with tracing.span("voice") as root:
+            tracing.record_span("atlas.decode", 1, 2, root, **{"atlas.tokens_generated": 42})
+        tracing.ingest([{"traceId": root.trace_id, "spanId": "c" * 16, "name": "atlas.inference"}], "dara-atlas")
+        tracing.flush()
+    finally:
+        tracing.configure(None)
+
+    resources = [r for line in path.read_text().splitlines() for r in json.loads(line)["resourceSpans"]]
+    names = {
+        r["resource"]["attributes"][0]["value"]["stringValue"]: [s["name"] for s in r["scopeSpans"][0]["spans"]]
+        for r in resources
+    }
+    assert sorted(names["dara-backend"]) == ["atlas.decode", "voice"]
+    assert names["dara-atlas"] == ["atlas.inference"]
+
+
+def test_upstream_requests_carry_traceparent():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("traceparent"))
+        return httpx.Response(200, json={"ok": True})
+
+    async def call():
+        transport = http_clients._InstrumentedTransport("atlas", httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.post("https://atlas.test/infer", json={})
+
+    with tracing.collect() as spans:
+        with tracing.span("reasoning"):
+            asyncio.run(call())
+
+    http_span = next(s for s in spans if s["name"] == "POST atlas")
+    assert seen == [f"00-{http_span['traceId']}-{http_span['spanId']}-01"]
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in http_span["attributes"]
@@ -0,0 +1,106 @@
+import os
+import asyncio
+
+import cache
+from cache import LRUCache
+from tts_cache import DiskCache, TTSCache, cache_key
+
+
+def test_key_ignores_unicode_form_and_spacing_but_not_voice():
+    composed = cache_key("Mo ti tan iná.", "yo", "sade", "mp3")
+    assert cache_key("Mo  ti tan iná. ", "yo", "sade", "mp3") == composed
+    assert cache_key("Mo ti tan iná.", "yo", "funmi", "mp3") != composed
+    assert cache_key("mo ti tan iná.", "yo", "sade", "mp3") != composed
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    memory = LRUCache("test_tts_memory_lru", max_bytes=10)
+    memory.set("a", b"1234")
+    memory.set("b", b"1234")
+    assert memory.get("a") == b"1234"
+    memory.set("c", b"1234")
+
+    # "b" was the least recently used
+    assert memory.get("b") is None
+    assert memory.get("a") == b"1234" and memory.get("c") == b"1234"
+    assert memory.bytes == 8
+
+    memory.set("huge", b"x" * 11)
+    assert memory.get("huge") is None and len(memory) == 2
+
+
+def test_memory_tier_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    memory = LRUCache("test_tts_memory_ttl", max_bytes=100, ttl=60)
+    memory.set("a", b"clip")
+
+    now[0] += 59
+    assert memory.get("a") == b"clip"
+    now[0] += 2
+    assert memory.get("a") is None
+    assert memory.bytes == 0
+
+
+def test_disk_tier_writes_atomically_and_survives_a_restart(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1024, ttl=None)
+    disk.set("k", b"ID3 clip")
+    assert os.listdir(tmp_path) == ["k.bin"]
+
+    # A write interrupted before its rename leaves only a temp file behind
+    (tmp_path / "j.bin.123.456.tmp").write_bytes(b"ID3 par")
+    restarted = DiskCache(str(tmp_path), max_bytes=1024, ttl=None)
+    assert restarted.get("k") == b"ID3 clip"
+    assert restarted.get("j") is None
+    assert os.listdir(tmp_path) == ["k.bin"]
+    assert restarted._bytes == len(b"ID3 clip")
+
+
+def test_disk_tier_treats_unreadable_entries_as_misses(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1024, ttl=None)
+    (tmp_path / "empty.bin").write_bytes(b"")
+    assert disk.get("empty") is None
+    assert not (tmp_path / "empty.bin").exists()
+
+    (tmp_path / "dir.bin").mkdir()
+    assert disk.get("dir") is None
+
+
+def test_disk_tier_evicts_oldest_and_expired_files(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=10, ttl=3600)
+    for age, key in ((300, "a"), (200, "b"), (100, "c")):
+        disk.set(key, b"1234")
+        past = os.stat(tmp_path / f"{key}.bin").st_mtime - age
+        os.utime(tmp_path / f"{key}.bin", (past, past))
+    disk.set("d", b"1234")
+
+    # Over budget: oldest files go first until it fits
+    assert sorted(os.listdir(tmp_path)) == ["c.bin", "d.bin"]
+    assert disk._bytes == 8
+
+    stale = os.stat(tmp_path / "c.bin").st_mtime - 7200
+    os.utime(tmp_path / "c.bin", (stale, stale))
+    assert disk.get("c") is None
+    assert sorted(os.listdir(tmp_path)) == ["d.bin"]
+
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1024, ttl=None)
+    disk.set("k", b"ID3 clip")
+    tiers = TTSCache(LRUCache("test_tts_promote", max_bytes=1024), disk)
+
+    assert tiers.get("k") == b"ID3 clip"
+    os.remove(tmp_path / "k.bin")
+    assert tiers.get("k") == b"ID3 clip"
+    assert tiers.get("missing") is None
+
+
+def test_async_lookup_reads_the_disk_off_the_event_loop(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1024, ttl=None)
+    disk.set("k", b"ID3 clip")
+    tiers = TTSCache(LRUCache("test_tts_async", max_bytes=1024), disk)
+
+    assert asyncio.run(tiers.get_async("k")) == b"ID3 clip"
+    os.remove(tmp_path / "k.bin")
+    assert asyncio.run(tiers.get_async("k")) == b"ID3 clip"
+    assert asyncio.run(tiers.get_async("missing")) is None
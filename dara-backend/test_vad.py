@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import vad
+from audio_utils import parse_wav_header, wav_header
+
+RATE = 16000
+rng = np.random.default_rng(0)
+
+
+def to_wav(x: np.ndarray) -> bytes:
+    data = (np.clip(x, -1, 1) * 32767).astype("<i2").tobytes()
+    return wav_header(len(data)) + data
+
+
+def noise(seconds: float) -> np.ndarray:
+    return rng.normal(0, 0.002, int(seconds * RATE))
+
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return 0.3 * np.sin(2 * np.pi * 220 * t)
+
+
+def test_trims_leading_and_trailing_silence():
+    result = vad.trim(to_wav(np.concatenate([noise(2), tone(1.5), noise(3)])))
+
+    assert result.duration == pytest.approx(6.5)
+    pad = vad.PADDING_MS / 1000
+    assert result.speech_start == pytest.approx(2 - pad, abs=0.05)
+    assert result.speech_end == pytest.approx(3.5 + pad, abs=0.05)
+    info = parse_wav_header(result.wav_bytes)
+    assert info.data_size / 2 / RATE == pytest.approx(1.5 + 2 * pad, abs=0.05)
+
+
+def test_rejects_silence_and_isolated_clicks():
+    with pytest.raises(vad.NoSpeechError):
+        vad.trim(to_wav(noise(5)))
+
+    click = noise(3)
+    click[RATE:RATE + 50] = 0.9
+    with pytest.raises(vad.NoSpeechError):
+        vad.trim(to_wav(click))
+
+
+def test_speech_from_end_to_end_is_left_alone():
+    wav = to_wav(tone(1.5))
+    assert vad.trim(wav).wav_bytes is wav
@@ -0,0 +1,126 @@
+import json
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+
+import warm_keeper
+from warm_keeper import COLD, UNKNOWN, WARM, WarmKeeper, in_active_hours
+
+
+def _keeper(name: str) -> WarmKeeper:
+    return WarmKeeper(f"test_keeper_{name}", "http://atlas.test/", client_name="atlas")
+
+
+def _status_error(code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://atlas.test/")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+
+def test_unknown_after_a_restart_tries_the_real_call():
+    keeper = _keeper("unknown")
+    assert keeper.state == UNKNOWN
+    assert not keeper.is_cold()
+    assert not keeper.should_fallback()
+    assert keeper.fallbacks.value == 0
+
+
+def test_replies_mark_warm_until_idle_past_scaledown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(warm_keeper.time, "monotonic", lambda: now[0])
+    keeper = _keeper("idle")
+
+    keeper.observe(0.4, ok=True)
+    assert keeper.state == WARM and not keeper.is_cold()
+
+    now[0] += warm_keeper.SCALEDOWN_SECONDS + 1
+    assert keeper.is_cold()
+    assert keeper.state == COLD
+    assert keeper.transitions.value == 2
+
+
+def test_slow_reply_counts_a_cold_start_and_is_warm_after():
+    keeper = _keeper("slow")
+    keeper.observe(warm_keeper.COLD_START_SECONDS + 5, ok=True)
+    assert keeper.cold_starts.value == 1
+    assert keeper.state == WARM
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectTimeout("connect timed out"),
+    httpx.ReadTimeout("read timed out"),
+    httpx.ConnectError("connection refused"),
+    TimeoutError(),
+])
+def test_timeouts_and_connect_errors_mark_cold(error):
+    keeper = _keeper(f"down_{type(error).__name__}")
+    keeper.observe(0.2, ok=True)
+    keeper.observe_error(error)
+    assert keeper.state == COLD and keeper.is_cold()
+
+
+@pytest.mark.parametrize("code", [400, 422, 500, 503])
+def test_http_error_status_leaves_the_state_alone(code):
+    keeper = _keeper(f"status_{code}")
+    keeper.observe_error(_status_error(code))
+    assert keeper.state == UNKNOWN and not keeper.is_cold()
+
+    keeper.observe(0.2, ok=True)
+    keeper.observe_error(_status_error(code))
+    assert keeper.state == WARM
+
+
+def test_cold_falls_back_and_wakes_the_endpoint_once(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, json={"ok": True})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(warm_keeper.http_clients, "get", lambda name: client)
+
+    async def scenario():
+        keeper = _keeper("wake")
+        keeper.observe_error(httpx.ConnectError("down"))
+
+        assert keeper.should_fallback()
+        assert keeper.should_fallback()
+        assert keeper.fallbacks.value == 2
+        await keeper._wake_task
+        # One wake-up ping in flight at a time, and its reply marks the endpoint warm
+        assert calls == [{"ping": True}]
+        assert keeper.state == WARM and not keeper.should_fallback()
+        await keeper.stop()
+
+    asyncio.run(scenario())
+
+
+def test_ping_error_status_doesnt_mark_cold(monkeypatch):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    monkeypatch.setattr(warm_keeper.http_clients, "get", lambda name: client)
+
+    async def scenario():
+        keeper = _keeper("ping_404")
+        assert not await keeper.ping()
+        assert keeper.state == UNKNOWN
+        assert keeper.pings.value == 1
+
+    asyncio.run(scenario())
+
+
+def test_fallback_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(warm_keeper, "COLD_FALLBACK", False)
+    keeper = _keeper("no_fallback")
+    keeper.observe(0.0, ok=False)
+    assert keeper.is_cold() and not keeper.should_fallback()
+
+
+@pytest.mark.parametrize("spec, hour, active", [
+    ("6-23", 5, False), ("6-23", 6, True), ("6-23", 23, False),
+    ("18-2", 23, True), ("18-2", 1, True), ("18-2", 2, False), ("18-2", 12, False),
+    ("", 3, True), ("off", 12, False),
+])
+def test_active_hours(spec, hour, active):
+    assert in_active_hours(spec, datetime(2026, 1, 1, hour)) is active
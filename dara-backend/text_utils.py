@@ -0,0 +1,38 @@
+import re
+import unicodedata
+
+# Whisper reports full language names ("yoruba"), Deepgram and N-ATLaS use codes
+LANGUAGE_NAMES = {
+    "english": "en",
+    "yoruba": "yo",
+    "hausa": "ha",
+    "igbo": "ig",
+}
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_language(language: str) -> str:
+    """Map 'Yoruba' / 'yo' / 'YO' to the two letter code used everywhere else."""
+    lang = (language or "").strip().lower()
+    return LANGUAGE_NAMES.get(lang, lang)
+
+
+def normalize_text(text: str, fold_diacritics: bool = True) -> str:
+    """
+    Canonical form of a transcript for matching and cache keys.
+
+    Lowercases, replaces punctuation with spaces and collapses whitespace.
+    With `fold_diacritics` the Yoruba/Igbo tone marks and dots under letters
+    are dropped too ('Ẹ jọ̀wọ́ tan iná' -> 'e jowo tan ina'), since STT output
+    is inconsistent about them. Hausa hooked letters (ɓ, ɗ, ƙ) are separate
+    code points and are kept.
+    """
+    if fold_diacritics:
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    else:
+        text = unicodedata.normalize("NFC", text)
+
+    text = _NON_WORD.sub(" ", text.casefold()).replace("_", " ")
+    return " ".join(text.split())
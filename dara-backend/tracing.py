@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# Lightweight OpenTelemetry-style tracing with no SDK dependency. Spans are
+# exported as OTLP/JSON, either appended to a file (one export request per
+# line, like the collector's file exporter) or POSTed to a collector.
+#
+# TRACE_EXPORTER       "file" or "otlp"; unset = tracing off
+# TRACE_FILE           output for the file exporter
+# OTLP_ENDPOINT        OTLP/HTTP traces endpoint for the otlp exporter
+# TRACE_SERVICE_NAME   service.name resource attribute
+EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "dara-backend")
+
+BATCH_SIZE = 256
+FLUSH_SECONDS = 1.0
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+# Set by collect(): finished spans are also appended here, to hand them back
+# to the caller (the Modal side returns its spans in the response body)
+_sink: ContextVar[Optional[list]] = ContextVar("trace_sink", default=None)
+
+
+# --------------------------------------------------
+# SPANS
+# --------------------------------------------------
+class Span:
+    """One timed operation. Times are wall-clock nanoseconds, as OTLP wants."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error", "_sink")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict, start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._sink = _sink.get()
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value with this span as the parent."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        data = self.to_otlp()
+        if self._sink is not None:
+            self._sink.append(data)
+        if _exporter is not None:
+            _exporter.submit(SERVICE_NAME, data)
+
+    def to_otlp(self) -> dict:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace_id, parent_span_id) from a W3C traceparent, or None if it's malformed."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+def enabled() -> bool:
+    """Whether spans started here go anywhere (an exporter, or a collect() sink)."""
+    return _exporter is not None or _sink.get() is not None
+
+
+def start_span(name: str, parent=None, start_ns: Optional[int] = None, **attributes) -> Optional[Span]:
+    """
+    A started span that isn't made current; end it with span.end().
+    `parent` is a Span, a traceparent string, or None for the current span.
+    Returns None while tracing is off.
+    """
+    if not enabled():
+        return None
+    if parent is None:
+        parent = _current.get()
+    if isinstance(parent, str):
+        parent = parse_traceparent(parent)
+        trace_id, parent_id = parent if parent else (os.urandom(16).hex(), None)
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+    return Span(name, trace_id, parent_id, attributes, start_ns)
+
+
+@contextmanager
+def span(name: str, parent=None, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Times the block as a child of the current span (or of `parent`) and makes
+    it current inside. Yields None while tracing is off, so callers check
+    before setting attributes.
+    """
+    current = start_span(name, parent, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+def record_span(name: str, start_ns: int, end_ns: int, parent=None, **attributes) -> Optional[Span]:
+    """A span for something already measured (e.g. a GPU batch), ended immediately."""
+    recorded = start_span(name, parent, start_ns=start_ns, **attributes)
+    if recorded is not None:
+        recorded.end(end_ns)
+    return recorded
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def traceparent() -> Optional[str]:
+    """Header value to propagate the current span downstream, or None."""
+    active = _current.get()
+    return active.traceparent if active is not None else None
+
+
+@contextmanager
+def collect() -> Iterator[List[dict]]:
+    """Gathers the OTLP/JSON of every span ended inside the block."""
+    spans: List[dict] = []
+    token = _sink.set(spans)
+    try:
+        yield spans
+    finally:
+        _sink.reset(token)
+
+
+def ingest(spans: Optional[List[dict]], service: str) -> None:
+    """Exports spans recorded by another service (N-ATLaS on Modal) with ours."""
+    if _exporter is None or not spans:
+        return
+    for data in spans:
+        _exporter.submit(service, data)
+
+
+# --------------------------------------------------
+# EXPORT
+# --------------------------------------------------
+def export_request(batch: List[Tuple[str, dict]]) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest, one resource per service."""
+    by_service: Dict[str, List[dict]] = {}
+    for service, data in batch:
+        by_service.setdefault(service, []).append(data)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_attribute("service.name", service)]},
+                "scopeSpans": [{"scope": {"name": "dara.tracing"}, "spans": spans}],
+            }
+            for service, spans in by_service.items()
+        ]
+    }
+
+
+class Exporter:
+    """
+    Hands finished spans to a daemon thread that writes them in batches, so
+    ending a span never waits on disk or the network.
+    """
+
+    def __init__(self, kind: str, path: str = TRACE_FILE, endpoint: str = OTLP_ENDPOINT):
+        if kind not in ("file", "otlp"):
+            raise ValueError(f"Unknown TRACE_EXPORTER: {kind}")
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._loop, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, service: str, data: dict) -> None:
+        self._queue.put((service, data))
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Blocks until everything submitted so far has been written."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _loop(self) -> None:
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch: List[Tuple[str, dict]]) -> None:
+        body = export_request(batch)
+        try:
+            if self.kind == "file":
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(body, ensure_ascii=False) + "\n")
+            else:
+                import httpx
+                httpx.post(self.endpoint, json=body, timeout=5.0).raise_for_status()
+        except Exception as e:
+            logger.warning(f"Dropped {len(batch)} spans, {self.kind} export failed ({type(e).__name__}): {e}")
+
+
+_exporter: Optional[Exporter] = Exporter(EXPORTER) if EXPORTER else None
+
+
+def configure(kind: Optional[str], **kwargs) -> None:
+    """Switches exporter at runtime (tests, scripts). None turns tracing off."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.flush()
+    _exporter = Exporter(kind, **kwargs) if kind else None
+
+
+def flush() -> None:
+    if _exporter is not None:
+        _exporter.flush()
@@ -1,10 +1,16 @@
 import os
 import asyncio
 import logging
-from typing import Optional
+import threading
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
 from spitch import Spitch
 
+import executors
+import http_clients
+import tracing
+from tts_cache import tts_cache, cache_key
+
 # --------------------------------------------------
 # ENV SETUP
 # --------------------------------------------------
@@ -45,6 +51,18 @@ VOICE_MAP = {
     "ig": {"voice": "ngozi", "language": "ig"},
 }
 
+AUDIO_FORMAT = "mp3"
+STREAM_CHUNK_BYTES = 8192
+
+
+class TTSError(Exception):
+    """Speech synthesis failed or produced no audio."""
+
+
+def _voice_config(language: str) -> dict:
+    # Default to English/lucy if language not supported
+    return VOICE_MAP.get(language, VOICE_MAP["en"])
+
 # --------------------------------------------------
 # SPITCH TTS (SYNC – RUNS IN THREAD)
 # --------------------------------------------------
@@ -54,8 +72,7 @@ def _generate_spitch_tts_sync(text: str, language: str) -> Optional[bytes]:
             logger.error("Spitch client is not initialized")
             return None
 
-        # Default to English/lucy if language not supported
-        config = VOICE_MAP.get(language, VOICE_MAP["en"])
+        config = _voice_config(language)
         
         logger.info(f"generating audio for language {language} with voice {config['voice']}")
 
@@ -63,7 +80,7 @@ def _generate_spitch_tts_sync(text: str, language: str) -> Optional[bytes]:
             text=text,
             language=config["language"],
             voice=config["voice"],
-            format="mp3"
+            format=AUDIO_FORMAT
         )
         
         # BinaryAPIResponse handling
@@ -77,15 +94,50 @@ def _generate_spitch_tts_sync(text: str, language: str) -> Optional[bytes]:
 
     except Exception as e:
         logger.error(f"Spitch TTS error: {e}")
+        http_clients.count_error("spitch", e)
         return None
 
 
+def _stream_spitch_tts_sync(text: str, language: str, on_chunk, stop: threading.Event) -> None:
+    """
+    Streams the Spitch response body, handing each chunk to `on_chunk` as it
+    arrives. Setting `stop` closes the response early. Errors are raised.
+    """
+    if not spitch_client:
+        raise TTSError("Spitch client is not initialized")
+
+    try:
+        config = _voice_config(language)
+        logger.info(f"streaming audio for language {language} with voice {config['voice']}")
+
+        with spitch_client.speech.with_streaming_response.generate(
+            text=text,
+            language=config["language"],
+            voice=config["voice"],
+            format=AUDIO_FORMAT
+        ) as response:
+            for chunk in response.iter_bytes(STREAM_CHUNK_BYTES):
+                if stop.is_set():
+                    logger.info("Spitch TTS stream abandoned by its reader")
+                    return
+                if chunk:
+                    on_chunk(chunk)
+
+    except Exception as e:
+        logger.error(f"Spitch TTS stream error: {e}")
+        http_clients.count_error("spitch", e)
+        raise
+
+
 # --------------------------------------------------
 # PUBLIC API
 # --------------------------------------------------
 async def generate_audio(text: str, language: str = "en") -> bytes:
     """
     Generate speech audio using Spitch API.
+
+    Clips are cached by (text, language, voice, format); a cache hit is
+    returned directly without touching the worker thread or the network.
     
     Args:
         text: The text to convert to speech
@@ -98,13 +150,24 @@ async def generate_audio(text: str, language: str = "en") -> bytes:
     if not text.strip():
         return b""
 
+    config = _voice_config(language)
+    key = cache_key(text, config["language"], config["voice"], AUDIO_FORMAT)
+    cached = await tts_cache.get_async(key)
+    if cached is not None:
+        logger.info(f"TTS cache hit ({language}, {len(cached)} bytes)")
+        return cached
+
     if spitch_client:
         logger.info(f"Generating Spitch TTS ({language})")
-        audio = await asyncio.to_thread(
-            _generate_spitch_tts_sync, text, language
-        )
+        with tracing.span("spitch.generate", language=language, chars=len(text)):
+            audio = await executors.tts.run(
+                _generate_spitch_tts_sync, text, language
+            )
         if audio:
             logger.info(f"Spitch TTS success ({len(audio)} bytes)")
+            tts_cache.set_memory(key, audio)
+            if tts_cache.disk is not None:
+                await executors.io.run(tts_cache.set_disk, key, audio)
             return audio
 
         logger.warning("Spitch TTS returned no audio")
@@ -112,6 +175,74 @@ async def generate_audio(text: str, language: str = "en") -> bytes:
     return b""
 
 
+_STREAM_DONE = object()
+
+
+async def stream_audio(text: str, language: str = "en") -> AsyncIterator[bytes]:
+    """
+    Same as generate_audio, but yields MP3 chunks as Spitch produces them.
+    Cached clips are replayed in STREAM_CHUNK_BYTES pieces; a fully
+    streamed clip is added to the cache afterwards.
+
+    A failed synthesis is raised (TTSError, or the SDK's error) rather than
+    ending the stream early: before the first chunk negotiation.primed turns
+    it into a 5xx, after it the caller reports it in-stream. Closing the
+    generator early stops the Spitch request.
+    """
+    if not text.strip():
+        return
+
+    config = _voice_config(language)
+    key = cache_key(text, config["language"], config["voice"], AUDIO_FORMAT)
+    cached = await tts_cache.get_async(key)
+    if cached is not None:
+        logger.info(f"TTS cache hit ({language}, {len(cached)} bytes)")
+        for i in range(0, len(cached), STREAM_CHUNK_BYTES):
+            yield cached[i:i + STREAM_CHUNK_BYTES]
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def on_chunk(chunk: bytes):
+        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+    async def produce() -> None:
+        try:
+            await executors.tts.run(_stream_spitch_tts_sync, text, language, on_chunk, stop)
+        finally:
+            # Queued after every chunk callback, so it always arrives last
+            queue.put_nowait(_STREAM_DONE)
+
+    logger.info(f"Streaming Spitch TTS ({language})")
+    producer = asyncio.create_task(produce())
+    parts = []
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is _STREAM_DONE:
+                break
+            parts.append(chunk)
+            yield chunk
+        # Re-raises the producer's error, if it had one
+        await producer
+    finally:
+        if not producer.done():
+            # The reader went away (client disconnect, cancellation)
+            stop.set()
+            producer.cancel()
+
+    if not parts:
+        raise TTSError("Spitch TTS returned no audio")
+
+    audio = b"".join(parts)
+    logger.info(f"Spitch TTS stream success ({len(audio)} bytes)")
+    tts_cache.set_memory(key, audio)
+    if tts_cache.disk is not None:
+        await executors.io.run(tts_cache.set_disk, key, audio)
+
+
 # --------------------------------------------------
 # LOCAL TEST
 # --------------------------------------------------
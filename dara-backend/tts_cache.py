@@ -0,0 +1,226 @@
+import os
+import time
+import hashlib
+import logging
+import unicodedata
+import threading
+from typing import Optional, Union
+
+import executors
+import metrics
+import shared_store
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# TTS_CACHE_MAX_BYTES       in-memory tier budget (default 32 MB, 0 disables)
+# TTS_CACHE_TTL             seconds before a cached clip is re-synthesized (default 7 days, 0 = never)
+# TTS_CACHE_DIR             directory for the on-disk tier (unset = memory only)
+# TTS_CACHE_DISK_MAX_BYTES  on-disk tier budget (default 256 MB)
+# With SHARED_CACHE_PATH set (multi-worker mode), the second tier is the
+# SQLite store shared by every worker instead of TTS_CACHE_DIR.
+MEMORY_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+TTL_SECONDS = float(os.getenv("TTS_CACHE_TTL", 7 * 24 * 3600))
+DISK_DIR = os.getenv("TTS_CACHE_DIR", "")
+DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form of a TTS prompt: NFC unicode (so a pre-composed 'ọ' and
+    'o' + combining dot hash the same) with runs of whitespace collapsed.
+    Case and punctuation are kept since they change the spoken prosody.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, language: str, voice: str, audio_format: str) -> str:
+    """Content address of a synthesized clip."""
+    raw = "\x1f".join((normalize_text(text), language, voice, audio_format))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# --------------------------------------------------
+# DISK TIER
+# --------------------------------------------------
+class DiskCache:
+    """
+    One file per clip, named by its content address. Entries expire by file
+    mtime; when over budget the oldest files are deleted first. Clips are
+    written to a temp file and renamed into place, so a reader never sees a
+    partial one; temp files left by a crash are removed on startup.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float]):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale_temp_files()
+
+        self.hits = metrics.counter("tts_cache_disk_hits_total", "TTS clips served from the disk tier")
+        self.misses = metrics.counter("tts_cache_disk_misses_total", "TTS lookups not on disk")
+        self.evictions = metrics.counter("tts_cache_disk_evictions_total", "TTS clips deleted for size or age")
+
+        self._bytes = sum(size for _, size, _ in self._entries())
+        metrics.gauge("tts_cache_disk_bytes", "bytes held by the TTS disk tier", fn=lambda: self._bytes)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _remove_stale_temp_files(self) -> None:
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".tmp"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".bin"):
+                st = entry.stat()
+                yield entry.path, st.st_size, st.st_mtime
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+            if self.ttl and st.st_mtime + self.ttl <= time.time():
+                self._delete(path, st.st_size)
+                self.misses.inc()
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses.inc()
+            return None
+        except OSError as e:
+            logger.warning(f"TTS disk cache read failed: {e}")
+            self.misses.inc()
+            return None
+
+        if not data:
+            # Truncated outside the cache (disk full, manual edit); synthesize it again
+            self._delete(path, st.st_size)
+            self.misses.inc()
+            return None
+
+        self.hits.inc()
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            with self._lock:
+                try:
+                    self._bytes -= os.stat(path).st_size
+                except FileNotFoundError:
+                    pass
+                os.replace(tmp, path)
+                self._bytes += len(data)
+            self._evict()
+        except OSError as e:
+            logger.warning(f"TTS disk cache write failed: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _delete(self, path: str, size: int) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._bytes -= size
+        self.evictions.inc()
+
+    def _evict(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        now = time.time()
+        for path, size, mtime in sorted(self._entries(), key=lambda e: e[2]):
+            if self._bytes <= self.max_bytes and not (self.ttl and mtime + self.ttl <= now):
+                break
+            self._delete(path, size)
+
+
+# --------------------------------------------------
+# TWO-TIER CACHE
+# --------------------------------------------------
+class TTSCache:
+    """
+    Memory LRU in front of an optional disk tier. Disk hits are promoted
+    into memory; new clips are written to both.
+    """
+
+    def __init__(self, memory: Optional[LRUCache], disk: Optional[Union[DiskCache, "shared_store.SharedStore"]]):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Blocking on a memory miss; use get_async on the event loop."""
+        if self.memory is not None:
+            data = self.memory.get(key)
+            if data is not None:
+                return data
+        return self._get_disk(key)
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        """get() with the disk (or shared store) read on the io executor."""
+        if self.memory is not None:
+            data = self.memory.get(key)
+            if data is not None:
+                return data
+        if self.disk is None:
+            return None
+        return await executors.io.run(self._get_disk, key)
+
+    def _get_disk(self, key: str) -> Optional[bytes]:
+        if self.disk is None:
+            return None
+        data = self.disk.get(key)
+        if data is not None and self.memory is not None:
+            self.memory.set(key, data)
+        return data
+
+    def set_memory(self, key: str, data: bytes) -> None:
+        if self.memory is not None:
+            self.memory.set(key, data)
+
+    def set_disk(self, key: str, data: bytes) -> None:
+        """Blocking file write; call from a worker thread."""
+        if self.disk is not None:
+            self.disk.set(key, data)
+
+
+def _build_default() -> TTSCache:
+    memory = None
+    if MEMORY_MAX_BYTES > 0:
+        memory = LRUCache("tts_cache_memory", max_bytes=MEMORY_MAX_BYTES, ttl=TTL_SECONDS)
+
+    disk = shared_store.open_store("tts", DISK_MAX_BYTES, TTL_SECONDS, name="tts_cache_shared")
+    if disk is not None:
+        logger.info(f"TTS cache shared across workers at {disk.path}")
+    elif DISK_DIR:
+        try:
+            disk = DiskCache(DISK_DIR, DISK_MAX_BYTES, TTL_SECONDS)
+            logger.info(f"TTS disk cache at {DISK_DIR} ({disk._bytes} bytes)")
+        except OSError as e:
+            logger.error(f"TTS disk cache disabled: {e}")
+
+    return TTSCache(memory, disk)
+
+
+tts_cache = _build_default()
@@ -0,0 +1,116 @@
+import os
+import time
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+import metrics
+from audio_utils import parse_wav_header, is_target_pcm, wav_header, TARGET_RATE
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# VAD_ENABLED         set to 0 to send clips to STT untouched
+# VAD_FRAME_MS        analysis frame length
+# VAD_MARGIN_DB       speech must be this far above the clip's noise floor
+# VAD_FLOOR_DBFS      frames quieter than this are never speech
+# VAD_MIN_SPEECH_MS   shortest run of loud frames that counts as speech (ignores clicks)
+# VAD_PADDING_MS      audio kept either side of the detected speech
+ENABLED = os.getenv("VAD_ENABLED", "1") != "0"
+FRAME_MS = int(os.getenv("VAD_FRAME_MS", 30))
+MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", 12))
+FLOOR_DBFS = float(os.getenv("VAD_FLOOR_DBFS", -50))
+MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", 150))
+PADDING_MS = int(os.getenv("VAD_PADDING_MS", 200))
+
+# Loud frames this far below the clip's peak still count, so a clip that is
+# speech from end to end isn't judged against its own quietest syllables
+PEAK_RANGE_DB = 30.0
+
+_clips = metrics.counter("vad_clips_total", "clips checked for speech")
+_rejected = metrics.counter("vad_rejected_total", "clips rejected before STT because they held no speech")
+_seconds_in = metrics.counter("vad_input_seconds_total", "seconds of audio checked")
+_seconds_saved = metrics.counter("vad_seconds_saved_total", "seconds of silence not sent to STT (trimmed or rejected)")
+_vad_seconds = metrics.summary("vad_seconds", "VAD processing time")
+
+
+class NoSpeechError(Exception):
+    """Raised when a clip holds no detectable speech."""
+
+
+VadResult = namedtuple("VadResult", "wav_bytes duration speech_start speech_end")
+
+
+# --------------------------------------------------
+# DETECTION
+# --------------------------------------------------
+def frame_levels(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """RMS level in dBFS of each whole `frame_len` frame of int16 samples."""
+    n_frames = len(samples) // frame_len
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32)
+    power = np.einsum("ij,ij->i", frames, frames) / (frame_len * 32768.0 ** 2)
+    return 10 * np.log10(power + 1e-12)
+
+
+def speech_bounds(samples: np.ndarray, sample_rate: int = TARGET_RATE):
+    """
+    (start, end) sample indices of the speech in int16 `samples`, padded by
+    PADDING_MS, or None if there isn't any.
+    """
+    frame_len = sample_rate * FRAME_MS // 1000
+    levels = frame_levels(samples, frame_len)
+    min_frames = max(1, MIN_SPEECH_MS // FRAME_MS)
+    if len(levels) < min_frames:
+        return None
+
+    noise_floor = np.percentile(levels, 10)
+    threshold = max(FLOOR_DBFS, min(noise_floor + MARGIN_DB, levels.max() - PEAK_RANGE_DB))
+    loud = (levels > threshold).astype(np.int32)
+
+    # A run of min_frames loud frames starts wherever the window sum is full
+    runs = np.flatnonzero(np.convolve(loud, np.ones(min_frames, dtype=np.int32), mode="valid") == min_frames)
+    if len(runs) == 0:
+        return None
+
+    pad = sample_rate * PADDING_MS // 1000
+    start = max(0, runs[0] * frame_len - pad)
+    end = min(len(samples), (runs[-1] + min_frames) * frame_len + pad)
+    return int(start), int(end)
+
+
+def trim(wav_bytes: bytes) -> VadResult:
+    """
+    Cuts leading and trailing silence from a 16 kHz mono 16-bit WAV
+    (what convert_to_wav returns). Raises NoSpeechError if nothing in the
+    clip sounds like speech. Other WAV layouts are passed through.
+    """
+    info = parse_wav_header(wav_bytes)
+    if not ENABLED or not is_target_pcm(info):
+        return VadResult(wav_bytes, 0.0, 0.0, 0.0)
+
+    started = time.perf_counter()
+    samples = np.frombuffer(wav_bytes, dtype="<i2", count=info.data_size // 2, offset=info.data_offset)
+    duration = len(samples) / info.sample_rate
+    bounds = speech_bounds(samples, info.sample_rate)
+    _vad_seconds.observe(time.perf_counter() - started)
+    _clips.inc()
+    _seconds_in.inc(duration)
+
+    if bounds is None:
+        _rejected.inc()
+        _seconds_saved.inc(duration)
+        raise NoSpeechError(f"No speech detected in {duration:.1f}s of audio")
+
+    start, end = bounds
+    kept = (end - start) / info.sample_rate
+    _seconds_saved.inc(duration - kept)
+    logger.info(f"VAD: kept {kept:.2f}s of {duration:.2f}s ({(time.perf_counter() - started) * 1000:.1f}ms)")
+
+    if start == 0 and end == len(samples):
+        return VadResult(wav_bytes, duration, 0.0, duration)
+
+    payload = wav_bytes[info.data_offset + start * 2:info.data_offset + end * 2]
+    return VadResult(wav_header(len(payload)) + payload, duration, start / info.sample_rate, end / info.sample_rate)
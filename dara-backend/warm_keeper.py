@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+import httpx
+
+import metrics
+import http_clients
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+# ATLAS_SCALEDOWN_SECONDS   idle time after which Modal has scaled the container down
+#                           (keep in sync with scaledown_window in modal_atlas.py)
+# ATLAS_COLD_START_SECONDS  a reply slower than this is counted as a cold start
+# ATLAS_PING_INTERVAL       seconds between keep-alive pings (must be < scaledown)
+# ATLAS_ACTIVE_HOURS        local hours to keep warm, "6-23"; wraps past midnight ("18-2");
+#                           empty keeps warm all day, "off" disables pings
+# ATLAS_COLD_FALLBACK       1 = answer immediately with a canned reply while cold
+SCALEDOWN_SECONDS = float(os.getenv("ATLAS_SCALEDOWN_SECONDS", 300))
+COLD_START_SECONDS = float(os.getenv("ATLAS_COLD_START_SECONDS", 20))
+PING_INTERVAL = float(os.getenv("ATLAS_PING_INTERVAL", 240))
+ACTIVE_HOURS = os.getenv("ATLAS_ACTIVE_HOURS", "6-23")
+COLD_FALLBACK = os.getenv("ATLAS_COLD_FALLBACK", "1") != "0"
+
+UNKNOWN = "unknown"
+WARM = "warm"
+COLD = "cold"
+
+# Failures that mean the endpoint isn't up. An HTTP error status came from a
+# running container, so it says nothing about warmth.
+UNREACHABLE = (httpx.TimeoutException, httpx.ConnectError, TimeoutError)
+
+
+def in_active_hours(spec: str, now: Optional[datetime] = None) -> bool:
+    """True if the local hour falls inside `spec` ("6-23", "18-2", "" or "off")."""
+    spec = spec.strip().lower()
+    if spec == "off":
+        return False
+    if not spec:
+        return True
+
+    start, end = (int(part) for part in spec.split("-", 1))
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class WarmKeeper:
+    """
+    Tracks whether a scale-to-zero endpoint is warm, based on the latency
+    and outcome of every call made to it, and keeps it warm with cheap
+    pings during active hours.
+    """
+
+    def __init__(self, name: str, endpoint: str, client_name: str):
+        self.name = name
+        self.endpoint = endpoint
+        self.client_name = client_name
+        self.state = UNKNOWN
+        self.last_ok = 0.0        # monotonic time of last successful reply
+        self.last_activity = 0.0  # monotonic time of last call of any kind
+        self._wake_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+        self.transitions = metrics.counter(f"{name}_state_changes_total", f"{name} warm/cold transitions")
+        self.cold_starts = metrics.counter(f"{name}_cold_starts_total", f"{name} replies slower than the cold-start threshold")
+        self.fallbacks = metrics.counter(f"{name}_cold_fallbacks_total", f"requests answered locally because {name} was cold")
+        self.pings = metrics.counter(f"{name}_pings_total", f"keep-alive pings sent to {name}")
+        self.latency = metrics.summary(f"{name}_latency_seconds", f"{name} round-trip latency")
+        metrics.gauge(f"{name}_warm", f"1 if {name} is believed warm", fn=lambda: int(self.state == WARM))
+
+    # ---------------- state ----------------
+    def _set_state(self, state: str, reason: str) -> None:
+        if state == self.state:
+            return
+        logger.info(f"{self.name}: {self.state} -> {state} ({reason})")
+        self.state = state
+        self.transitions.inc()
+
+    def observe(self, latency: float, ok: bool) -> None:
+        """Record one call: a reply after `latency` seconds, or (ok=False) no reply at all."""
+        now = time.monotonic()
+        self.last_activity = now
+        if not ok:
+            self._set_state(COLD, "call failed or timed out")
+            return
+
+        self.latency.observe(latency)
+        self.last_ok = now
+        if latency >= COLD_START_SECONDS:
+            self.cold_starts.inc()
+            logger.info(f"{self.name}: cold start observed ({latency:.1f}s)")
+        self._set_state(WARM, f"replied in {latency:.2f}s")
+
+    def observe_error(self, error: BaseException) -> None:
+        """Record a failed call. Only timeouts and connection failures mark the endpoint cold."""
+        if isinstance(error, UNREACHABLE):
+            self.observe(0.0, ok=False)
+        else:
+            self.last_activity = time.monotonic()
+
+    def is_cold(self) -> bool:
+        """
+        Whether a call now would likely hit a cold start. UNKNOWN (after a
+        restart, before any call) isn't cold: the real call finds out.
+        """
+        if self.state == WARM and time.monotonic() - self.last_ok > SCALEDOWN_SECONDS:
+            self._set_state(COLD, "idle past scaledown window")
+        return self.state == COLD
+
+    def should_fallback(self) -> bool:
+        """
+        True if the caller should answer locally instead of waiting on a cold
+        start. Starts waking the endpoint as a side effect.
+        """
+        if not COLD_FALLBACK or not self.is_cold():
+            return False
+        self.fallbacks.inc()
+        self.wake()
+        return True
+
+    # ---------------- pings ----------------
+    async def ping(self) -> bool:
+        self.pings.inc()
+        started = time.monotonic()
+        try:
+            response = await http_clients.get(self.client_name).post(self.endpoint, json={"ping": True})
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"{self.name} ping failed ({type(e).__name__}): {e}")
+            self.observe_error(e)
+            return False
+        self.observe(time.monotonic() - started, ok=True)
+        return True
+
+    def wake(self) -> None:
+        """Fire a ping in the background unless one is already in flight."""
+        if self._wake_task is None or self._wake_task.done():
+            self._wake_task = asyncio.create_task(self.ping())
+
+    async def _keep_warm(self) -> None:
+        while True:
+            # A little jitter so several backends don't ping in lockstep
+            await asyncio.sleep(PING_INTERVAL * random.uniform(0.9, 1.0))
+            idle = time.monotonic() - self.last_activity
+            if idle >= PING_INTERVAL * 0.9 and in_active_hours(ACTIVE_HOURS):
+                await self.ping()
+
+    def start(self) -> None:
+        """Start the keep-alive loop and, inside active hours, warm up right away."""
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._keep_warm())
+            if in_active_hours(ACTIVE_HOURS):
+                self.wake()
+
+    async def stop(self) -> None:
+        for task in (self._loop_task, self._wake_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._loop_task = None
+        self._wake_task = None